@@ -0,0 +1,551 @@
+import re
+import json
+import time
+import zlib
+import random
+import hashlib
+import logging
+import threading
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# A local stand-in for the parts of poe.com the exporters touch. Pages use the
+# same class names the scripts select on, chat history is paged in through
+# /api/gql_POST like the real site, and images are served with ETags from a
+# fake CDN that can be made slow, flaky or rate limited.
+
+WORDS = (
+    "alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november oscar papa "
+    "quebec romeo sierra tango uniform victor whiskey xray yankee zulu export scroll message history"
+).split()
+LAST_MODIFIED = formatdate(0, usegmt=True)
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+CHAT_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<title>Fake Poe - {chat_code}</title>
+<style>
+body {{ margin: 0; font-family: sans-serif; }}
+.ChatMessagesScrollWrapper_scrollableContainerWrapper__Fk1 {{ height: calc(100vh - 40px); overflow-y: auto; }}
+.InfiniteScroll_pagingTrigger__Fk1 {{ height: 20px; }}
+.ChatMessagesView_messagePair__ZEXUz {{ min-height: 60px; padding: 8px; border-bottom: 1px solid #ddd; }}
+.Markdown_markdownContainer__Fk1 img {{ width: 64px; height: 64px; }}
+</style>
+</head>
+<body>
+<div class="BotHeader_textContainer__Fk1"><p>{bot_name}</p></div>
+<div class="ChatMessagesScrollWrapper_scrollableContainerWrapper__Fk1" id="scroller">
+<div class="InfiniteScroll_pagingTrigger__Fk1" id="trigger"></div>
+<div class="ChatMessagesView_infiniteScroll__Fk1" id="messages"></div>
+</div>
+<textarea class="GrowingTextArea_textArea__Fk1"></textarea>
+<script id="__NEXT_DATA__" type="application/json">{next_data}</script>
+<script>
+const chatCode = {chat_code_json};
+const scroller = document.getElementById('scroller');
+const list = document.getElementById('messages');
+let connection = JSON.parse(document.getElementById('__NEXT_DATA__').textContent).props.pageProps.data.chatOfCode.messagesConnection;
+let loading = false;
+
+function escapeHtml(text) {{
+    return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}}
+
+function pairElement(human, bot) {{
+    const pair = document.createElement('div');
+    pair.className = 'ChatMessagesView_messagePair__ZEXUz';
+    pair.id = 'message-pair-' + (human || bot).messageId;
+    let html = '';
+    if (human) {{
+        html += '<div class="ChatMessage_rightSideMessageWrapper__r0roB"><div class="Message_rightSideMessageBubble__ioa_i">'
+            + '<div><p>' + escapeHtml(human.text) + '</p></div></div></div>';
+    }}
+    if (bot) {{
+        const images = (bot.attachments || []).map(a => '<img src="' + a.url + '">').join('');
+        html += '<div class="ChatMessage_leftSideMessageWrapper__Fk1"><div class="Message_leftSideMessageBubble__VPdk6">'
+            + '<div class="Markdown_markdownContainer__Fk1"><p>' + escapeHtml(bot.text) + '</p>' + images + '</div></div></div>';
+    }}
+    pair.innerHTML = html;
+    return pair;
+}}
+
+function renderPairs(edges) {{
+    const fragment = document.createDocumentFragment();
+    for (let i = 0; i < edges.length; i += 2) {{
+        fragment.appendChild(pairElement(edges[i].node, edges[i + 1] && edges[i + 1].node));
+    }}
+    return fragment;
+}}
+
+function triggerVisible(trigger) {{
+    return trigger.getBoundingClientRect().bottom > scroller.getBoundingClientRect().top;
+}}
+
+async function loadOlder() {{
+    if (loading || !connection.pageInfo.hasPreviousPage) return;
+    loading = true;
+    try {{
+        const response = await fetch('/api/gql_POST', {{
+            method: 'POST',
+            headers: {{'Content-Type': 'application/json'}},
+            body: JSON.stringify({{queryName: 'ChatListPaginationQuery', variables: {{chatCode: chatCode, before: connection.pageInfo.startCursor}}}}),
+        }});
+        connection = (await response.json()).data.chatOfCode.messagesConnection;
+        // Keep the visible messages in place, as the real page does
+        const height = scroller.scrollHeight;
+        list.prepend(renderPairs(connection.edges));
+        scroller.scrollTop += scroller.scrollHeight - height;
+    }} finally {{
+        loading = false;
+    }}
+    updateTrigger();
+}}
+
+function updateTrigger() {{
+    const trigger = document.getElementById('trigger');
+    if (!trigger) return;
+    if (!connection.pageInfo.hasPreviousPage) {{
+        trigger.remove();
+    }} else if (triggerVisible(trigger)) {{
+        // Too little content to scroll yet; keep paging
+        loadOlder();
+    }}
+}}
+
+list.appendChild(renderPairs(connection.edges));
+scroller.scrollTop = scroller.scrollHeight;
+new IntersectionObserver(entries => {{
+    if (entries.some(entry => entry.isIntersecting)) loadOlder();
+}}, {{root: scroller}}).observe(document.getElementById('trigger'));
+updateTrigger();
+</script>
+</body>
+</html>
+"""
+
+CREATORS_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Fake Poe - Creators</title></head>
+<body>
+<table class="CreatorHubBotMetricsTable_table__8JeRY">
+<thead><tr><th>Bot</th><th>Earnings</th><th>Messages</th><th>Unique users</th><th>Followers</th><th>Upvote ratio</th></tr></thead>
+<tbody id="rows">{rows}</tbody>
+</table>
+<div class="CreatorHubBotMetricsTable_pagingSection__gyBfy">
+<button id="previous" disabled>Previous</button>
+<span id="page-label">Page 1 of {pages}</span>
+<button id="next"{next_disabled}>Next</button>
+</div>
+<script>
+const pages = {pages};
+let page = 1;
+const previousButton = document.getElementById('previous'), nextButton = document.getElementById('next');
+async function showPage(number) {{
+    const response = await fetch('/api/creators?page=' + number);
+    const rows = await response.text();
+    page = number;
+    document.getElementById('rows').innerHTML = rows;
+    document.getElementById('page-label').textContent = 'Page ' + page + ' of ' + pages;
+    previousButton.disabled = page <= 1;
+    nextButton.disabled = page >= pages;
+}}
+previousButton.addEventListener('click', () => {{ if (page > 1) showPage(page - 1); }});
+nextButton.addEventListener('click', () => {{ if (page < pages) showPage(page + 1); }});
+</script>
+</body>
+</html>
+"""
+
+CHATS_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<title>Fake Poe - Chats</title>
+<style>
+body {{ margin: 0; font-family: sans-serif; }}
+.ChatHistoryListWrapper_wrapper__Fk1 {{ height: 100vh; overflow-y: auto; }}
+.ChatHistoryListItem_wrapper__Fk1 {{ display: block; height: 72px; padding: 8px; border-bottom: 1px solid #ddd; }}
+.InfiniteScroll_pagingTrigger__Fk1 {{ height: 20px; }}
+</style>
+</head>
+<body>
+<div class="ChatHistoryListWrapper_wrapper__Fk1" id="scroller">
+<div id="chats"></div>
+<div class="InfiniteScroll_pagingTrigger__Fk1" id="trigger"></div>
+</div>
+<script id="__NEXT_DATA__" type="application/json">{next_data}</script>
+<script>
+const scroller = document.getElementById('scroller');
+const list = document.getElementById('chats');
+let connection = JSON.parse(document.getElementById('__NEXT_DATA__').textContent).props.pageProps.data.chats;
+let loading = false;
+
+function escapeHtml(text) {{
+    return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}}
+
+function renderChats(edges) {{
+    for (const edge of edges) {{
+        const chat = edge.node;
+        const item = document.createElement('a');
+        item.className = 'ChatHistoryListItem_wrapper__Fk1';
+        item.href = '/chat/' + chat.chatCode;
+        item.innerHTML = '<div class="ChatHistoryListItem_title__Fk1">' + escapeHtml(chat.title) + '</div>'
+            + '<div class="ChatHistoryListItem_time__Fk1">' + new Date(chat.lastInteractionTime / 1000).toISOString() + '</div>'
+            + '<div class="ChatHistoryListItem_messagePreview__Fk1">' + escapeHtml(chat.messagePreview) + '</div>';
+        list.appendChild(item);
+    }}
+}}
+
+async function loadMore() {{
+    if (loading || !connection.pageInfo.hasNextPage) return;
+    loading = true;
+    try {{
+        const response = await fetch('/api/gql_POST', {{
+            method: 'POST',
+            headers: {{'Content-Type': 'application/json'}},
+            body: JSON.stringify({{queryName: 'ChatHistoryListPaginationQuery', variables: {{after: connection.pageInfo.endCursor}}}}),
+        }});
+        connection = (await response.json()).data.chats;
+        renderChats(connection.edges);
+    }} finally {{
+        loading = false;
+    }}
+    const trigger = document.getElementById('trigger');
+    if (!connection.pageInfo.hasNextPage) {{
+        trigger.remove();
+    }} else if (trigger.getBoundingClientRect().top < scroller.getBoundingClientRect().bottom) {{
+        loadMore();
+    }}
+}}
+
+renderChats(connection.edges);
+if (!connection.pageInfo.hasNextPage) {{
+    document.getElementById('trigger').remove();
+}} else {{
+    new IntersectionObserver(entries => {{
+        if (entries.some(entry => entry.isIntersecting)) loadMore();
+    }}, {{root: scroller}}).observe(document.getElementById('trigger'));
+}}
+</script>
+</body>
+</html>
+"""
+
+HOME_PAGE = """<!DOCTYPE html>
+<html><head><title>Fake Poe</title></head>
+<body><textarea class="GrowingTextArea_textArea__Fk1"></textarea></body></html>
+"""
+
+class FakePoeSite:
+    # Every chat code serves a generated chat of chat_pairs message pairs,
+    # built on demand from the code so long chats cost no server memory.
+    # images are spread evenly over the bot replies, alternately as <img>
+    # attachments and as URLs in the reply text; duplicate_rate of them reuse
+    # the content of an earlier image. The account's chat list at /chats
+    # holds account_chats of them; add_messages() makes one more active.
+    def __init__(self, chat_pairs=500, images=100, page_size=25, page_latency=0.2,
+                 account_chats=20, chat_list_page_size=10,
+                 earnings_pages=5, earnings_page_size=10, earnings_latency=0.2,
+                 image_bytes=32 * 1024, image_latency=0.0, image_error_rate=0.0,
+                 image_max_concurrency=None, duplicate_rate=0.1, bot_name="BenchmarkBot", seed=1234):
+        self.chat_pairs = chat_pairs
+        self.images = images
+        self.page_size = page_size
+        self.page_latency = page_latency
+        self.account_chats = account_chats
+        self.chat_list_page_size = chat_list_page_size
+        self.added_pairs = Counter()
+        self.earnings_pages = earnings_pages
+        self.earnings_page_size = earnings_page_size
+        self.earnings_latency = earnings_latency
+        self.image_bytes = image_bytes
+        self.image_latency = image_latency
+        self.image_error_rate = image_error_rate
+        self.image_max_concurrency = image_max_concurrency
+        self.duplicate_rate = duplicate_rate
+        self.bot_name = bot_name
+        self.seed = seed
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._active_images = 0
+        self._server = None
+        self._thread = None
+        self.base_url = None
+
+    def start(self, host='127.0.0.1', port=0):
+        self._server = ThreadingHTTPServer((host, port), make_handler(self))
+        self._server.daemon_threads = True
+        self.base_url = f"http://{host}:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Fake Poe serving on {self.base_url}")
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def chat_url(self, chat_code='benchmark'):
+        return f"{self.base_url}/chat/{chat_code}"
+
+    def count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats.clear()
+
+    # Chat history
+
+    def image_ids_for_pair(self, index):
+        if not self.images or not self.chat_pairs:
+            return []
+        return list(range(index * self.images // self.chat_pairs, (index + 1) * self.images // self.chat_pairs))
+
+    def image_url(self, image_id):
+        return f"{self.base_url}/img/{image_id}.png"
+
+    def unique_image_count(self):
+        return len({self.image_content_id(i) for i in range(self.images)})
+
+    def image_content_id(self, image_id):
+        rng = random.Random(self.seed * 7919 + image_id)
+        if image_id and rng.random() < self.duplicate_rate:
+            return self.image_content_id(rng.randrange(image_id))
+        return image_id
+
+    def message_nodes(self, chat_code, index):
+        rng = random.Random(zlib.crc32(chat_code.encode('utf-8')) ^ (self.seed * 1000003 + index))
+        human_text = f"Question {index}: " + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        bot_text = f"Answer {index}: " + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 200)))
+        attachments = []
+        for image_id in self.image_ids_for_pair(index):
+            if image_id % 2:
+                attachments.append({'url': self.image_url(image_id)})
+            else:
+                bot_text += f" Image: {self.image_url(image_id)}"
+        created = 1700000000000000 + index * 60000000
+        return [
+            {'messageId': 2 * index + 1, 'creationTime': created, 'author': 'human', 'text': human_text, 'attachments': []},
+            {'messageId': 2 * index + 2, 'creationTime': created + 1000000, 'author': 'benchmarkbot', 'text': bot_text,
+             'attachments': attachments},
+        ]
+
+    def pair_count(self, chat_code):
+        return self.chat_pairs + self.added_pairs[chat_code]
+
+    def add_messages(self, chat_code, pairs=1):
+        # New pairs continue the generated chat and move it to the top of the
+        # chat list
+        with self._stats_lock:
+            self.added_pairs[chat_code] += pairs
+
+    def history_page(self, chat_code, before=None):
+        # The page of pairs ending just before the cursor (a pair index), or
+        # the newest page without one
+        pair_count = self.pair_count(chat_code)
+        end = pair_count if before is None else max(0, min(int(before), pair_count))
+        start = max(0, end - self.page_size)
+        edges = [{'node': node} for index in range(start, end) for node in self.message_nodes(chat_code, index)]
+        return {'data': {'chatOfCode': {'chatCode': chat_code, 'messagesConnection': {
+            'edges': edges,
+            'pageInfo': {'hasPreviousPage': start > 0, 'startCursor': str(start)},
+        }}}}
+
+    def chat_page(self, chat_code):
+        next_data = json.dumps({'props': {'pageProps': self.history_page(chat_code)}})
+        return CHAT_PAGE.format(
+            chat_code=chat_code,
+            chat_code_json=json.dumps(chat_code),
+            bot_name=self.bot_name,
+            next_data=next_data.replace('</', '<\\/'),
+        )
+
+    # Chat list
+
+    def account_chat_codes(self):
+        # Most recently active first, like the real list
+        codes = [f"chat{i:04d}" for i in range(self.account_chats)]
+        return sorted(codes, key=lambda code: (-self.added_pairs[code], code))
+
+    def chat_list_node(self, chat_code):
+        pair_count = self.pair_count(chat_code)
+        last_message = self.message_nodes(chat_code, pair_count - 1)[-1] if pair_count else None
+        return {
+            'chatId': zlib.crc32(chat_code.encode('utf-8')),
+            'chatCode': chat_code,
+            'title': f"{self.bot_name} {chat_code}",
+            'lastInteractionTime': last_message['creationTime'] if last_message else 0,
+            'messagePreview': last_message['text'][:80] if last_message else '',
+        }
+
+    def chat_list_page(self, after=None):
+        codes = self.account_chat_codes()
+        start = max(0, int(after)) if after else 0
+        end = min(len(codes), start + self.chat_list_page_size)
+        return {'data': {'chats': {
+            'edges': [{'node': self.chat_list_node(code)} for code in codes[start:end]],
+            'pageInfo': {'hasNextPage': end < len(codes), 'endCursor': str(end)},
+        }}}
+
+    def chats_page(self):
+        next_data = json.dumps({'props': {'pageProps': self.chat_list_page()}})
+        return CHATS_PAGE.format(next_data=next_data.replace('</', '<\\/'))
+
+    # Creator earnings
+
+    def earnings_rows(self, page):
+        rows = []
+        for i in range((page - 1) * self.earnings_page_size, page * self.earnings_page_size):
+            rng = random.Random(self.seed * 31 + i)
+            rows.append(
+                '<tr>'
+                f'<td><div><p class="CreatorHubBotMetricsTable_botName__XTijb">Bot-{i:05d}</p></div></td>'
+                f'<td><span class="CreatorHubBotMetricsTable_mainEarnings__byXzb">${rng.uniform(0, 5000):,.2f}</span></td>'
+                f'<td><span class="CreatorHubBotMetricsTable_mainEarnings__byXzb">{rng.randint(0, 900000):,}</span></td>'
+                f'<td><span class="CreatorHubBotMetricsTable_mainEarnings__byXzb">{rng.uniform(0, 99):.1f}K</span></td>'
+                f'<td><span class="CreatorHubBotMetricsTable_mainEarnings__byXzb">{rng.randint(0, 20000):,}</span></td>'
+                f'<td><span class="CreatorHubBotMetricsTable_mainEarnings__byXzb">{rng.uniform(50, 100):.0f}%</span></td>'
+                '</tr>'
+            )
+        return ''.join(rows)
+
+    def creators_page(self):
+        return CREATORS_PAGE.format(
+            rows=self.earnings_rows(1),
+            pages=self.earnings_pages,
+            next_disabled='' if self.earnings_pages > 1 else ' disabled',
+        )
+
+    # Image CDN
+
+    def image_body(self, content_id):
+        rng = random.Random(self.seed * 104729 + content_id)
+        size = max(len(PNG_SIGNATURE), self.image_bytes) - len(PNG_SIGNATURE)
+        # Random.randbytes needs Python 3.9
+        return PNG_SIGNATURE + (rng.getrandbits(8 * size).to_bytes(size, 'little') if size else b'')
+
+    def acquire_image_slot(self):
+        with self._stats_lock:
+            if self.image_max_concurrency is not None and self._active_images >= self.image_max_concurrency:
+                return False
+            self._active_images += 1
+            return True
+
+    def release_image_slot(self):
+        with self._stats_lock:
+            self._active_images -= 1
+
+def make_handler(site):
+    class FakePoeHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logging.debug("fake poe: " + format % args)
+
+        def send_body(self, status, body, content_type, headers=None):
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+            site.count('bytes_sent', len(body))
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            path = parsed.path
+            if path in ('/', '/login'):
+                site.count('page_requests')
+                self.send_body(200, HOME_PAGE, 'text/html; charset=utf-8')
+            elif path.startswith('/chat/'):
+                site.count('page_requests')
+                self.send_body(200, site.chat_page(path[len('/chat/'):].strip('/') or 'chat'), 'text/html; charset=utf-8')
+            elif path == '/chats':
+                site.count('page_requests')
+                self.send_body(200, site.chats_page(), 'text/html; charset=utf-8')
+            elif path == '/creators':
+                site.count('page_requests')
+                self.send_body(200, site.creators_page(), 'text/html; charset=utf-8')
+            elif path == '/api/creators':
+                site.count('earnings_page_requests')
+                time.sleep(site.earnings_latency)
+                page = int(parse_qs(parsed.query).get('page', ['1'])[0])
+                self.send_body(200, site.earnings_rows(page), 'text/html; charset=utf-8')
+            elif re.match(r'^/img/\d+\.png$', path):
+                self.serve_image(int(path[len('/img/'):-len('.png')]))
+            else:
+                self.send_body(404, 'Not found', 'text/plain')
+
+        do_HEAD = do_GET
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            if urlparse(self.path).path != '/api/gql_POST':
+                self.send_body(404, 'Not found', 'text/plain')
+                return
+            try:
+                query = json.loads(body or b'{}')
+                variables = query.get('variables') or {}
+            except ValueError:
+                self.send_body(400, 'Bad request', 'text/plain')
+                return
+            time.sleep(site.page_latency)
+            if query.get('queryName') == 'ChatHistoryListPaginationQuery':
+                site.count('chat_list_requests')
+                payload = site.chat_list_page(variables.get('after'))
+            else:
+                site.count('history_requests')
+                payload = site.history_page(variables.get('chatCode') or 'chat', variables.get('before'))
+            self.send_body(200, json.dumps(payload), 'application/json')
+
+        def serve_image(self, image_id):
+            site.count('image_requests')
+            if image_id >= site.images:
+                self.send_body(404, 'Not found', 'text/plain')
+                return
+            if not site.acquire_image_slot():
+                site.count('image_throttled')
+                self.send_body(429, 'Too many requests', 'text/plain', {'Retry-After': '1'})
+                return
+            try:
+                time.sleep(site.image_latency)
+                if site.image_error_rate and random.random() < site.image_error_rate:
+                    site.count('image_errors')
+                    self.send_body(503, 'Service unavailable', 'text/plain', {'Retry-After': '0'})
+                    return
+                body = site.image_body(site.image_content_id(image_id))
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                headers = {'ETag': etag, 'Last-Modified': LAST_MODIFIED, 'Cache-Control': 'max-age=0'}
+                if self.headers.get('If-None-Match') == etag:
+                    site.count('image_not_modified')
+                    self.send_response(304)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_body(200, body, 'image/png', headers)
+            finally:
+                site.release_image_slot()
+
+    return FakePoeHandler
@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+from collections import Counter
+
+# Runs the exporters headlessly against the local fake Poe site and reports
+# wall time, WebDriver round trips, memory and throughput for each one:
+#
+#   python benchmarks/run_benchmarks.py --pairs 2000 --images 300 --json run.json
+#   python benchmarks/run_benchmarks.py --compare run.json
+#
+# No Poe account or network access is needed; only Chrome.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import poe_metrics
+from fake_poe import FakePoeSite
+
+SCENARIOS = ('text', 'images', 'earnings')
+
+def browser_metrics(driver):
+    try:
+        driver.execute_cdp_cmd('Performance.enable', {})
+        metrics = driver.execute_cdp_cmd('Performance.getMetrics', {})['metrics']
+    except Exception as e:
+        logging.debug(f"Could not read browser metrics: {str(e)}")
+        return {}
+    values = {metric['name']: metric['value'] for metric in metrics}
+    return {
+        'browser_js_heap_mb': round(values.get('JSHeapUsedSize', 0) / 2 ** 20, 1),
+        'browser_dom_nodes': int(values.get('Nodes', 0)),
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def run_text(driver, site, work_dir, args):
+    import poe_text_downloader
+    poe_text_downloader.LOW_MEMORY = args.low_memory
+    url = site.chat_url('text-benchmark')
+    poe_text_downloader.export_chat_text(driver, url, work_dir, output_format=args.text_format)
+    checkpoint = poe_text_downloader.load_checkpoint(poe_text_downloader.checkpoint_path(work_dir, url)) or {}
+    return {'items': checkpoint.get('count', 0), 'expected': site.chat_pairs, 'unit': 'pairs'}
+
+def run_images(driver, site, work_dir, args):
+    import poe_image_downloader
+    poe_image_downloader.LOW_MEMORY = args.low_memory
+    poe_image_downloader.export_chat_images(driver, site.chat_url('image-benchmark'), work_dir,
+                                            engine=args.engine, discovery=args.image_discovery)
+    stored = [name for name in os.listdir(work_dir) if not name.startswith('.')]
+    return {'items': len(stored), 'expected': site.unique_image_count(), 'unit': 'images',
+            'bytes': directory_size(work_dir)}
+
+def run_earnings(driver, site, work_dir, args):
+    import creator_earnings
+    headers, data = creator_earnings.extract_creator_earnings(driver)
+    return {'items': len(data), 'expected': site.earnings_pages * site.earnings_page_size, 'unit': 'bots'}
+
+SCENARIO_RUNNERS = {
+    'text': run_text,
+    'images': run_images,
+    'earnings': run_earnings,
+}
+
+def run_scenario(name, site, args):
+    from poe_browser import setup_driver
+    capture_network = (name == 'text' and args.text_extraction == 'network') or \
+                      (name == 'images' and args.image_discovery == 'network')
+    driver = setup_driver(lean=args.lean, headless=True, capture_network=capture_network)
+    work_dir = tempfile.mkdtemp(prefix=f'poe_benchmark_{name}_')
+    try:
+        # Drivers count their WebDriver commands into the current metrics run
+        run = poe_metrics.start_run(name)
+        site.reset_stats()
+        start_time = time.perf_counter()
+        outcome = SCENARIO_RUNNERS[name](driver, site, work_dir, args)
+        wall_time = time.perf_counter() - start_time
+        run.finish()
+        summary = run.summary()
+        webdriver_calls = {label.split('=', 1)[1]: value
+                           for label, value in summary['counter_labels'].get('webdriver_calls', {}).items()}
+        result = {
+            'scenario': name,
+            'wall_seconds': round(wall_time, 3),
+            'items': outcome['items'],
+            'expected_items': outcome['expected'],
+            'unit': outcome['unit'],
+            'items_per_second': round(outcome['items'] / wall_time, 2) if wall_time else None,
+            'webdriver_round_trips': sum(webdriver_calls.values()),
+            'webdriver_commands': dict(Counter(webdriver_calls).most_common(8)),
+            'phases': summary['phases'],
+            'counters': summary['counters'],
+            'gauges': summary['gauges'],
+            'site_requests': dict(site.stats),
+            'python_peak_rss_mb': peak_rss_mb(),
+        }
+        if 'bytes' in outcome:
+            result['bytes'] = outcome['bytes']
+            result['mb_per_second'] = round(outcome['bytes'] / 2 ** 20 / wall_time, 2) if wall_time else None
+        result.update(browser_metrics(driver))
+        if outcome['items'] != outcome['expected']:
+            logging.warning(f"{name}: exported {outcome['items']} {outcome['unit']}, expected {outcome['expected']}")
+        return result
+    finally:
+        driver.quit()
+        if args.keep_output:
+            logging.warning(f"{name} output kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def print_results(results, previous=None):
+    previous_by_name = {r['scenario']: r for r in (previous or {}).get('results', [])}
+    print()
+    print(f"{'scenario':<10} {'wall s':>9} {'items':>13} {'items/s':>9} {'round trips':>12} {'py RSS MB':>10} {'JS heap MB':>11} {'DOM nodes':>10}")
+    for r in results:
+        items = f"{r['items']}/{r['expected_items']}"
+        print(f"{r['scenario']:<10} {r['wall_seconds']:>9.2f} {items:>13} {r['items_per_second'] or 0:>9.1f} "
+              f"{r['webdriver_round_trips']:>12} {r['python_peak_rss_mb']:>10} {r.get('browser_js_heap_mb', '-'):>11} "
+              f"{r.get('browser_dom_nodes', '-'):>10}")
+        before = previous_by_name.get(r['scenario'])
+        if before:
+            print(f"{'':<10} {percent_change(before['wall_seconds'], r['wall_seconds']):>9} {'':>13} "
+                  f"{percent_change(before['items_per_second'], r['items_per_second']):>9} "
+                  f"{percent_change(before['webdriver_round_trips'], r['webdriver_round_trips']):>12}")
+    print()
+
+def percent_change(before, after):
+    if not before or after is None:
+        return '-'
+    return f"{(after - before) / before * 100:+.1f}%"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Poe exporters against a local fake Poe site")
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"Exporters to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--pairs', type=int, default=500, help="Message pairs in the benchmark chat")
+    parser.add_argument('--page-size', type=int, default=25, help="Message pairs per history page")
+    parser.add_argument('--page-latency', type=float, default=0.2, help="Seconds before each history page is served")
+    parser.add_argument('--images', type=int, default=100, help="Images in the benchmark chat")
+    parser.add_argument('--image-bytes', type=int, default=32 * 1024, help="Size of each image")
+    parser.add_argument('--image-latency', type=float, default=0.05, help="Seconds before each image is served")
+    parser.add_argument('--image-error-rate', type=float, default=0.0, help="Fraction of image requests answered with 503")
+    parser.add_argument('--image-max-concurrency', type=int, default=None,
+                        help="Concurrent image requests above which the CDN answers 429")
+    parser.add_argument('--duplicate-rate', type=float, default=0.1, help="Fraction of images that repeat earlier content")
+    parser.add_argument('--earnings-pages', type=int, default=5, help="Pages in the creator earnings table")
+    parser.add_argument('--earnings-page-size', type=int, default=10, help="Bots per earnings page")
+    parser.add_argument('--earnings-latency', type=float, default=0.2, help="Seconds before each earnings page is served")
+    parser.add_argument('--text-extraction', choices=['script', 'elements', 'network'], default=os.getenv('POE_TEXT_EXTRACTION', 'script'))
+    parser.add_argument('--text-format', choices=['text', 'markdown', 'jsonl'], default='text')
+    parser.add_argument('--image-discovery', choices=['dom', 'network'], default=os.getenv('POE_IMAGES_DISCOVERY', 'dom'))
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default=os.getenv('POE_DOWNLOAD_ENGINE', 'threads'))
+    parser.add_argument('--low-memory', action='store_true', help="Empty message pairs once read (POE_LOW_MEMORY)")
+    parser.add_argument('--full-browser', dest='lean', action='store_false', help="Do not block images, fonts and media")
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--compare', help="Show changes against results written earlier with --json")
+    parser.add_argument('--keep-output', action='store_true', help="Keep the exported files")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(levelname)s - %(message)s')
+    site = FakePoeSite(
+        chat_pairs=args.pairs, images=args.images, page_size=args.page_size, page_latency=args.page_latency,
+        earnings_pages=args.earnings_pages, earnings_page_size=args.earnings_page_size,
+        earnings_latency=args.earnings_latency, image_bytes=args.image_bytes, image_latency=args.image_latency,
+        image_error_rate=args.image_error_rate, image_max_concurrency=args.image_max_concurrency,
+        duplicate_rate=args.duplicate_rate,
+    )
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+
+    with site:
+        # The exporters read these when they are imported
+        os.environ['POE_BASE_URL'] = site.base_url
+        os.environ['POE_TEXT_EXTRACTION'] = args.text_extraction
+        os.environ['POE_IMAGES_DISCOVERY'] = args.image_discovery
+        results = []
+        for name in args.scenarios or SCENARIOS:
+            print(f"Running {name} benchmark...")
+            results.append(run_scenario(name, site, args))
+
+    config = {key: value for key, value in vars(args).items() if key not in ('json', 'compare', 'log_level', 'keep_output')}
+    print_results(results, previous)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'config': config, 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+    return results
+
+if __name__ == "__main__":
+    main()
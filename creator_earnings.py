@@ -6,104 +6,135 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from dotenv import load_dotenv
-import time
+from html.parser import HTMLParser
 import logging
+from poe_auth import POE_BASE_URL, ensure_logged_in
+from poe_earnings_store import open_store, record_snapshot
+from poe_browser import env_flag, setup_driver as poe_setup_driver
+from poe_batch import IncompleteExportError
+import poe_metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 load_dotenv()
 
+# Only text is read here, so by default run a headless browser that skips
+# images, fonts and analytics. Set POE_EARNINGS_LEAN_BROWSER=0 for a full,
+# visible browser.
+LEAN_BROWSER = env_flag('POE_EARNINGS_LEAN_BROWSER', default=True)
+
 def setup_driver():
-    options = webdriver.ChromeOptions()
-    options.add_argument("start-maximized")
-    
-    # Add these lines to suppress Chrome logging
-    options.add_experimental_option('excludeSwitches', ['enable-logging'])
-    options.add_argument("--log-level=3")
-    
-    return webdriver.Chrome(options=options)
+    return poe_setup_driver(lean=LEAN_BROWSER)
 
-def login_to_poe(driver, email):
-    try:
-        logging.info("Navigating to login page...")
-        driver.get("https://poe.com/login")
-        
-        logging.info("Waiting for email input field...")
-        email_input = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='email']"))
-        )
-        
-        logging.info("Entering email...")
-        email_input.send_keys(email)
-        
-        logging.info("Clicking Go button...")
-        go_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[text()='Go']"))
-        )
-        go_button.click()
-        
-        logging.info("Waiting for verification code input...")
-        verification_input = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input.VerificationCodeInput_verificationCodeInput__RgX85"))
-        )
-        
-        verification_code = input("Enter the verification code sent to your email: ")
-        verification_input.send_keys(verification_code)
-        
-        logging.info("Clicking Log In button...")
-        login_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[contains(@class, 'Button_buttonBase__Bv9Vx') and contains(@class, 'Button_primary__6UIn0') and text()='Log In']"))
-        )
-        login_button.click()
-        
-        logging.info("Waiting for login to complete...")
-        time.sleep(5)
-        
-        logging.info("Login process completed.")
-    except Exception as e:
-        logging.error(f"An error occurred during login: {str(e)}")
-        raise
+TABLE_CLASS = "CreatorHubBotMetricsTable_table__8JeRY"
+BOT_NAME_CLASS = "CreatorHubBotMetricsTable_botName__XTijb"
+VALUE_CLASS = "CreatorHubBotMetricsTable_mainEarnings__byXzb"
+PAGING_SECTION_CLASS = "CreatorHubBotMetricsTable_pagingSection__gyBfy"
+TABLE_HTML_JS = "const table = document.getElementsByClassName(arguments[0])[0]; return table ? table.outerHTML : null;"
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
 
-def extract_table_data(table):
-    rows = table.find_elements(By.TAG_NAME, "tr")[1:]  # Skip header row
+class EarningsTableParser(HTMLParser):
+    # Pulls the header texts and, for every cell, the text of its first bot
+    # name and main value elements out of the table's HTML
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.headers = []
+        self.rows = []
+        self._row = None
+        self._cell = None
+        self._header = None
+        self._capture = None
+        self._capture_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._capture is not None:
+            if tag not in VOID_ELEMENTS:
+                self._capture_depth += 1
+            return
+        classes = (dict(attrs).get('class') or '').split()
+        if tag == 'tr':
+            self._row = []
+        elif tag == 'th':
+            self._header = []
+        elif tag == 'td' and self._row is not None:
+            self._cell = {}
+        elif self._cell is not None and tag not in VOID_ELEMENTS:
+            for name in (BOT_NAME_CLASS, VALUE_CLASS):
+                if name in classes and name not in self._cell:
+                    self._cell[name] = []
+                    self._capture = self._cell[name]
+                    self._capture_depth = 1
+                    break
+
+    def handle_endtag(self, tag):
+        if self._capture is not None:
+            self._capture_depth -= 1
+            if self._capture_depth == 0:
+                self._capture = None
+            return
+        if tag == 'th' and self._header is not None:
+            self.headers.append(collapse_text(self._header))
+            self._header = None
+        elif tag == 'td' and self._cell is not None:
+            self._row.append({name: collapse_text(parts) for name, parts in self._cell.items()})
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            if self._row:
+                self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._capture.append(data)
+        if self._header is not None:
+            self._header.append(data)
+
+def collapse_text(parts):
+    return ' '.join(''.join(parts).split())
+
+def parse_table_html(html):
+    parser = EarningsTableParser()
+    parser.feed(html)
+    parser.close()
     data = []
-    
-    for row in rows:
-        cols = row.find_elements(By.TAG_NAME, "td")
+    for cols in parser.rows:
         if len(cols) == 6:
-            bot_name = cols[0].find_element(By.CLASS_NAME, "CreatorHubBotMetricsTable_botName__XTijb").text.strip()
-            earnings = cols[1].find_element(By.CLASS_NAME, "CreatorHubBotMetricsTable_mainEarnings__byXzb").text.strip()
-            messages = cols[2].find_element(By.CLASS_NAME, "CreatorHubBotMetricsTable_mainEarnings__byXzb").text.strip()
-            unique_users = cols[3].find_element(By.CLASS_NAME, "CreatorHubBotMetricsTable_mainEarnings__byXzb").text.strip()
-            followers = cols[4].find_element(By.CLASS_NAME, "CreatorHubBotMetricsTable_mainEarnings__byXzb").text.strip()
-            upvote_ratio = cols[5].find_element(By.CLASS_NAME, "CreatorHubBotMetricsTable_mainEarnings__byXzb").text.strip()
-            
-            data.append([bot_name, earnings, messages, unique_users, followers, upvote_ratio])
-    
-    return data
+            bot_name = cols[0].get(BOT_NAME_CLASS, '')
+            data.append([bot_name] + [col.get(VALUE_CLASS, '') for col in cols[1:]])
+    return parser.headers, data
+
+def extract_table_data(table):
+    return parse_table_html(table.get_attribute('outerHTML'))[1]
+
+def fetch_table_html(driver):
+    return driver.execute_script(TABLE_HTML_JS, TABLE_CLASS)
 
 def extract_creator_earnings(driver):
     logging.info("Navigating to creators page...")
-    driver.get("https://poe.com/creators")
-    
-    logging.info("Waiting for earnings table to load...")
-    table = WebDriverWait(driver, 30).until(
-        EC.presence_of_element_located((By.CLASS_NAME, "CreatorHubBotMetricsTable_table__8JeRY"))
-    )
+    with poe_metrics.phase('page_load'):
+        driver.get(f"{POE_BASE_URL}/creators")
+        
+        logging.info("Waiting for earnings table to load...")
+        WebDriverWait(driver, 30).until(
+            EC.presence_of_element_located((By.CLASS_NAME, TABLE_CLASS))
+        )
     
-    headers = [th.text.strip() for th in table.find_elements(By.TAG_NAME, "th")]
+    # Each page's table is fetched in one call and parsed locally
+    with poe_metrics.phase('extraction'):
+        table_html = fetch_table_html(driver)
+        headers, page_data = parse_table_html(table_html)
     
     all_data = []
     page = 1
     
     while True:
         logging.info(f"Extracting data from page {page}")
-        page_data = extract_table_data(table)
         all_data.extend(page_data)
+        poe_metrics.count('earnings_rows', len(page_data))
         
         try:
             # Find the paging section
             paging_section = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "CreatorHubBotMetricsTable_pagingSection__gyBfy"))
+                EC.presence_of_element_located((By.CLASS_NAME, PAGING_SECTION_CLASS))
             )
             
             # Find all buttons in the paging section
@@ -119,15 +150,29 @@ def extract_creator_earnings(driver):
             next_button.click()
             logging.info(f"Clicked next page button. Moving to page {page + 1}")
             
-            # Wait for the table to update
-            time.sleep(2)
-            
-            # Re-locate the table after page change
-            table = WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "CreatorHubBotMetricsTable_table__8JeRY"))
-            )
+            # Wait until the table shows the next page's rows. Any other change
+            # (a loading spinner, an empty placeholder) is not the next page.
+            previous_first_row = page_data[0] if page_data else None
+
+            def next_page_loaded(d):
+                html = fetch_table_html(d)
+                if not html:
+                    return False
+                rows = parse_table_html(html)[1]
+                return rows if rows and rows[0] != previous_first_row else False
+
+            try:
+                with poe_metrics.phase('paging'):
+                    page_data = WebDriverWait(driver, 30, poll_frequency=0.1).until(next_page_loaded)
+            except TimeoutException:
+                # Next was enabled and clicked, so this is not the last page;
+                # saving the rows read so far would look like a complete table
+                logging.error(f"Page {page + 1} of the earnings table did not load")
+                raise IncompleteExportError(f"Only {page} pages of the earnings table were read; nothing was saved")
             
             page += 1
+        except IncompleteExportError:
+            raise
         except TimeoutException:
             logging.info("No more pages to navigate")
             break
@@ -139,26 +184,41 @@ def extract_creator_earnings(driver):
     return headers, all_data
 
 def save_to_csv(headers, data, filename):
-    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+    with poe_metrics.phase('write'), open(filename, 'w', newline='', encoding='utf-8') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(headers)
         writer.writerows(data)
     logging.info(f"Data exported successfully to {filename}")
 
-def export_poe_creator_earnings(output_file):
+def save_snapshot(data, store_path):
+    with poe_metrics.phase('write'):
+        conn = open_store(store_path)
+        try:
+            run_id = record_snapshot(conn, data)
+        finally:
+            conn.close()
+    logging.info(f"Snapshot {run_id} appended to {store_path}")
+    return run_id
+
+def export_poe_creator_earnings(output_file, store_path=None):
+    # store_path, if given, also appends this run to the SQLite history store
     email = os.getenv('POE_EMAIL')
-    if not email:
-        raise ValueError("POE_EMAIL environment variable is not set")
+    store_path = store_path or os.getenv('POE_EARNINGS_DB')
 
-    driver = setup_driver()
-    
-    try:
-        login_to_poe(driver, email)
-        headers, data = extract_creator_earnings(driver)
-        save_to_csv(headers, data, output_file)
-    finally:
-        driver.quit()
+    with poe_metrics.metrics_run('earnings'):
+        driver = setup_driver()
+        
+        try:
+            ensure_logged_in(driver, email)
+            headers, data = extract_creator_earnings(driver)
+            save_to_csv(headers, data, output_file)
+            if store_path:
+                save_snapshot(data, store_path)
+            return data
+        finally:
+            driver.quit()
 
 if __name__ == "__main__":
     output_file = input("Enter the output CSV filename (default: poe_creator_earnings.csv): ") or "poe_creator_earnings.csv"
-    export_poe_creator_earnings(output_file)
\ No newline at end of file
+    store_path = input("Enter a SQLite file to append this snapshot to (leave empty to skip): ").strip() or None
+    export_poe_creator_earnings(output_file, store_path)
\ No newline at end of file
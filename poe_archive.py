@@ -0,0 +1,288 @@
+import os
+import zlib
+import json
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from urllib.parse import urlparse
+from poe_transcript import render_transcript
+from poe_url_cache import UrlCache
+
+# Single-file archive for bulk exports. Transcripts and images go into one
+# SQLite file instead of a loose file per run:
+#
+# - blobs holds every message pair and image once, keyed by its digest and
+#   zlib-compressed unless that does not make it smaller (images usually),
+#   so content repeated across chats and runs is stored only once.
+# - transcripts holds one row per exported version of a chat, with the
+#   digests of its pairs in order. A run that finds the chat unchanged only
+#   updates the latest row.
+# - images maps each chat's image URLs to their blobs.
+#
+# Any chat can be read back on its own: one transcripts row, then only the
+# blobs it names.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    compressed INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_url TEXT NOT NULL,
+    bot_name TEXT,
+    exported_at TEXT NOT NULL,
+    complete INTEGER NOT NULL,
+    pair_count INTEGER NOT NULL,
+    pair_digests BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_by_chat ON transcripts (chat_url, id);
+CREATE TABLE IF NOT EXISTS images (
+    chat_url TEXT NOT NULL,
+    url TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    added_at TEXT NOT NULL,
+    PRIMARY KEY (chat_url, url)
+);
+"""
+
+# Pair digests are SHA-1, stored back to back as raw bytes
+PAIR_DIGEST_SIZE = 20
+COMPRESSION_LEVEL = 6
+# Compressed data is kept only if it saves at least this fraction
+MIN_COMPRESSION_SAVING = 0.05
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+def pair_digest(human_message, bot_message):
+    # Same key as MessageCollector.pair_key
+    return hashlib.sha1(f"{human_message}\x00{bot_message}".encode('utf-8')).hexdigest()
+
+def pack(data):
+    # Returns (compressed, data)
+    packed = zlib.compress(data, COMPRESSION_LEVEL)
+    if len(packed) <= len(data) * (1 - MIN_COMPRESSION_SAVING):
+        return True, packed
+    return False, data
+
+class ChatArchive:
+    # One connection shared by every thread of the process, serialised by a
+    # lock; use get_archive() to share it between exports
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._url_cache = None
+
+    @property
+    def url_cache(self):
+        # The image URL cache, in its own table of the archive file
+        with self._lock:
+            if self._url_cache is None:
+                self._url_cache = UrlCache(self.path)
+            return self._url_cache
+
+    def _put_blob(self, digest, data):
+        # Returns True if the blob was new. Call inside a transaction.
+        if self._conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone():
+            return False
+        compressed, packed = pack(data)
+        self._conn.execute("INSERT INTO blobs (digest, size, compressed, data) VALUES (?, ?, ?, ?)",
+                           (digest, len(data), int(compressed), packed))
+        return True
+
+    def read_blob(self, digest):
+        with self._lock:
+            row = self._conn.execute("SELECT compressed, data FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            raise KeyError(digest)
+        compressed, data = row
+        return zlib.decompress(data) if compressed else bytes(data)
+
+    def has_blob(self, digest):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() is not None
+
+    # Transcripts
+
+    def add_transcript(self, chat_url, bot_name, messages, complete=True):
+        # Stores an iterable of (human, bot) pairs, oldest first, and returns
+        # the transcript id
+        digests = bytearray()
+        new_pairs = 0
+        exported_at = datetime.now().isoformat(timespec='seconds')
+        with self._lock, self._conn:
+            for human, bot in messages:
+                digest = pair_digest(human, bot)
+                if self._put_blob(digest, json.dumps([human, bot], ensure_ascii=False).encode('utf-8')):
+                    new_pairs += 1
+                digests += bytes.fromhex(digest)
+            pair_digests = zlib.compress(bytes(digests), COMPRESSION_LEVEL)
+            latest = self._conn.execute(
+                "SELECT id, pair_digests, complete FROM transcripts WHERE chat_url = ? ORDER BY id DESC LIMIT 1",
+                (chat_url,),
+            ).fetchone()
+            if latest is not None and bytes(latest[1]) == pair_digests and latest[2] >= int(complete):
+                transcript_id = latest[0]
+                self._conn.execute("UPDATE transcripts SET exported_at = ?, bot_name = COALESCE(?, bot_name) WHERE id = ?",
+                                   (exported_at, bot_name, transcript_id))
+            else:
+                transcript_id = self._conn.execute(
+                    "INSERT INTO transcripts (chat_url, bot_name, exported_at, complete, pair_count, pair_digests) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (chat_url, bot_name, exported_at, int(complete), len(digests) // PAIR_DIGEST_SIZE, pair_digests),
+                ).lastrowid
+        logging.info(f"Archived {len(digests) // PAIR_DIGEST_SIZE} message pairs of {chat_url} "
+                     f"({new_pairs} new) as transcript {transcript_id}")
+        return transcript_id
+
+    def transcript(self, chat_url, transcript_id=None):
+        # The latest transcript of the chat, or the given version, as a dict
+        with self._lock:
+            if transcript_id is None:
+                row = self._conn.execute(
+                    "SELECT id, chat_url, bot_name, exported_at, complete, pair_count, pair_digests FROM transcripts "
+                    "WHERE chat_url = ? ORDER BY id DESC LIMIT 1", (chat_url,)).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT id, chat_url, bot_name, exported_at, complete, pair_count, pair_digests FROM transcripts "
+                    "WHERE chat_url = ? AND id = ?", (chat_url, transcript_id)).fetchone()
+        if row is None:
+            raise KeyError(f"No archived transcript for {chat_url}")
+        keys = ('id', 'chat_url', 'bot_name', 'exported_at', 'complete', 'pair_count', 'pair_digests')
+        return dict(zip(keys, row))
+
+    def latest_complete_id(self, chat_url):
+        # Id of the chat's latest complete transcript, or None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(id) FROM transcripts WHERE chat_url = ? AND complete = 1", (chat_url,)).fetchone()
+        return row[0]
+
+    def iter_pairs(self, chat_url, transcript_id=None, reverse=False):
+        # Yields the chat's (human, bot) pairs, oldest first unless reverse,
+        # decompressing one pair at a time
+        digests = zlib.decompress(self.transcript(chat_url, transcript_id)['pair_digests'])
+        offsets = range(0, len(digests), PAIR_DIGEST_SIZE)
+        for offset in reversed(offsets) if reverse else offsets:
+            human, bot = json.loads(self.read_blob(digests[offset:offset + PAIR_DIGEST_SIZE].hex()))
+            yield human, bot
+
+    def write_transcript(self, f, chat_url, output_format='text', transcript_id=None):
+        # Renders a stored transcript in any of the TRANSCRIPT_FORMATS
+        transcript = self.transcript(chat_url, transcript_id)
+        return render_transcript(f, self.iter_pairs(chat_url, transcript['id']), chat_url, transcript['bot_name'],
+                                 output_format, transcript['exported_at'].replace('T', ' '))
+
+    def chats(self):
+        # One row per chat: (chat_url, latest transcript id, exported_at,
+        # pair_count, versions, images)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT t.chat_url, t.id, t.exported_at, t.pair_count, v.versions, "
+                "(SELECT COUNT(*) FROM images i WHERE i.chat_url = t.chat_url) "
+                "FROM transcripts t JOIN (SELECT chat_url, MAX(id) AS id, COUNT(*) AS versions FROM transcripts "
+                "GROUP BY chat_url) v ON v.id = t.id "
+                "UNION ALL "
+                "SELECT chat_url, NULL, MAX(added_at), NULL, 0, COUNT(*) FROM images "
+                "WHERE chat_url NOT IN (SELECT chat_url FROM transcripts) GROUP BY chat_url "
+                "ORDER BY 1"
+            ).fetchall()
+
+    # Images
+
+    def add_image_file(self, temp_path, digest):
+        # Moves a downloaded file into the archive. Returns True if this call
+        # stored the image, False if it was already archived.
+        try:
+            with open(temp_path, 'rb') as f:
+                data = f.read()
+            with self._lock, self._conn:
+                return self._put_blob(digest, data)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def record_chat_images(self, chat_url, images):
+        # images is an iterable of (url, digest, extension)
+        added_at = datetime.now().isoformat(timespec='seconds')
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO images (chat_url, url, digest, extension, added_at) VALUES (?, ?, ?, ?, ?)",
+                [(chat_url, url, digest, extension, added_at) for url, digest, extension in images],
+            )
+
+    def chat_images(self, chat_url):
+        # [(url, digest, extension)] in the order they were recorded
+        with self._lock:
+            return self._conn.execute(
+                "SELECT url, digest, extension FROM images WHERE chat_url = ? ORDER BY rowid", (chat_url,)).fetchall()
+
+    def extract_images(self, chat_url, target_dir):
+        # Writes the chat's images to target_dir as <digest><extension>, the
+        # names the loose image store uses, and returns how many were written
+        os.makedirs(target_dir, exist_ok=True)
+        written = 0
+        for digest, extension in dict.fromkeys((digest, extension) for _, digest, extension in self.chat_images(chat_url)):
+            path = os.path.join(target_dir, f"{digest}{extension}")
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(self.read_blob(digest))
+                written += 1
+        return written
+
+    def close(self):
+        with self._lock:
+            if self._url_cache is not None:
+                self._url_cache.close()
+                self._url_cache = None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class ArchiveImageStore:
+    # Stands in for poe_image_store.ImageStore so the download pipelines can
+    # write straight into an archive. Downloads are staged next to the
+    # archive file and moved into it by publish(). The URL cache is a table
+    # in the archive itself.
+    def __init__(self, archive):
+        self.archive = archive
+        self.staging_dir = os.path.dirname(os.path.abspath(archive.path))
+        self.url_cache = archive.url_cache
+
+    def __contains__(self, digest):
+        return self.archive.has_blob(digest)
+
+    def temp_file(self):
+        return tempfile.mkstemp(dir=self.staging_dir, prefix='.download_', suffix='.part')
+
+    def publish(self, temp_path, digest, extension):
+        return self.archive.add_image_file(temp_path, digest)
+
+    def record_chat(self, chat_url, results):
+        self.archive.record_chat_images(chat_url, [
+            (result.url, result.digest, image_extension(result.url)) for result in results if result.digest
+        ])
+
+def image_extension(url):
+    # The extension the loose image store gives the file
+    return os.path.splitext(urlparse(url).path)[1] or '.jpg'
+
+def get_archive(path):
+    # Exports running in the same process share one connection per archive
+    key = os.path.abspath(path)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None:
+            archive = _archives[key] = ChatArchive(path)
+        return archive
@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from urllib.parse import urlparse
+from poe_image_store import DownloadResult
+from poe_concurrency import (MAX_RETRY_AFTER, RETRY_STATUSES, THROTTLE_STATUSES, AsyncAdaptiveLimiter, backoff_delay,
+                             parse_retry_after)
+import poe_metrics
+import poe_url_cache
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+DEFAULT_MAX_CONCURRENCY = 100
+# Connections to any one host. The adaptive limit decides how many downloads
+# actually run, and never goes above this.
+DEFAULT_PER_HOST_LIMIT = 16
+DEFAULT_QUEUE_SIZE = 500
+DEFAULT_MAX_ATTEMPTS = 5
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+class AsyncImageDownloader:
+    # asyncio download engine: connection limits overall and per host, an
+    # adaptive limit on downloads in flight, and retries with backoff on 429,
+    # 5xx and timeouts. Must be used from inside a running event loop.
+    def __init__(self, store, max_concurrency=DEFAULT_MAX_CONCURRENCY, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, timeout=30, base_delay=0.5, max_delay=30.0, limiter=None):
+        if aiohttp is None:
+            raise ImportError("The asyncio download engine requires aiohttp (pip install aiohttp)")
+        self.store = store
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = limiter or AsyncAdaptiveLimiter(maximum=min(max_concurrency, per_host_limit))
+        self._session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.per_host_limit)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self._session.close()
+        self.limiter.record_metrics()
+
+    async def fetch(self, img_url):
+        start = time.perf_counter()
+        result, cached = await self._fetch(img_url)
+        poe_metrics.add_duration('download', time.perf_counter() - start)
+        if result.stored:
+            poe_metrics.count('images_stored')
+        elif cached:
+            poe_metrics.count('images_cached')
+        elif result.digest:
+            poe_metrics.count('duplicate_images')
+        else:
+            poe_metrics.count('download_failures')
+        return result
+
+    async def _fetch(self, img_url):
+        # Returns (result, cached), like poe_image_downloader._download_image
+        entry = poe_url_cache.cached_entry(self.store, img_url)
+        if poe_url_cache.is_trusted(entry):
+            logging.debug(f"Using the stored copy of {img_url}")
+            return DownloadResult(img_url, False, entry.digest, 0, None), True
+        headers = poe_url_cache.conditional_headers(entry)
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            token = await self.limiter.acquire()
+            outcome, latency, retry_after, nbytes = 'error', None, None, 0
+            try:
+                start = time.perf_counter()
+                async with self._session.get(img_url, headers=headers) as response:
+                    latency = time.perf_counter() - start
+                    if response.status == 304 and entry is not None:
+                        outcome = 'ok'
+                        self.store.url_cache.touch(img_url)
+                        poe_metrics.count('images_not_modified')
+                        logging.debug(f"Not modified since the last download: {img_url}")
+                        return DownloadResult(img_url, False, entry.digest, attempt, None), True
+                    if response.status == 200:
+                        stored, digest, nbytes = await self._save(img_url, response)
+                        outcome = 'ok'
+                        poe_url_cache.record_download(self.store, img_url, response.headers, nbytes, digest)
+                        return DownloadResult(img_url, stored, digest, attempt, None), False
+                    error = f"HTTP {response.status}"
+                    if response.status not in RETRY_STATUSES:
+                        outcome = 'ok'
+                        break
+                    outcome = 'throttled' if response.status in THROTTLE_STATUSES else 'error'
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                        error += f" (Retry-After {retry_after:.0f}s)"
+                        retry_after = MAX_RETRY_AFTER
+                        poe_metrics.count('retry_after_too_long')
+                        break
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                error = str(e) or type(e).__name__
+            except OSError as e:
+                outcome = 'ok'
+                logging.error(f"Error saving image from {img_url}: {str(e)}")
+                return DownloadResult(img_url, False, None, attempt, str(e)), False
+            finally:
+                await self.limiter.release(token, outcome, latency, retry_after, nbytes)
+
+            if attempt < self.max_attempts:
+                poe_metrics.count('download_retries', reason=error if error.startswith('HTTP') else 'network')
+                delay = retry_after if retry_after is not None else backoff_delay(attempt, self.base_delay, self.max_delay)
+                logging.debug(f"Retrying {img_url} in {delay:.2f}s after {error} (attempt {attempt})")
+                await asyncio.sleep(delay)
+
+        logging.warning(f"Failed to download image from {img_url}: {error}")
+        return DownloadResult(img_url, False, None, attempt, error), False
+
+    async def _save(self, img_url, response):
+        img_hasher = hashlib.md5()
+        size = 0
+        fd, temp_path = self.store.temp_file()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    img_hasher.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                    poe_metrics.count('download_bytes', len(chunk))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        img_hash = img_hasher.hexdigest()
+        file_extension = os.path.splitext(urlparse(img_url).path)[1] or '.jpg'
+        stored = self.store.publish(temp_path, img_hash, file_extension)
+        if stored:
+            logging.debug(f"Saved {img_hash}{file_extension}")
+        else:
+            logging.debug(f"Duplicate image found for URL: {img_url}")
+        return stored, img_hash, size
+
+async def download_images_async(img_urls, store, **kwargs):
+    async with AsyncImageDownloader(store, **kwargs) as downloader:
+        return await asyncio.gather(*(downloader.fetch(img_url) for img_url in img_urls))
+
+class AsyncDownloadPipeline:
+    # Same submit()/close() interface as DownloadPipeline, backed by an
+    # AsyncImageDownloader running on its own event loop thread.
+    def __init__(self, store, workers=DEFAULT_MAX_CONCURRENCY, queue_size=DEFAULT_QUEUE_SIZE, **kwargs):
+        self.results = []
+        self._downloader = AsyncImageDownloader(store, max_concurrency=workers, **kwargs)
+        self._workers = workers
+        self._queue_size = queue_size
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._call(self._start())
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _start(self):
+        await self._downloader.__aenter__()
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self._workers)]
+
+    async def _work(self):
+        while True:
+            img_url = await self._queue.get()
+            if img_url is None:
+                return
+            self.results.append(await self._downloader.fetch(img_url))
+
+    async def _stop(self):
+        for _ in self._tasks:
+            await self._queue.put(None)
+        await asyncio.gather(*self._tasks)
+        await self._downloader.__aexit__(None, None, None)
+
+    def submit(self, img_urls):
+        # Blocks while the queue is full, like DownloadPipeline.submit
+        for img_url in img_urls:
+            self._call(self._queue.put(img_url))
+
+    def close(self):
+        self._call(self._stop())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
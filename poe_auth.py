@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+import logging
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+from dotenv import load_dotenv
+from poe_metrics import phase
+
+# Settings below may come from .env, which has to be loaded before they are read
+load_dotenv()
+
+# Overridable so the exporters can be pointed at the local benchmark site
+POE_BASE_URL = os.getenv('POE_BASE_URL', "https://poe.com").rstrip('/')
+DEFAULT_SESSION_FILE = os.getenv('POE_SESSION_FILE', '.poe_session.json')
+
+LOGGED_IN_SELECTOR = "textarea[class*='GrowingTextArea_textArea']"
+EMAIL_INPUT_SELECTOR = "input[type='email']"
+
+class LoginRequiredError(Exception):
+    pass
+
+def login_to_poe(driver, email):
+    # The verification code is typed at the terminal, so without one (cron,
+    # CI) fail before asking Poe to send it
+    if not sys.stdin or not sys.stdin.isatty():
+        raise LoginRequiredError(
+            "Logging in needs the verification code sent to your email, but there is no terminal to type it in. "
+            "Run once interactively to save a session, then reuse it (POE_SESSION_FILE)."
+        )
+    try:
+        logging.info("Navigating to login page...")
+        driver.get(f"{POE_BASE_URL}/login")
+
+        logging.info("Waiting for email input field...")
+        email_input = WebDriverWait(driver, 30).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, EMAIL_INPUT_SELECTOR))
+        )
+
+        logging.info("Entering email...")
+        email_input.send_keys(email)
+
+        logging.info("Clicking Go button...")
+        go_button = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.XPATH, "//button[text()='Go']"))
+        )
+        go_button.click()
+
+        logging.info("Waiting for verification code input...")
+        verification_input = WebDriverWait(driver, 30).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "input.VerificationCodeInput_verificationCodeInput__RgX85"))
+        )
+
+        verification_code = input("Enter the verification code sent to your email: ")
+        verification_input.send_keys(verification_code)
+
+        logging.info("Clicking Log In button...")
+        login_button = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.XPATH, "//button[contains(@class, 'Button_buttonBase__Bv9Vx') and contains(@class, 'Button_primary__6UIn0') and text()='Log In']"))
+        )
+        login_button.click()
+
+        # Wait for the redirect away from the login page rather than a fixed delay
+        logging.info("Waiting for login to complete...")
+        WebDriverWait(driver, 30).until(lambda d: "/login" not in d.current_url)
+
+        logging.info("Login process completed.")
+    except TimeoutException as e:
+        logging.error(f"Timeout occurred: {str(e)}")
+        logging.debug(f"Current page source:\n{driver.page_source}")
+        raise
+    except NoSuchElementException as e:
+        logging.error(f"Element not found: {str(e)}")
+        logging.debug(f"Current page source:\n{driver.page_source}")
+        raise
+    except Exception as e:
+        logging.error(f"An error occurred during login: {str(e)}")
+        raise
+
+def save_session(driver, session_file=DEFAULT_SESSION_FILE):
+    session = {
+        'saved_at': time.time(),
+        'cookies': driver.get_cookies(),
+        'local_storage': driver.execute_script(
+            "const items = {};"
+            "for (let i = 0; i < localStorage.length; i++) {"
+            "  const key = localStorage.key(i); items[key] = localStorage.getItem(key);"
+            "}"
+            "return items;"
+        ),
+    }
+    # The file holds live session cookies, so keep it readable by the owner only
+    fd = os.open(session_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(session, f)
+    logging.info(f"Session saved to {session_file}")
+
+def restore_session(driver, session_file=DEFAULT_SESSION_FILE):
+    if not os.path.exists(session_file):
+        return False
+    try:
+        with open(session_file, encoding='utf-8') as f:
+            session = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read session file {session_file}: {str(e)}")
+        return False
+
+    now = time.time()
+    cookies = [c for c in session.get('cookies', []) if c.get('expiry') is None or c['expiry'] > now]
+    if not cookies:
+        logging.info("Saved session has expired")
+        return False
+
+    # Cookies and local storage can only be set for the domain currently loaded
+    driver.get(POE_BASE_URL)
+    for cookie in cookies:
+        try:
+            driver.add_cookie(cookie)
+        except WebDriverException as e:
+            logging.debug(f"Skipping cookie {cookie.get('name')}: {str(e)}")
+    driver.execute_script(
+        "for (const [key, value] of Object.entries(arguments[0])) { localStorage.setItem(key, value); }",
+        session.get('local_storage') or {},
+    )
+    return True
+
+def is_logged_in(driver, timeout=15):
+    driver.get(POE_BASE_URL)
+    try:
+        WebDriverWait(driver, timeout).until(
+            lambda d: "/login" in d.current_url
+            or d.find_elements(By.CSS_SELECTOR, EMAIL_INPUT_SELECTOR)
+            or d.find_elements(By.CSS_SELECTOR, LOGGED_IN_SELECTOR)
+        )
+    except TimeoutException:
+        return False
+    if "/login" in driver.current_url:
+        return False
+    return bool(driver.find_elements(By.CSS_SELECTOR, LOGGED_IN_SELECTOR))
+
+def ensure_logged_in(driver, email, session_file=DEFAULT_SESSION_FILE):
+    # Reuse a saved session when it is still valid and only fall back to the
+    # interactive email/verification-code login when it has expired.
+    with phase('login'):
+        if session_file and restore_session(driver, session_file):
+            if is_logged_in(driver):
+                logging.info(f"Reusing saved session from {session_file}")
+                return
+            logging.info("Saved session is no longer valid, logging in again...")
+
+        if not email:
+            raise ValueError("POE_EMAIL environment variable is not set")
+        login_to_poe(driver, email)
+        if session_file:
+            save_session(driver, session_file)
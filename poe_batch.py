@@ -0,0 +1,118 @@
+import logging
+import queue
+import threading
+from selenium.common.exceptions import WebDriverException
+from poe_auth import ensure_logged_in, DEFAULT_SESSION_FILE
+from poe_metrics import count
+
+class IncompleteExportError(Exception):
+    # Raised by an export that wrote what it could but does not cover the
+    # whole chat, so the chat has to be exported again
+    pass
+
+def parse_chat_urls(text):
+    return [url for url in text.replace(',', ' ').split() if url]
+
+def driver_alive(driver):
+    try:
+        driver.current_url
+        return True
+    except WebDriverException:
+        return False
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except WebDriverException as e:
+        logging.debug(f"Could not quit the browser: {str(e)}")
+
+def export_chats(urls, save_dir, setup_driver, export_chat, email, workers=3, session_file=DEFAULT_SESSION_FILE):
+    # Exports several chats concurrently over a small pool of browsers that
+    # share one authenticated session. export_chat(driver, url, save_dir) writes
+    # its own output as soon as that chat is done. Returns {url: result}, where
+    # result is the export's return value or the exception it raised.
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+    if not session_file and workers > 1:
+        logging.warning("No session file configured; exporting with a single browser")
+        workers = 1
+    workers = max(1, min(workers, len(urls)))
+
+    pending = queue.Queue()
+    for url in urls:
+        pending.put(url)
+    results = {}
+    results_lock = threading.Lock()
+
+    # Logins are serialised: when the saved session is no longer valid, only
+    # one browser at a time logs in (prompting for a code at most once) and
+    # saves a session that the next one then restores.
+    login_lock = threading.Lock()
+
+    def start_driver():
+        driver = setup_driver()
+        try:
+            with login_lock:
+                ensure_logged_in(driver, email, session_file)
+        except Exception:
+            quit_driver(driver)
+            raise
+        return driver
+
+    # The first browser logs in before the pool starts, so a login that
+    # fails stops the batch at once
+    first_driver = start_driver()
+
+    def worker(driver):
+        try:
+            if driver is None:
+                driver = start_driver()
+            while True:
+                try:
+                    url = pending.get_nowait()
+                except queue.Empty:
+                    return
+                for attempt in (1, 2):
+                    try:
+                        result = export_chat(driver, url, save_dir)
+                        logging.info(f"Finished exporting {url}")
+                    except WebDriverException as e:
+                        result = e
+                        if attempt == 1 and not driver_alive(driver):
+                            # A crashed browser would fail every chat left in the queue
+                            logging.warning(f"Browser died while exporting {url}, starting a new one: {str(e)}")
+                            count('browser_restarts')
+                            quit_driver(driver)
+                            driver = None
+                            try:
+                                driver = start_driver()
+                            except Exception as restart_error:
+                                with results_lock:
+                                    results[url] = restart_error
+                                raise
+                            continue
+                        logging.error(f"Failed to export {url}: {str(e)}")
+                    except Exception as e:
+                        logging.error(f"Failed to export {url}: {str(e)}")
+                        result = e
+                    break
+                with results_lock:
+                    results[url] = result
+        except Exception as e:
+            logging.error(f"Export worker stopped: {str(e)}")
+        finally:
+            if driver is not None:
+                quit_driver(driver)
+
+    threads = [threading.Thread(target=worker, args=(first_driver if i == 0 else None,), daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    failed = sum(1 for result in results.values() if isinstance(result, Exception))
+    count('chats_exported', len(results) - failed)
+    count('chats_failed', failed + len(urls) - len(results))
+    logging.info(f"Exported {len(results) - failed} of {len(urls)} chats ({failed} failed)")
+    return results
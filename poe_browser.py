@@ -0,0 +1,171 @@
+import os
+import logging
+from selenium import webdriver
+from poe_metrics import count, instrument_driver, phase
+
+# URL patterns blocked in lean mode. Stylesheets are deliberately left alone:
+# the chat only scrolls (and pages in older history) while its layout CSS is
+# applied.
+LEAN_BLOCKED_RESOURCE_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.mp3",
+]
+LEAN_BLOCKED_HOSTS = [
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*connect.facebook.com*", "*sentry.io*", "*segment.io*",
+    "*amplitude.com*", "*hotjar.com*", "*intercom.io*",
+]
+
+def env_flag(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def setup_driver(lean=False, headless=None, blocked_patterns=None, capture_network=False):
+    # lean runs headless and blocks images, fonts, media and analytics hosts
+    # through the DevTools protocol; headless defaults to the value of lean.
+    # capture_network records network events in the performance log so
+    # poe_network can read the page's API responses.
+    headless = lean if headless is None else headless
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+    else:
+        options.add_argument("start-maximized")
+
+    # Suppress Chrome logging
+    options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    options.add_argument("--log-level=3")
+
+    if capture_network:
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+    if lean:
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-background-networking")
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+
+    with phase('driver_start'):
+        driver = webdriver.Chrome(options=options)
+    instrument_driver(driver)
+
+    if lean:
+        if blocked_patterns is None:
+            blocked_patterns = LEAN_BLOCKED_RESOURCE_PATTERNS + LEAN_BLOCKED_HOSTS
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(blocked_patterns)})
+        logging.debug(f"Blocking {len(blocked_patterns)} URL patterns in lean mode")
+    return driver
+
+SCROLL_CONTAINER_SELECTOR = "div[class*='ChatMessagesScrollWrapper']"
+PAGING_TRIGGER_SELECTOR = "div[class*='InfiniteScroll_pagingTrigger']"
+MESSAGE_PAIR_SELECTOR = "div[class*='ChatMessagesView_messagePair']"
+PRUNED_ATTRIBUTE = "data-poe-export-pruned"
+PRUNE_MARK_ATTRIBUTE = "data-poe-export-prune"
+
+# Low-memory scrolling hides message pairs once they have been read. The
+# pairs belong to React, so their children are left alone: React may still
+# re-render them. Each pair is instead pinned to its rendered height and its
+# contents are skipped with content-visibility, so the browser stops laying
+# out and painting them (and can drop their decoded images), while the scroll
+# geometry that drives the paging trigger does not change. Heights are all
+# read before anything is changed so layout runs once.
+HIDE_PAIRS_JS = """
+function hidePairs(pairs, prunedAttribute) {
+    const heights = pairs.map(pair => pair.getBoundingClientRect().height);
+    pairs.forEach((pair, i) => {
+        pair.style.boxSizing = 'border-box';
+        pair.style.height = heights[i] + 'px';
+        pair.style.overflow = 'hidden';
+        pair.style.contentVisibility = 'hidden';
+        pair.setAttribute(prunedAttribute, '1');
+    });
+    return pairs.length;
+}
+"""
+
+# For collectors that do not mark pairs themselves: hides the pairs marked by
+# the previous call, which have been read since, then marks the current ones.
+PRUNE_MARKED_PAIRS_JS = HIDE_PAIRS_JS + """
+const pairSelector = arguments[0], markAttribute = arguments[1], prunedAttribute = arguments[2];
+const pruned = hidePairs(Array.from(document.querySelectorAll(
+    pairSelector + '[' + markAttribute + ']:not([' + prunedAttribute + '])')), prunedAttribute);
+for (const pair of document.querySelectorAll(pairSelector + ':not([' + markAttribute + '])')) {
+    pair.setAttribute(markAttribute, '1');
+}
+return pruned;
+"""
+
+# Attaches a MutationObserver to the scroll container (the chat by default),
+# optionally scrolls into the paging trigger, first going to the top when
+# paging upwards, then resolves as soon as the DOM has been quiet for settleMs
+# after a change, or when timeoutMs expires. Without scrolling it simply waits
+# for the page to go quiet.
+WAIT_FOR_DOM_CHANGE_JS = """
+const containerSelector = arguments[0], triggerSelector = arguments[1], doScroll = arguments[2];
+const timeoutMs = arguments[3], settleMs = arguments[4], upwards = arguments[5], done = arguments[arguments.length - 1];
+const target = document.querySelector(containerSelector) || document.body;
+let changed = false, finished = false, settleTimer = null, deadline = null;
+const observer = new MutationObserver(() => {
+    changed = true;
+    clearTimeout(settleTimer);
+    settleTimer = setTimeout(finish, settleMs);
+});
+function finish() {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(settleTimer);
+    clearTimeout(deadline);
+    done({changed: changed, trigger: !!document.querySelector(triggerSelector)});
+}
+observer.observe(target, {childList: true, subtree: true, characterData: true});
+deadline = setTimeout(finish, timeoutMs);
+if (doScroll) {
+    if (upwards) target.scrollTop = 0;
+    const trigger = document.querySelector(triggerSelector);
+    if (trigger) trigger.scrollIntoView(true);
+} else {
+    settleTimer = setTimeout(finish, settleMs);
+}
+"""
+
+def _wait_for_dom(driver, do_scroll, timeout, settle, container_selector=SCROLL_CONTAINER_SELECTOR, upwards=True):
+    # The async script must finish before WebDriver's own script timeout.
+    driver.set_script_timeout(timeout + 5)
+    result = driver.execute_async_script(
+        WAIT_FOR_DOM_CHANGE_JS,
+        container_selector, PAGING_TRIGGER_SELECTOR, do_scroll,
+        int(timeout * 1000), int(settle * 1000), upwards,
+    )
+    return result or {'changed': False, 'trigger': False}
+
+def scroll_up_and_wait(driver, timeout=5, settle=0.3):
+    # Returns {'changed': bool, 'trigger': bool} once newly paged content has
+    # rendered, instead of sleeping for a fixed interval.
+    with phase('scroll_pass'):
+        result = _wait_for_dom(driver, True, timeout, settle)
+    if not result['changed']:
+        logging.debug(f"No DOM change within {timeout}s of scrolling")
+    return result
+
+def scroll_down_and_wait(driver, container_selector, timeout=5, settle=0.3):
+    # The same for lists that page in further items at the bottom, such as
+    # the chat history list
+    with phase('scroll_pass'):
+        result = _wait_for_dom(driver, True, timeout, settle, container_selector, upwards=False)
+    if not result['changed']:
+        logging.debug(f"No DOM change within {timeout}s of scrolling")
+    return result
+
+def wait_for_dom_quiet(driver, timeout=10, settle=1.0):
+    return _wait_for_dom(driver, False, timeout, settle)
+
+def prune_read_pairs(driver):
+    # Call once per pass, after the pass has read the page
+    pruned = driver.execute_script(PRUNE_MARKED_PAIRS_JS, MESSAGE_PAIR_SELECTOR, PRUNE_MARK_ATTRIBUTE, PRUNED_ATTRIBUTE) or 0
+    count('pruned_pairs', pruned)
+    return pruned
@@ -0,0 +1,211 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import poe_metrics
+
+# Adaptive limit on concurrent image downloads (AIMD, as in TCP congestion
+# control). Until the first sign of congestion every response that comes back
+# quickly raises the limit by one, doubling it each round of downloads; after
+# that it grows by about one per round. A 429, a 5xx, a network error or a response much
+# slower than the fastest seen so far halves it. Retry-After pauses every new
+# download, not just the one that was told to wait.
+DEFAULT_INITIAL_LIMIT = 8
+DEFAULT_MIN_LIMIT = 1
+# The image host is one host, so this is also its connection cap
+DEFAULT_MAX_LIMIT = 16
+DECREASE_FACTOR = 0.5
+# A response slower than this multiple of the baseline latency counts as
+# congestion
+LATENCY_TOLERANCE = 3.0
+LATENCY_SMOOTHING = 0.2
+REPORT_INTERVAL = 10.0
+
+# A Retry-After longer than this is not waited out: the download fails, so a
+# later run retries it, and other downloads pause for this long only
+MAX_RETRY_AFTER = 60.0
+
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def backoff_delay(attempt, base_delay=0.5, max_delay=30.0):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+class AimdController:
+    # The limit and its bookkeeping, without any waiting. acquire() returns a
+    # token to hand back to release() with the outcome of the request:
+    # 'ok' (with the time to the response headers) for any response the
+    # server did not ask us to retry, 'throttled' for 429 and 503, or 'error'
+    # for other 5xx responses and network errors.
+    def __init__(self, initial=DEFAULT_INITIAL_LIMIT, minimum=DEFAULT_MIN_LIMIT, maximum=DEFAULT_MAX_LIMIT, name='download'):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.peak = int(self.limit)
+        self.in_flight = 0
+        self.slow_start = True
+        self.paused_until = 0.0
+        self.baseline_latency = None
+        self.smoothed_latency = None
+        self.completed = 0
+        self.bytes = 0
+        self._started = time.monotonic()
+        self._last_decrease = float('-inf')
+        self._last_report = self._started
+        self._reported_completed = 0
+        self._reported_bytes = 0
+
+    @property
+    def current_limit(self):
+        return int(self.limit)
+
+    def _wait_time(self, now):
+        # Seconds until a download may start, 0 if it may start now, or None
+        # if it has to wait for another download to finish
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= self.current_limit:
+            return None
+        return 0
+
+    def _start(self, now):
+        self.in_flight += 1
+        return now
+
+    def _finish(self, token, outcome, latency=None, retry_after=None, nbytes=0):
+        now = time.monotonic()
+        self.in_flight -= 1
+        if outcome == 'ok':
+            self.completed += 1
+            self.bytes += nbytes
+            if latency is not None and self._slow(latency):
+                self._decrease(token, now, 'latency')
+            else:
+                # Additive increase: +1 once a whole limit's worth succeeded
+                self.limit = min(self.maximum, self.limit + (1 if self.slow_start else 1 / self.limit))
+                self.peak = max(self.peak, self.current_limit)
+        else:
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+                logging.info(f"{self.name.capitalize()}s paused for {retry_after:.1f}s (Retry-After)")
+            self._decrease(token, now, outcome)
+        self._report(now)
+
+    def _slow(self, latency):
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency += LATENCY_SMOOTHING * (latency - self.smoothed_latency)
+        if self.baseline_latency is None or self.smoothed_latency < self.baseline_latency:
+            self.baseline_latency = self.smoothed_latency
+        return self.smoothed_latency > self.baseline_latency * LATENCY_TOLERANCE
+
+    def _decrease(self, token, now, reason):
+        # Requests started before the last decrease saw the old limit, so
+        # their failures do not shrink it again
+        if token < self._last_decrease:
+            return
+        self.slow_start = False
+        if reason == 'latency':
+            # The slow latency becomes the new normal until it improves
+            self.baseline_latency = self.smoothed_latency
+        if self.limit <= self.minimum:
+            return
+        self._last_decrease = now
+        previous = self.current_limit
+        self.limit = max(self.minimum, self.limit * DECREASE_FACTOR)
+        poe_metrics.count('concurrency_decreases', reason=reason)
+        logging.info(f"{self.name.capitalize()} concurrency {previous} -> {self.current_limit} ({reason})")
+
+    def throughput(self, now=None):
+        # (completed per second, bytes per second) since the limiter was created
+        elapsed = max((now or time.monotonic()) - self._started, 1e-9)
+        return self.completed / elapsed, self.bytes / elapsed
+
+    def _report(self, now):
+        if now - self._last_report < REPORT_INTERVAL:
+            return
+        elapsed = now - self._last_report
+        rate = (self.completed - self._reported_completed) / elapsed
+        byte_rate = (self.bytes - self._reported_bytes) / elapsed
+        logging.info(f"{self.name.capitalize()} concurrency {self.current_limit} ({self.in_flight} in flight), "
+                     f"{rate:.1f}/s, {byte_rate / 2 ** 20:.2f} MB/s")
+        self._last_report = now
+        self._reported_completed = self.completed
+        self._reported_bytes = self.bytes
+
+    def record_metrics(self):
+        rate, byte_rate = self.throughput()
+        poe_metrics.set_gauge(f'{self.name}_concurrency_limit', self.current_limit)
+        poe_metrics.set_gauge(f'{self.name}_concurrency_peak', self.peak)
+        poe_metrics.set_gauge(f'{self.name}s_per_second', round(rate, 2))
+        poe_metrics.set_gauge(f'{self.name}_bytes_per_second', round(byte_rate))
+        logging.info(f"{self.name.capitalize()} concurrency ended at {self.current_limit} (peak {self.peak}), "
+                     f"{rate:.1f}/s, {byte_rate / 2 ** 20:.2f} MB/s")
+
+class AdaptiveLimiter(AimdController):
+    # For threads: acquire() blocks until the limit and any Retry-After pause
+    # allow another download
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now)
+                if wait == 0:
+                    return self._start(now)
+                self._condition.wait(wait)
+
+    def release(self, token, outcome, latency=None, retry_after=None, nbytes=0):
+        with self._condition:
+            self._finish(token, outcome, latency, retry_after, nbytes)
+            self._condition.notify_all()
+
+class AsyncAdaptiveLimiter(AimdController):
+    # Same as AdaptiveLimiter for coroutines on one event loop
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._condition = None
+
+    async def acquire(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now)
+                if wait == 0:
+                    return self._start(now)
+                try:
+                    await asyncio.wait_for(self._condition.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, token, outcome, latency=None, retry_after=None, nbytes=0):
+        async with self._condition:
+            self._finish(token, outcome, latency, retry_after, nbytes)
+            self._condition.notify_all()
@@ -0,0 +1,134 @@
+import re
+import sqlite3
+import logging
+from collections import Counter
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    captured_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bot_earnings (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    bot_name TEXT NOT NULL,
+    captured_on TEXT NOT NULL,
+    earnings REAL,
+    messages INTEGER,
+    unique_users INTEGER,
+    followers INTEGER,
+    upvote_ratio REAL,
+    PRIMARY KEY (run_id, bot_name)
+);
+CREATE INDEX IF NOT EXISTS bot_earnings_by_bot_date ON bot_earnings (bot_name, captured_on);
+CREATE INDEX IF NOT EXISTS bot_earnings_by_date ON bot_earnings (captured_on);
+"""
+
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+# A minus sign may come before the currency symbol ("-$5.00"), so the sign is
+# read from everything in front of the digits
+NEGATIVE_SIGNS = ('-', '\u2212')
+SUFFIX_MULTIPLIERS = {'k': 1e3, 'm': 1e6, 'b': 1e9}
+
+def parse_number(value):
+    # "$1,234.56" -> 1234.56, "-$5.00" -> -5.0, "12.3K" -> 12300.0,
+    # "95%" -> 95.0; blanks and placeholders such as "-" become None
+    if value is None:
+        return None
+    text = str(value).strip().replace(',', '')
+    match = NUMBER_PATTERN.search(text)
+    if not match:
+        return None
+    number = float(match.group())
+    if any(sign in text[:match.start()] for sign in NEGATIVE_SIGNS):
+        number = -number
+    suffix = text[match.end():match.end() + 1].lower()
+    return number * SUFFIX_MULTIPLIERS.get(suffix, 1)
+
+def parse_count(value):
+    number = parse_number(value)
+    return None if number is None else int(round(number))
+
+def normalize_row(row):
+    bot_name, earnings, messages, unique_users, followers, upvote_ratio = row
+    return (
+        bot_name,
+        parse_number(earnings),
+        parse_count(messages),
+        parse_count(unique_users),
+        parse_count(followers),
+        parse_number(upvote_ratio),
+    )
+
+def open_store(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+def record_snapshot(conn, data, captured_at=None):
+    # Appends one run of extract_creator_earnings rows and returns its run id.
+    # Rows are keyed by bot name, so two bots shown under the same name cannot
+    # be told apart between runs; such a run is refused rather than merged.
+    duplicates = sorted(name for name, count in Counter(row[0] for row in data).items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Several bots share a name, cannot record the snapshot: {', '.join(duplicates)}")
+    captured_at = captured_at or datetime.now()
+    captured_on = captured_at.date().isoformat()
+    with conn:
+        run_id = conn.execute("INSERT INTO runs (captured_at) VALUES (?)", (captured_at.isoformat(timespec='seconds'),)).lastrowid
+        rows = []
+        for row in data:
+            bot_name, *values = normalize_row(row)
+            rows.append((run_id, bot_name, captured_on, *values))
+        conn.executemany(
+            "INSERT INTO bot_earnings "
+            "(run_id, bot_name, captured_on, earnings, messages, unique_users, followers, upvote_ratio) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+    logging.info(f"Recorded snapshot {run_id} with {len(data)} bots")
+    return run_id
+
+def bot_history(conn, bot_name, since=None):
+    # Time series for one bot, oldest first; since is an ISO date
+    return conn.execute(
+        "SELECT r.captured_at, e.earnings, e.messages, e.unique_users, e.followers, e.upvote_ratio "
+        "FROM bot_earnings e JOIN runs r ON r.id = e.run_id "
+        "WHERE e.bot_name = ? AND e.captured_on >= ? ORDER BY e.captured_on, r.id",
+        (bot_name, since or ''),
+    ).fetchall()
+
+def latest_run_ids(conn, count=2):
+    return [row['id'] for row in conn.execute("SELECT id FROM runs ORDER BY id DESC LIMIT ?", (count,))]
+
+def find_previous_run_id(conn, run_id):
+    return conn.execute("SELECT MAX(id) FROM runs WHERE id < ?", (run_id,)).fetchone()[0]
+
+def find_next_run_id(conn, run_id):
+    return conn.execute("SELECT MIN(id) FROM runs WHERE id > ?", (run_id,)).fetchone()[0]
+
+def run_deltas(conn, run_id=None, previous_run_id=None):
+    # Per-bot change between two runs. A missing run_id is the run after
+    # previous_run_id (or the latest run), and a missing previous_run_id the
+    # run before run_id. Bots that are new in run_id have NULL deltas.
+    if run_id is None:
+        if previous_run_id is not None:
+            run_id = find_next_run_id(conn, previous_run_id)
+        else:
+            latest = latest_run_ids(conn, 1)
+            run_id = latest[0] if latest else None
+        if run_id is None:
+            return []
+    if previous_run_id is None:
+        previous_run_id = find_previous_run_id(conn, run_id)
+        if previous_run_id is None:
+            return []
+    return conn.execute(
+        "SELECT cur.bot_name, cur.earnings, cur.earnings - prev.earnings AS earnings_delta, "
+        "cur.messages - prev.messages AS messages_delta, cur.unique_users - prev.unique_users AS unique_users_delta, "
+        "cur.followers - prev.followers AS followers_delta, cur.upvote_ratio - prev.upvote_ratio AS upvote_ratio_delta "
+        "FROM bot_earnings cur LEFT JOIN bot_earnings prev ON prev.run_id = ? AND prev.bot_name = cur.bot_name "
+        "WHERE cur.run_id = ? ORDER BY earnings_delta DESC",
+        (previous_run_id, run_id),
+    ).fetchall()
@@ -0,0 +1,337 @@
+import os
+import sys
+import logging
+import argparse
+from urllib.parse import urlparse
+from poe_transcript import TRANSCRIPT_FORMATS
+
+# Non-interactive command line for all three exporters:
+#
+#   poe-export text URL [URL ...] -o PoeChatTranscripts --format markdown
+#   poe-export images URL [URL ...] -o PoeChatImages --engine asyncio
+#   poe-export earnings -o earnings.csv --db earnings.sqlite
+#   poe-export sync text -o PoeChatTranscripts
+#   poe-export archive poe_archive.sqlite https://poe.com/chat/... --format markdown
+#
+# Only the standard library is imported here. Selenium, requests and the
+# exporter modules are imported when a subcommand actually runs, so --help
+# and --dry-run return immediately.
+
+class ValidationError(Exception):
+    pass
+
+def read_urls(args):
+    # Same separators as poe_batch.parse_chat_urls, which is not imported here
+    # because it pulls in Selenium
+    text = ' '.join(args.urls)
+    if args.urls_file:
+        with open(args.urls_file, encoding='utf-8') as f:
+            text += ' ' + f.read()
+    return list(dict.fromkeys(text.replace(',', ' ').split()))
+
+def check_urls(urls):
+    if not urls:
+        raise ValidationError("no chat URLs given")
+    for url in urls:
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc or parsed.path.strip('/') == '':
+            raise ValidationError(f"not a chat URL: {url}")
+
+def check_writable_dir(path):
+    # The directory may not exist yet, as long as it can be created
+    existing = os.path.abspath(path)
+    while not os.path.exists(existing):
+        parent = os.path.dirname(existing)
+        if parent == existing:
+            break
+        existing = parent
+    if not os.path.isdir(existing):
+        raise ValidationError(f"{existing} is not a directory")
+    if not os.access(existing, os.W_OK | os.X_OK):
+        raise ValidationError(f"{existing} is not writable")
+
+def check_login():
+    # Returns a description of how the run will log in. The exporters reuse
+    # a saved session and only need POE_EMAIL (and a verification code typed
+    # at the terminal) when it is missing or expired.
+    session_file = os.getenv('POE_SESSION_FILE', '.poe_session.json')
+    email = os.getenv('POE_EMAIL')
+    if os.path.exists(session_file):
+        return f"reuse the session saved in {session_file}" + ("" if email else " (POE_EMAIL is not set, so it must still be valid)")
+    if not email:
+        raise ValidationError(f"POE_EMAIL is not set and there is no saved session in {session_file}")
+    if not sys.stdin.isatty():
+        raise ValidationError(f"there is no saved session in {session_file} and no terminal to type the verification "
+                              f"code in; log in once interactively first")
+    return f"log in as {email} (the verification code is read from the terminal)"
+
+def check_engine(engine):
+    if engine == 'asyncio':
+        import importlib.util
+        if importlib.util.find_spec('aiohttp') is None:
+            raise ValidationError("the asyncio engine requires aiohttp (pip install aiohttp)")
+
+def validate(args):
+    # Returns a list of lines describing what the command would do
+    if args.command == 'archive':
+        if not os.path.isfile(args.archive):
+            raise ValidationError(f"no archive at {args.archive}")
+        if args.output:
+            check_writable_dir(os.path.dirname(args.output) or '.')
+        if args.images:
+            check_writable_dir(args.images)
+        if not args.url:
+            return [f"list the chats in {args.archive}"]
+        return [f"write the {'latest transcript' if args.version is None else f'transcript {args.version}'} of {args.url} "
+                f"as {args.format} to {args.output or 'standard output'}"] + \
+               ([f"extract its images to {args.images}"] if args.images else [])
+
+    plan = [f"login: {check_login()}"]
+    if getattr(args, 'archive', None):
+        check_writable_dir(os.path.dirname(args.archive) or '.')
+        plan.append(f"store in the archive {args.archive}")
+    if args.command in ('text', 'images'):
+        urls = read_urls(args)
+        check_urls(urls)
+        check_writable_dir(args.output)
+        if args.workers < 1:
+            raise ValidationError("--workers must be at least 1")
+        plan.append(f"export {len(urls)} chat(s) to {args.output}" + (f" with {min(args.workers, len(urls))} browsers" if len(urls) > 1 else ""))
+        plan.extend(f"  {url}" for url in urls)
+        args.chat_urls = urls
+    if args.command == 'text':
+        plan.append(f"format: {args.format}, extraction: {args.extraction}" + (", delta" if args.delta else "")
+                    + (", low memory" if args.low_memory else ""))
+    elif args.command == 'images':
+        check_engine(args.engine)
+        plan.append(f"engine: {args.engine}, discovery: {args.discovery}, image cache: {args.image_cache}"
+                    + (", low memory" if args.low_memory else ""))
+    elif args.command == 'earnings':
+        check_writable_dir(os.path.dirname(args.output) or '.')
+        plan.append(f"write CSV to {args.output}")
+        if args.db:
+            check_writable_dir(os.path.dirname(args.db) or '.')
+            plan.append(f"append snapshot to {args.db}")
+    elif args.command == 'sync':
+        if args.output is None:
+            args.output = 'PoeChatImages' if args.kind == 'images' else 'PoeChatTranscripts'
+        check_writable_dir(args.output)
+        if args.workers < 1:
+            raise ValidationError("--workers must be at least 1")
+        if args.kind == 'images':
+            check_engine(args.engine)
+        plan.append(f"list every chat on the account and export the {'images' if args.kind == 'images' else 'transcripts'} of "
+                    + ("all of them" if args.full else "those changed since the last sync") + f" to {args.output}")
+        plan.append(f"format: {args.format}" if args.kind == 'text' else f"engine: {args.engine}, image cache: {args.image_cache}")
+    return plan
+
+def run_text(args):
+    import poe_text_downloader
+    poe_text_downloader.EXTRACTION = args.extraction
+    if args.archive:
+        poe_text_downloader.ARCHIVE = args.archive
+    if args.low_memory:
+        poe_text_downloader.LOW_MEMORY = True
+    if args.lean is not None:
+        poe_text_downloader.LEAN_BROWSER = args.lean
+    if len(args.chat_urls) > 1:
+        results = poe_text_downloader.save_poe_chats_text(args.chat_urls, args.output, workers=args.workers,
+                                                          delta=args.delta, output_format=args.format)
+        return all(not isinstance(result, Exception) for result in results.values()) and len(results) == len(args.chat_urls)
+    return poe_text_downloader.save_poe_chat_text(args.chat_urls[0], args.output, delta=args.delta,
+                                                  output_format=args.format) is not None
+
+def run_images(args):
+    import poe_image_downloader
+    poe_image_downloader.IMAGE_DISCOVERY = args.discovery
+    poe_image_downloader.DOWNLOAD_ENGINE = args.engine
+    poe_image_downloader.poe_url_cache.CACHE_MODE = args.image_cache
+    if args.archive:
+        poe_image_downloader.ARCHIVE = args.archive
+    if args.low_memory:
+        poe_image_downloader.LOW_MEMORY = True
+    if args.lean is not None:
+        poe_image_downloader.LEAN_BROWSER = args.lean
+    if len(args.chat_urls) > 1:
+        results = poe_image_downloader.save_poe_chats_images(args.chat_urls, args.output, workers=args.workers)
+        return all(not isinstance(result, Exception) for result in results.values()) and len(results) == len(args.chat_urls)
+    return poe_image_downloader.save_poe_chat_images(args.chat_urls[0], args.output, args.engine) is not None
+
+def run_earnings(args):
+    import creator_earnings
+    if args.lean is not None:
+        creator_earnings.LEAN_BROWSER = args.lean
+    creator_earnings.export_poe_creator_earnings(args.output, args.db)
+    return True
+
+def run_sync(args):
+    import poe_sync
+    if args.kind == 'text':
+        import poe_text_downloader as exporter
+    else:
+        import poe_image_downloader as exporter
+        exporter.DOWNLOAD_ENGINE = args.engine
+        exporter.poe_url_cache.CACHE_MODE = args.image_cache
+    if args.archive:
+        exporter.ARCHIVE = args.archive
+    if args.low_memory:
+        exporter.LOW_MEMORY = True
+    if args.lean is not None:
+        exporter.LEAN_BROWSER = args.lean
+    results = poe_sync.sync_account(args.output, args.kind, workers=args.workers, output_format=args.format,
+                                    engine=args.engine, full=args.full)
+    print(f"Exported {sum(1 for result in results.values() if not isinstance(result, Exception))} changed chat(s)")
+    return all(not isinstance(result, Exception) for result in results.values())
+
+def run_archive(args):
+    from poe_archive import ChatArchive
+    archive = ChatArchive(args.archive)
+    try:
+        if not args.url:
+            for chat_url, transcript_id, exported_at, pair_count, versions, images in archive.chats():
+                print(f"{chat_url}\t{exported_at}\t{pair_count or 0} pairs\t{versions} versions\t{images} images")
+            return True
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                archive.write_transcript(f, args.url, args.format, args.version)
+        else:
+            archive.write_transcript(sys.stdout, args.url, args.format, args.version)
+        if args.images:
+            written = archive.extract_images(args.url, args.images)
+            print(f"Extracted {written} images to {args.images}", file=sys.stderr)
+        return True
+    finally:
+        archive.close()
+
+COMMANDS = {
+    'text': run_text,
+    'images': run_images,
+    'earnings': run_earnings,
+    'sync': run_sync,
+    'archive': run_archive,
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='poe-export', description="Export Poe chats, chat images and creator earnings.")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log debug messages")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Only log warnings and errors")
+    parser.add_argument('--metrics-dir', default=os.getenv('POE_METRICS_DIR'),
+                        help="Write a JSON summary and a Prometheus textfile for the run here")
+    subparsers = parser.add_subparsers(dest='command', metavar='command', required=True)
+
+    def add_common(subparser, lean_default):
+        subparser.add_argument('--dry-run', action='store_true', help="Validate the arguments and show what would be done")
+        # Without either flag the exporter's own POE_*_LEAN_BROWSER setting applies
+        if lean_default:
+            subparser.add_argument('--full-browser', dest='lean', action='store_const', const=False, default=None,
+                                   help="Use a visible browser that loads every resource")
+        else:
+            subparser.add_argument('--lean', action='store_const', const=True, default=None,
+                                   help="Use a headless browser that skips images, fonts and media")
+
+    def add_chat_arguments(subparser, default_output):
+        subparser.add_argument('urls', nargs='*', metavar='URL', help="Chat URLs to export")
+        subparser.add_argument('--urls-file', help="Read more chat URLs from this file (whitespace or comma separated)")
+        subparser.add_argument('-o', '--output', default=default_output, help=f"Output directory (default: {default_output})")
+        subparser.add_argument('--workers', type=int, default=3, help="Browsers to use when exporting several chats (default: 3)")
+        subparser.add_argument('--low-memory', action='store_const', const=True, default=None,
+                               help="Hide messages in the page once read and keep indexes on disk, for very long chats")
+        subparser.add_argument('--archive', default=os.getenv('POE_ARCHIVE'),
+                               help="Store the output in this compressed archive file instead of loose files")
+
+    text = subparsers.add_parser('text', help="Export chat transcripts")
+    add_chat_arguments(text, 'PoeChatTranscripts')
+    text.add_argument('--format', choices=list(TRANSCRIPT_FORMATS), default='text', help="Transcript format (default: text)")
+    text.add_argument('--delta', action='store_true', help="Only fetch messages added since the last complete export")
+    text.add_argument('--extraction', choices=('script', 'elements', 'network'), default=os.getenv('POE_TEXT_EXTRACTION', 'script'),
+                      help="How messages are read (default: script)")
+    add_common(text, lean_default=True)
+
+    images = subparsers.add_parser('images', help="Download the images in chats")
+    add_chat_arguments(images, 'PoeChatImages')
+    images.add_argument('--engine', choices=('threads', 'asyncio'), default=os.getenv('POE_DOWNLOAD_ENGINE', 'threads'),
+                        help="Download engine (default: threads)")
+    images.add_argument('--image-cache', choices=('revalidate', 'trust', 'off'), default=os.getenv('POE_IMAGE_CACHE', 'revalidate'),
+                        help="Revalidate images downloaded before, reuse them without asking, or always download (default: revalidate)")
+    images.add_argument('--discovery', choices=('dom', 'network'), default=os.getenv('POE_IMAGES_DISCOVERY', 'dom'),
+                        help="How image URLs are found (default: dom)")
+    add_common(images, lean_default=False)
+
+    earnings = subparsers.add_parser('earnings', help="Export creator earnings")
+    earnings.add_argument('-o', '--output', default='poe_creator_earnings.csv', help="CSV file (default: poe_creator_earnings.csv)")
+    earnings.add_argument('--db', default=os.getenv('POE_EARNINGS_DB'), help="SQLite history file to append this run to")
+    add_common(earnings, lean_default=True)
+
+    sync = subparsers.add_parser('sync', help="Export every chat on the account that changed since the last sync")
+    sync.add_argument('kind', choices=('text', 'images'), help="Export transcripts or images")
+    sync.add_argument('-o', '--output', help="Output directory, which also holds the sync index "
+                                             "(default: PoeChatTranscripts or PoeChatImages)")
+    sync.add_argument('--full', action='store_true', help="Export every chat, changed or not")
+    sync.add_argument('--workers', type=int, default=3, help="Browsers to export changed chats with (default: 3)")
+    sync.add_argument('--format', choices=list(TRANSCRIPT_FORMATS), default='text', help="Transcript format (default: text)")
+    sync.add_argument('--engine', choices=('threads', 'asyncio'), default=os.getenv('POE_DOWNLOAD_ENGINE', 'threads'),
+                      help="Image download engine (default: threads)")
+    sync.add_argument('--image-cache', choices=('revalidate', 'trust', 'off'), default=os.getenv('POE_IMAGE_CACHE', 'revalidate'),
+                      help="Revalidate images downloaded before, reuse them without asking, or always download (default: revalidate)")
+    sync.add_argument('--low-memory', action='store_const', const=True, default=None,
+                      help="Hide messages in the page once read and keep indexes on disk, for very long chats")
+    sync.add_argument('--archive', default=os.getenv('POE_ARCHIVE'),
+                      help="Store the output in this compressed archive file instead of loose files")
+    sync.add_argument('--dry-run', action='store_true', help="Validate the arguments and show what would be done")
+    lean = sync.add_mutually_exclusive_group()
+    lean.add_argument('--lean', action='store_const', const=True, default=None,
+                      help="Use a headless browser that skips images, fonts and media")
+    lean.add_argument('--full-browser', dest='lean', action='store_const', const=False,
+                      help="Use a visible browser that loads every resource")
+
+    archive = subparsers.add_parser('archive', help="List the chats in an archive or read one back")
+    archive.add_argument('archive', help="Archive file written with --archive")
+    archive.add_argument('url', nargs='?', help="Chat to read; without it the archived chats are listed")
+    archive.add_argument('--format', choices=list(TRANSCRIPT_FORMATS), default='text', help="Transcript format (default: text)")
+    archive.add_argument('--version', type=int, help="Transcript id to read instead of the latest")
+    archive.add_argument('-o', '--output', help="Write the transcript here instead of to standard output")
+    archive.add_argument('--images', metavar='DIR', help="Also extract the chat's images into this directory")
+    archive.add_argument('--dry-run', action='store_true', help="Validate the arguments and show what would be done")
+    return parser
+
+def main(argv=None):
+    # Returns 0 on success, 1 if the export failed and 2 for invalid arguments
+    # Load .env first: the option defaults and the modules' settings read it.
+    # The installed command lives elsewhere, so look from the working directory.
+    try:
+        from dotenv import find_dotenv, load_dotenv
+    except ImportError:
+        pass
+    else:
+        load_dotenv(find_dotenv(usecwd=True))
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    level = logging.DEBUG if args.verbose else logging.WARNING if args.quiet else logging.INFO
+    logging.basicConfig(level=level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        plan = validate(args)
+    except (ValidationError, OSError) as e:
+        print(f"poe-export {args.command}: error: {e}", file=sys.stderr)
+        return 2
+
+    if args.dry_run:
+        print("Dry run, nothing exported. Would:")
+        for line in plan:
+            print(f"  {line}")
+        return 0
+
+    if args.metrics_dir:
+        import poe_metrics
+        poe_metrics.METRICS_DIR = args.metrics_dir
+    try:
+        return 0 if COMMANDS[args.command](args) else 1
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        logging.error(f"Export failed: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
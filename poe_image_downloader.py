@@ -11,188 +11,348 @@ from urllib.parse import urlparse
 import time
 from dotenv import load_dotenv
 import logging
+from poe_auth import ensure_logged_in
+from poe_browser import (HIDE_PAIRS_JS, MESSAGE_PAIR_SELECTOR, PRUNED_ATTRIBUTE, env_flag, scroll_up_and_wait,
+                         setup_driver as poe_setup_driver)
+from poe_batch import IncompleteExportError, export_chats, parse_chat_urls
 import re
-import concurrent.futures
+import queue
+import threading
 import hashlib
+from poe_network import capture_chat_messages, image_urls_from_messages
+from poe_image_store import DownloadResult, get_image_store
+from poe_archive import ArchiveImageStore, get_archive
+import poe_url_cache
+from poe_concurrency import (DEFAULT_MAX_LIMIT, MAX_RETRY_AFTER, RETRY_STATUSES, THROTTLE_STATUSES, AdaptiveLimiter,
+                             backoff_delay, parse_retry_after)
+import poe_metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 load_dotenv()
 
+# Image URLs are read from the DOM and downloaded separately, so a lean
+# headless browser also works here. Set POE_IMAGES_LEAN_BROWSER=1 to enable it.
+LEAN_BROWSER = env_flag('POE_IMAGES_LEAN_BROWSER', default=False)
+# 'dom' scans the rendered page; 'network' reads image URLs from the API
+# responses the page fetches while paging.
+IMAGE_DISCOVERY = os.getenv('POE_IMAGES_DISCOVERY', 'dom')
+# Low-memory mode hides message pairs in the page once they have been scanned,
+# so the browser stops rendering them and their images.
+LOW_MEMORY = env_flag('POE_LOW_MEMORY')
+# Path of a poe_archive file to store images in instead of the save directory
+ARCHIVE = os.getenv('POE_ARCHIVE')
+
 def setup_driver():
-    options = webdriver.ChromeOptions()
-    options.add_argument("start-maximized")
-    return webdriver.Chrome(options=options)
+    return poe_setup_driver(lean=LEAN_BROWSER, capture_network=IMAGE_DISCOVERY == 'network')
 
-def login_to_poe(driver, email):
-    try:
-        # Navigate to the login page
-        logging.info("Navigating to login page...")
-        driver.get("https://poe.com/login")
-        
-        # Wait for the email input field to be present
-        logging.info("Waiting for email input field...")
-        email_input = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='email']"))
-        )
-        
-        # Enter email
-        logging.info("Entering email...")
-        email_input.send_keys(email)
-        
-        # Find and click the "Go" button
-        logging.info("Clicking Go button...")
-        go_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[text()='Go']"))
-        )
-        go_button.click()
-        
-        # Wait for the verification code input field
-        logging.info("Waiting for verification code input...")
-        verification_input = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input.VerificationCodeInput_verificationCodeInput__RgX85"))
-        )
-        
-        # Prompt user for verification code
-        verification_code = input("Enter the verification code sent to your email: ")
-        verification_input.send_keys(verification_code)
-        
-        # Find and click the "Log In" button
-        logging.info("Clicking Log In button...")
-        login_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[contains(@class, 'Button_buttonBase__Bv9Vx') and contains(@class, 'Button_primary__6UIn0') and text()='Log In']"))
-        )
-        login_button.click()
-        
-        # Wait for a short time to allow login process to complete
-        logging.info("Waiting for login to complete...")
-        time.sleep(5)  # Wait for 5 seconds
-        
-        logging.info("Login process completed.")
-    except TimeoutException as e:
-        logging.error(f"Timeout occurred: {str(e)}")
-        logging.info("Current page source:")
-        logging.info(driver.page_source)
-        raise
-    except NoSuchElementException as e:
-        logging.error(f"Element not found: {str(e)}")
-        logging.info("Current page source:")
-        logging.info(driver.page_source)
-        raise
-    except Exception as e:
-        logging.error(f"An unexpected error occurred: {str(e)}")
-        raise
-
-def scroll_and_collect_images(driver, max_scroll_time=600):
+IMAGE_ELEMENT_SELECTOR = "img[src^='http']"
+MARKDOWN_SELECTOR = "div[class*='Markdown_markdownContainer']"
+IMAGE_TEXT_URL_PATTERN = r'(https?://\S+\.(?:jpg|jpeg|png|gif))'
+IMAGES_SEEN_ATTRIBUTE = "data-poe-export-images-seen"
+
+# Reads only the images and markdown blocks not marked by an earlier pass,
+# marks them, and returns every URL they contain in one round trip, so a pass
+# costs as much as the history it loaded. The text pattern is the Python regex
+# above, which JavaScript reads the same way. With prune, pairs are hidden
+# once scanned, unless an image in them has no real src yet.
+DISCOVER_IMAGE_URLS_JS = HIDE_PAIRS_JS + """
+const imageSelector = arguments[0], markdownSelector = arguments[1], seenAttribute = arguments[2];
+const urlPattern = new RegExp(arguments[3], 'g');
+const prune = arguments[4], pairSelector = arguments[5], prunedAttribute = arguments[6];
+const unseen = selector => document.querySelectorAll(selector + ':not([' + seenAttribute + '])');
+const urls = [];
+let scanned = 0;
+for (const img of unseen(imageSelector)) {
+    img.setAttribute(seenAttribute, '1');
+    urls.push(img.src);
+    scanned++;
+}
+for (const block of unseen(markdownSelector)) {
+    block.setAttribute(seenAttribute, '1');
+    for (const match of block.innerText.matchAll(urlPattern)) urls.push(match[1]);
+    scanned++;
+}
+let pruned = 0;
+if (prune) {
+    const pairs = Array.from(document.querySelectorAll(pairSelector + ':not([' + prunedAttribute + '])'))
+        .filter(pair => !pair.querySelector("img:not([src^='http'])"));
+    pruned = hidePairs(pairs, prunedAttribute);
+}
+return {urls: urls, scanned: scanned, pruned: pruned};
+"""
+
+def discover_new_image_urls(driver, prune=False):
+    # Returns (urls, scanned): the URLs found in newly inserted content, and
+    # how many new images and markdown blocks were read
+    result = driver.execute_script(
+        DISCOVER_IMAGE_URLS_JS,
+        IMAGE_ELEMENT_SELECTOR, MARKDOWN_SELECTOR, IMAGES_SEEN_ATTRIBUTE, IMAGE_TEXT_URL_PATTERN,
+        prune, MESSAGE_PAIR_SELECTOR, PRUNED_ATTRIBUTE,
+    ) or {}
+    poe_metrics.count('pruned_pairs', result.get('pruned', 0))
+    return [url for url in result.get('urls', []) if url], result.get('scanned', 0)
+
+def scroll_and_collect_images(driver, max_scroll_time=600, scroll_wait_timeout=5, on_new_images=None, prune=None):
+    # Returns (urls, complete); complete is False if scrolling stopped at
+    # max_scroll_time before the top of the chat. on_new_images, if given, is
+    # called with each pass's newly found URLs so downloads can start while
+    # scrolling continues. prune defaults to LOW_MEMORY.
+    prune = LOW_MEMORY if prune is None else prune
     logging.info("Scrolling and collecting image URLs...")
     start_time = time.time()
     image_urls = set()
-    last_image_count = 0
-    scroll_pause_time = 2
     no_new_content_count = 0
     max_no_new_content = 5
-    
-    scroll_container_js_path = """document.querySelector("div[class*='ChatMessagesScrollWrapper']")"""
+    reached_top = False
     
     while time.time() - start_time < max_scroll_time:
-        # Scroll to top of the conversation container
-        driver.execute_script(f"arguments[0].scrollTop = 0;", driver.execute_script(f"return {scroll_container_js_path}"))
-        time.sleep(scroll_pause_time)
-        
-        # Try to find and interact with the infinite scroll trigger
-        try:
-            trigger = driver.find_element(By.CSS_SELECTOR, "div[class*='InfiniteScroll_pagingTrigger']")
-            driver.execute_script("arguments[0].scrollIntoView(true);", trigger)
-            time.sleep(scroll_pause_time)  # Wait for content to load
-        except NoSuchElementException:
+        # Scroll to the top of the conversation and into the infinite scroll
+        # trigger, then wait until the newly loaded content has rendered
+        scroll_result = scroll_up_and_wait(driver, timeout=scroll_wait_timeout)
+        if not scroll_result['trigger']:
             logging.info("Infinite scroll trigger not found. Might have reached the top.")
         
-        # Collect image URLs from all possible sources
-        new_images_found = False
-        
-        # Look for images in message pairs
-        message_pairs = driver.find_elements(By.CSS_SELECTOR, "div[class*='ChatMessagesView_messagePair']")
-        logging.info(f"Found {len(message_pairs)} message pairs")
-        
-        # Look for images in any container within the chat
-        img_elements = driver.find_elements(By.CSS_SELECTOR, "img[src^='http']")
-        
-        for img in img_elements:
-            try:
-                src = img.get_attribute('src')
-                if src and src not in image_urls:
-                    image_urls.add(src)
-                    new_images_found = True
-                    logging.info(f"Added new image URL: {src}")
-            except StaleElementReferenceException:
-                continue
+        # Only images and markdown blocks inserted since the last pass are read
+        with poe_metrics.phase('discovery'):
+            found_urls, scanned = discover_new_image_urls(driver, prune)
         
-        # Look for image URLs in text content (e.g., markdown links)
-        text_elements = driver.find_elements(By.CSS_SELECTOR, "div[class*='Markdown_markdownContainer']")
-        for elem in text_elements:
-            try:
-                text = elem.text
-                urls = re.findall(r'(https?://\S+\.(?:jpg|jpeg|png|gif))', text)
-                for url in urls:
-                    if url not in image_urls:
-                        image_urls.add(url)
-                        new_images_found = True
-                        logging.info(f"Added new image URL from text: {url}")
-            except StaleElementReferenceException:
-                continue
+        new_urls = []
+        for url in found_urls:
+            if url not in image_urls:
+                image_urls.add(url)
+                new_urls.append(url)
+                logging.debug(f"Added new image URL: {url}")
         
-        if new_images_found:
+        poe_metrics.count('image_urls', len(new_urls))
+        if new_urls:
             logging.info(f"Found {len(image_urls)} unique images so far...")
+            if on_new_images is not None:
+                on_new_images(new_urls)
+            no_new_content_count = 0
+        elif scanned:
+            # New history without images still means scrolling is progressing
             no_new_content_count = 0
         else:
             no_new_content_count += 1
             logging.info(f"No new images found. Count: {no_new_content_count}")
         
+        if not scroll_result['trigger'] and not scanned:
+            logging.info("Reached the top of the chat and scanned everything loaded.")
+            reached_top = True
+            break
         if no_new_content_count >= max_no_new_content:
             logging.info(f"No new content found for {max_no_new_content} consecutive scrolls. Assuming we've reached the top.")
+            reached_top = True
             break
     
+    if not reached_top:
+        logging.warning("Stopped scrolling after the time limit; older images were not loaded")
     logging.info(f"Scrolling completed in {time.time() - start_time:.2f} seconds")
-    return list(image_urls)
+    return list(image_urls), reached_top
 
-def download_image(img_url, save_dir, index, existing_hashes):
-    try:
-        response = requests.get(img_url, timeout=10)
-        if response.status_code == 200:
-            # Hash the image content
-            img_content = response.content
-            img_hash = hashlib.md5(img_content).hexdigest()
-            
-            # Check if this image hash already exists
-            if img_hash in existing_hashes:
-                logging.info(f"Duplicate image found for URL: {img_url}")
-                return False, img_hash
-            
-            file_extension = os.path.splitext(urlparse(img_url).path)[1] or '.jpg'
-            safe_filename = f"image_{index}_{img_hash}{file_extension}"
-            file_path = os.path.join(save_dir, safe_filename)
-            
-            with open(file_path, 'wb') as f:
-                f.write(img_content)
-            logging.info(f"Saved {safe_filename}")
-            return True, img_hash
-        else:
-            logging.warning(f"Failed to download image from {img_url}")
-            return False, None
-    except Exception as e:
-        logging.error(f"Error downloading image from {img_url}: {str(e)}")
-        return False, None
+def collect_images_from_network(driver, max_scroll_time=600, scroll_wait_timeout=5, on_new_images=None, prune=None):
+    prune = LOW_MEMORY if prune is None else prune
+    image_urls = set()
 
-def save_poe_chat_images(url, save_dir):
-    email = os.getenv('POE_EMAIL')
-    if not email:
-        raise ValueError("POE_EMAIL environment variable is not set")
+    def handle_new_messages(messages):
+        new_urls = [url for url in dict.fromkeys(image_urls_from_messages(messages)) if url not in image_urls]
+        image_urls.update(new_urls)
+        poe_metrics.count('image_urls', len(new_urls))
+        if new_urls and on_new_images is not None:
+            on_new_images(new_urls)
 
-    driver = setup_driver()
-    
+    # A capture that lost history responses or never reached the start of
+    # the chat may have missed images
+    captured = capture_chat_messages(driver, max_scroll_time, scroll_wait_timeout, on_new_messages=handle_new_messages,
+                                     prune=prune)
+    return list(image_urls), captured.reached_start
+
+# Upper bound for the adaptive limit; one thread is started per slot
+DOWNLOAD_WORKERS = DEFAULT_MAX_LIMIT
+DOWNLOAD_MAX_ATTEMPTS = 5
+# Connect and read timeouts. A timeout is retried and lowers the limit.
+DOWNLOAD_TIMEOUT = (10, 30)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_QUEUE_SIZE = 200
+DOWNLOAD_ENGINE = os.getenv('POE_DOWNLOAD_ENGINE', 'threads')
+
+def create_http_session(pool_size=DOWNLOAD_WORKERS):
+    # One connection pool shared by all download workers, sized so every
+    # worker can keep its connection alive between images.
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def download_image(img_url, store, session=None, limiter=None, max_attempts=DOWNLOAD_MAX_ATTEMPTS):
+    # Returns a DownloadResult: stored is True only for the call that wrote
+    # the image into the store. With a limiter, every attempt waits for a
+    # slot and reports back how the server responded. A URL already in the
+    # store's URL cache is revalidated, or not requested at all in 'trust'
+    # mode while its entry is recent enough (see poe_url_cache).
+    with poe_metrics.phase('download'):
+        result, cached = _download_image(img_url, store, session, limiter, max_attempts)
+    if result.stored:
+        poe_metrics.count('images_stored')
+    elif cached:
+        poe_metrics.count('images_cached')
+    elif result.digest:
+        poe_metrics.count('duplicate_images')
+    else:
+        poe_metrics.count('download_failures')
+    return result
+
+def _download_image(img_url, store, session=None, limiter=None, max_attempts=DOWNLOAD_MAX_ATTEMPTS):
+    # Returns (result, cached); cached is True when the stored copy was used
+    # without downloading the image again
+    entry = poe_url_cache.cached_entry(store, img_url)
+    if poe_url_cache.is_trusted(entry):
+        logging.debug(f"Using the stored copy of {img_url}")
+        return DownloadResult(img_url, False, entry.digest, 0, None), True
+    headers = poe_url_cache.conditional_headers(entry)
+    http = session if session is not None else requests
+    error = None
+    for attempt in range(1, max_attempts + 1):
+        token = limiter.acquire() if limiter is not None else None
+        outcome, latency, retry_after, nbytes = 'error', None, None, 0
+        try:
+            start = time.perf_counter()
+            with http.get(img_url, timeout=DOWNLOAD_TIMEOUT, stream=True, headers=headers) as response:
+                latency = time.perf_counter() - start
+                if response.status_code == 304 and entry is not None:
+                    outcome = 'ok'
+                    store.url_cache.touch(img_url)
+                    poe_metrics.count('images_not_modified')
+                    logging.debug(f"Not modified since the last download: {img_url}")
+                    return DownloadResult(img_url, False, entry.digest, attempt, None), True
+                if response.status_code == 200:
+                    stored, img_hash, nbytes = _store_response(img_url, response, store)
+                    outcome = 'ok'
+                    poe_url_cache.record_download(store, img_url, response.headers, nbytes, img_hash)
+                    return DownloadResult(img_url, stored, img_hash, attempt, None), False
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    outcome = 'ok'
+                    break
+                outcome = 'throttled' if response.status_code in THROTTLE_STATUSES else 'error'
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                    error += f" (Retry-After {retry_after:.0f}s)"
+                    retry_after = MAX_RETRY_AFTER
+                    poe_metrics.count('retry_after_too_long')
+                    break
+        except requests.RequestException as e:
+            error = str(e) or type(e).__name__
+        except Exception as e:
+            # Not the server's doing, so the limit is left alone
+            outcome = 'ok'
+            logging.error(f"Error downloading image from {img_url}: {str(e)}")
+            return DownloadResult(img_url, False, None, attempt, str(e)), False
+        finally:
+            if limiter is not None:
+                limiter.release(token, outcome, latency, retry_after, nbytes)
+
+        if attempt < max_attempts:
+            poe_metrics.count('download_retries', reason=error if error.startswith('HTTP') else 'network')
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            logging.debug(f"Retrying {img_url} in {delay:.2f}s after {error} (attempt {attempt})")
+            time.sleep(delay)
+
+    logging.warning(f"Failed to download image from {img_url}: {error}")
+    return DownloadResult(img_url, False, None, attempt, error), False
+
+def _store_response(img_url, response, store):
+    temp_path = None
     try:
-        login_to_poe(driver, email)
+        # Stream the body to a temporary file, hashing it as it arrives, so
+        # memory use does not depend on the image size
+        img_hasher = hashlib.md5()
+        size = 0
+        fd, temp_path = store.temp_file()
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                img_hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+                poe_metrics.count('download_bytes', len(chunk))
+        img_hash = img_hasher.hexdigest()
         
-        logging.info(f"Navigating to chat URL: {url}")
+        file_extension = os.path.splitext(urlparse(img_url).path)[1] or '.jpg'
+        stored = store.publish(temp_path, img_hash, file_extension)
+        temp_path = None
+        if stored:
+            logging.debug(f"Saved {img_hash}{file_extension}")
+        else:
+            logging.debug(f"Duplicate image found for URL: {img_url}")
+        return stored, img_hash, size
+    finally:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+class DownloadPipeline:
+    # Download workers drain a bounded queue of image URLs while the browser is
+    # still scrolling. submit() blocks while the queue is full, which slows
+    # discovery down to the rate the downloads can keep up with. An
+    # AdaptiveLimiter decides how many of the workers download at once.
+    def __init__(self, store, workers=DOWNLOAD_WORKERS, queue_size=DOWNLOAD_QUEUE_SIZE, limiter=None):
+        self.store = store
+        self.results = []
+        self.limiter = limiter or AdaptiveLimiter(maximum=workers)
+        self._results_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._session = create_http_session(workers)
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _work(self):
+        while True:
+            img_url = self._queue.get()
+            if img_url is None:
+                return
+            result = download_image(img_url, self.store, self._session, self.limiter)
+            with self._results_lock:
+                self.results.append(result)
+
+    def submit(self, img_urls):
+        for img_url in img_urls:
+            self._queue.put(img_url)
+
+    def close(self):
+        # Lets the workers finish everything already queued, then stops them
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._session.close()
+        self.limiter.record_metrics()
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def create_download_pipeline(store, engine=None):
+    # 'threads' uses DownloadPipeline; 'asyncio' uses the aiohttp engine with
+    # per-host limits and retry/backoff
+    engine = engine or DOWNLOAD_ENGINE
+    if engine == 'asyncio':
+        from poe_async_downloader import AsyncDownloadPipeline
+        return AsyncDownloadPipeline(store)
+    if engine == 'threads':
+        return DownloadPipeline(store)
+    raise ValueError(f"Unknown download engine: {engine}")
+
+def export_chat_images(driver, url, save_dir, engine=None, discovery=None):
+    # Exports the images of one chat with an already logged-in driver and
+    # returns the number of new images added to the store. Raises
+    # IncompleteExportError, after storing the rest, if any image could not
+    # be downloaded or scrolling stopped before the start of the chat.
+    logging.info(f"Navigating to chat URL: {url}")
+    with poe_metrics.phase('page_load'):
         driver.get(url)
         
         try:
@@ -201,27 +361,73 @@ def save_poe_chat_images(url, save_dir):
             )
         except TimeoutException:
             logging.warning("Timeout waiting for chat messages to load. Proceeding anyway...")
-        
-        img_urls = scroll_and_collect_images(driver)
+    
+    store = ArchiveImageStore(get_archive(ARCHIVE)) if ARCHIVE else get_image_store(save_dir)
+    
+    # Images are downloaded as soon as they are discovered, overlapping the
+    # network work with the rest of the scroll
+    with create_download_pipeline(store, engine) as pipeline:
+        collect_images = collect_images_from_network if (discovery or IMAGE_DISCOVERY) == 'network' else scroll_and_collect_images
+        img_urls, complete = collect_images(driver, on_new_images=pipeline.submit)
         logging.info(f"Found {len(img_urls)} unique image URLs")
+    store.record_chat(url, pipeline.results)
+    
+    successful_downloads = 0
+    image_hashes = set()
+    failed_urls = []
+    for result in pipeline.results:
+        if result.stored:
+            successful_downloads += 1
+        if result.digest:
+            image_hashes.add(result.digest)
+        else:
+            failed_urls.append(result.url)
+    if failed_urls:
+        logging.warning(f"{len(failed_urls)} images could not be downloaded: {', '.join(failed_urls[:10])}")
+    
+    logging.info(f"Successfully downloaded {successful_downloads} new images ({len(image_hashes)} unique) out of {len(img_urls)} URLs")
+    if failed_urls:
+        raise IncompleteExportError(f"{len(failed_urls)} of {len(img_urls)} images of {url} could not be downloaded")
+    if not complete:
+        raise IncompleteExportError(f"Image export of {url} did not reach the start of the chat; older images are missing")
+    return successful_downloads
+
+def save_poe_chat_images(url, save_dir, engine=None):
+    # Returns the number of new images stored, or None if the export failed
+    # or some images could not be downloaded
+    email = os.getenv('POE_EMAIL')
+    stored = None
+
+    with poe_metrics.metrics_run('images') as run:
+        driver = setup_driver()
         
-        os.makedirs(save_dir, exist_ok=True)
-        
-        existing_hashes = set()
-        with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-            futures = [executor.submit(download_image, img_url, save_dir, i, existing_hashes) for i, img_url in enumerate(img_urls)]
-            for future in concurrent.futures.as_completed(futures):
-                success, img_hash = future.result()
-                if success and img_hash:
-                    existing_hashes.add(img_hash)
-        
-        successful_downloads = len(existing_hashes)
-        logging.info(f"Successfully downloaded {successful_downloads} unique images out of {len(img_urls)} URLs")
-        
-    finally:
-        driver.quit()
+        try:
+            ensure_logged_in(driver, email)
+            stored = export_chat_images(driver, url, save_dir, engine)
+        except IncompleteExportError as e:
+            logging.warning(str(e))
+            run.mark_failed()
+        except Exception as e:
+            logging.error(f"An error occurred: {str(e)}")
+            run.mark_failed()
+        finally:
+            driver.quit()
+    return stored
+
+def save_poe_chats_images(urls, save_dir, workers=3):
+    email = os.getenv('POE_EMAIL')
+    with poe_metrics.metrics_run('images') as run:
+        results = export_chats(urls, save_dir, setup_driver, export_chat_images, email, workers=workers)
+        if any(isinstance(result, Exception) for result in results.values()):
+            run.mark_failed()
+    return results
 
 if __name__ == "__main__":
-    poe_chat_url = input("Enter the Poe chat URL: ")
+    poe_chat_urls = parse_chat_urls(input("Enter the Poe chat URL (separate several URLs with spaces): "))
     save_directory = input("Enter the directory to save images (default: PoeChatImages): ") or "PoeChatImages"
-    save_poe_chat_images(poe_chat_url, save_directory)
+    if len(poe_chat_urls) > 1:
+        save_poe_chats_images(poe_chat_urls, save_directory)
+    elif poe_chat_urls:
+        save_poe_chat_images(poe_chat_urls[0], save_directory)
+    else:
+        print("No chat URL given")
@@ -0,0 +1,133 @@
+import os
+import re
+import logging
+import tempfile
+import threading
+from collections import namedtuple
+from poe_url_cache import UrlCache
+
+# Matches files written by the store (<digest>.<ext>) as well as the older
+# image_<index>_<digest>.<ext> names, so existing export directories are indexed.
+STORED_FILE_PATTERN = re.compile(r'^(?:image_\d+_)?([0-9a-f]{32,64})\.[A-Za-z0-9]+$')
+
+# Per-URL outcome of fetching an image into a store. stored is True only for the
+# download that wrote the file; error is None unless the download failed.
+DownloadResult = namedtuple('DownloadResult', ['url', 'stored', 'digest', 'attempts', 'error'])
+
+# Exporter state kept with the images, out of the way of the image files
+STATE_DIR = '.poe_state'
+URL_CACHE_FILE = 'url_cache.sqlite'
+# Where earlier versions kept the URL cache
+OLD_URL_CACHE_FILE = '.poe_url_cache.sqlite'
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+class ImageStore:
+    # Content-addressed image directory. Every image is stored once under its
+    # digest; claims are tracked in a thread-safe index and files are published
+    # with an atomic link/rename, so concurrent exports (threads or processes)
+    # into the same directory never write the same content twice.
+    def __init__(self, save_dir):
+        self.save_dir = save_dir
+        os.makedirs(save_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = {}
+        self._url_cache = None
+        for name in os.listdir(save_dir):
+            match = STORED_FILE_PATTERN.match(name)
+            if match:
+                self._index.setdefault(match.group(1), os.path.join(save_dir, name))
+
+    def __contains__(self, digest):
+        with self._lock:
+            return digest in self._index
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index)
+
+    @property
+    def url_cache(self):
+        # Opened on first use, so stores that never download create no file
+        with self._lock:
+            if self._url_cache is None:
+                path = os.path.join(self.save_dir, STATE_DIR, URL_CACHE_FILE)
+                move_old_url_cache(os.path.join(self.save_dir, OLD_URL_CACHE_FILE), path)
+                self._url_cache = UrlCache(path)
+            return self._url_cache
+
+    def path_for(self, digest):
+        with self._lock:
+            return self._index.get(digest)
+
+    def temp_file(self):
+        # Temporary files live in the store directory so publishing them is a
+        # same-filesystem rename
+        return tempfile.mkstemp(dir=self.save_dir, prefix='.download_', suffix='.part')
+
+    def _claim(self, digest, path):
+        with self._lock:
+            if digest in self._index:
+                return False
+            self._index[digest] = path
+            return True
+
+    def _release(self, digest):
+        with self._lock:
+            self._index.pop(digest, None)
+
+    def publish(self, temp_path, digest, extension):
+        # Moves temp_path into the store as <digest><extension>. Returns True if
+        # this call stored the image, False if it was already present. The
+        # temporary file is always consumed.
+        file_path = os.path.join(self.save_dir, f"{digest}{extension}")
+        try:
+            if not self._claim(digest, file_path):
+                return False
+            try:
+                # link() fails if another process already published this
+                # digest, which makes the claim atomic across processes too
+                os.link(temp_path, file_path)
+            except FileExistsError:
+                return False
+            except OSError:
+                # Filesystem without hard links; same content, so replacing is safe
+                try:
+                    os.replace(temp_path, file_path)
+                except BaseException:
+                    self._release(digest)
+                    raise
+            except BaseException:
+                self._release(digest)
+                raise
+            return True
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def record_chat(self, chat_url, results):
+        # Files are named by digest only; ArchiveImageStore records which
+        # chat each image came from
+        pass
+
+def move_old_url_cache(old_path, path):
+    # Carries a cache from the image directory itself into the state directory,
+    # together with its WAL and shared-memory files
+    if not os.path.exists(old_path) or os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for suffix in ('-wal', '-shm', ''):
+        if os.path.exists(old_path + suffix):
+            os.replace(old_path + suffix, path + suffix)
+    logging.info(f"Moved the image URL cache to {path}")
+
+def get_image_store(save_dir):
+    # Exports running in the same process share one index per directory
+    key = os.path.abspath(save_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ImageStore(save_dir)
+            logging.debug(f"Indexed {len(store)} existing images in {save_dir}")
+        return store
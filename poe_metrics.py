@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Process-wide instrumentation shared by the exporters. Each run records how
+# long it spends in every phase (driver start, login, page load, scroll
+# passes, extraction, downloads, writing) and counts WebDriver calls, bytes,
+# duplicates and retries. When a run finishes its summary is logged, and if
+# POE_METRICS_DIR is set it is also written there as
+# poe_export_<run>.json and poe_export_<run>.prom (a Prometheus textfile
+# for the node exporter's textfile collector).
+METRICS_DIR = os.getenv('POE_METRICS_DIR')
+METRIC_PREFIX = 'poe_export'
+
+class RunMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.duration = None
+        self.success = True
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._phase_seconds = Counter()
+        self._phase_counts = Counter()
+        self._phase_max = {}
+        self._counters = Counter()
+        self._gauges = {}
+
+    def add_duration(self, phase, seconds):
+        with self._lock:
+            self._phase_seconds[phase] += seconds
+            self._phase_counts[phase] += 1
+            self._phase_max[phase] = max(seconds, self._phase_max.get(phase, 0.0))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_duration(name, time.perf_counter() - start)
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def counter(self, name):
+        # Total of a counter over all of its labels
+        with self._lock:
+            return sum(value for (counter_name, _), value in self._counters.items() if counter_name == name)
+
+    def set_gauge(self, name, value):
+        # Last value wins, for levels such as a concurrency limit or a rate
+        with self._lock:
+            self._gauges[name] = value
+
+    def mark_failed(self):
+        self.success = False
+
+    def finish(self, success=True):
+        self.success = self.success and success
+        self.duration = time.perf_counter() - self._start
+
+    def summary(self):
+        with self._lock:
+            phases = {
+                phase: {
+                    'count': self._phase_counts[phase],
+                    'seconds': round(self._phase_seconds[phase], 4),
+                    'max_seconds': round(self._phase_max[phase], 4),
+                }
+                for phase in sorted(self._phase_seconds)
+            }
+            counters = Counter()
+            labelled = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters[name] += value
+                if labels:
+                    label_text = ','.join(f"{key}={value_}" for key, value_ in labels)
+                    labelled.setdefault(name, {})[label_text] = value
+            gauges = dict(sorted(self._gauges.items()))
+        duration = self.duration if self.duration is not None else time.perf_counter() - self._start
+        return {
+            'run': self.name,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'duration_seconds': round(duration, 3),
+            'success': self.success,
+            'phases': phases,
+            'counters': dict(counters),
+            'counter_labels': labelled,
+            'gauges': gauges,
+        }
+
+_current = RunMetrics('default')
+
+def current_run():
+    return _current
+
+def start_run(name):
+    global _current
+    _current = RunMetrics(name)
+    return _current
+
+# These act on whichever run is current when they are called, so drivers and
+# helpers created before a run started still report into it.
+
+def phase(name):
+    return _current.phase(name)
+
+def add_duration(name, seconds):
+    _current.add_duration(name, seconds)
+
+def count(name, amount=1, **labels):
+    _current.count(name, amount, **labels)
+
+def set_gauge(name, value):
+    _current.set_gauge(name, value)
+
+def instrument_driver(driver):
+    # Every WebDriver command, including those issued through WebElements and
+    # CDP calls, goes through driver.execute
+    execute = driver.execute
+
+    def counted_execute(driver_command, params=None):
+        count('webdriver_calls', command=driver_command)
+        return execute(driver_command, params)
+
+    driver.execute = counted_execute
+    return driver
+
+def finish_run(run=None, success=True, metrics_dir=None):
+    run = run or _current
+    run.finish(success)
+    summary = run.summary()
+    phases = ', '.join(f"{name} {stats['seconds']:.2f}s/{stats['count']}" for name, stats in summary['phases'].items())
+    logging.info(f"Run '{run.name}' finished in {summary['duration_seconds']:.2f}s ({'ok' if run.success else 'failed'}); "
+                 f"phases: {phases or 'none'}; counters: {json.dumps(summary['counters'])}")
+    metrics_dir = metrics_dir or METRICS_DIR
+    if metrics_dir:
+        write_summary_files(summary, metrics_dir)
+    return summary
+
+@contextmanager
+def metrics_run(name, metrics_dir=None):
+    # Starts a run and finishes it however the block exits. Code that handles
+    # its own errors can call run.mark_failed() to record the failure.
+    run = start_run(name)
+    success = False
+    try:
+        yield run
+        success = True
+    finally:
+        finish_run(run, success, metrics_dir)
+
+def metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', f"{METRIC_PREFIX}_{name}")
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(labels):
+    return '{' + ','.join(f'{key}="{label_value(value)}"' for key, value in labels.items()) + '}'
+
+def prometheus_text(summary):
+    run_labels = {'run': summary['run']}
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        full_name = metric_name(name)
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{full_name}{format_labels({**run_labels, **labels})} {value}")
+
+    metric('last_run_timestamp_seconds', 'gauge', "Unix time the last run finished.",
+           [({}, round(time.time(), 3))])
+    metric('last_run_duration_seconds', 'gauge', "Wall time of the last run.",
+           [({}, summary['duration_seconds'])])
+    metric('last_run_success', 'gauge', "1 if the last run succeeded, 0 otherwise.",
+           [({}, int(summary['success']))])
+    metric('phase_seconds', 'gauge', "Time the last run spent in each phase.",
+           [({'phase': phase}, stats['seconds']) for phase, stats in summary['phases'].items()])
+    metric('phase_count', 'gauge', "Times each phase ran in the last run.",
+           [({'phase': phase}, stats['count']) for phase, stats in summary['phases'].items()])
+    metric('phase_max_seconds', 'gauge', "Longest single instance of each phase in the last run.",
+           [({'phase': phase}, stats['max_seconds']) for phase, stats in summary['phases'].items()])
+    for name, total in summary['counters'].items():
+        breakdown = summary['counter_labels'].get(name)
+        if breakdown:
+            samples = [(dict(pair.split('=', 1) for pair in label_text.split(',')), value)
+                       for label_text, value in breakdown.items()]
+        else:
+            samples = [({}, total)]
+        metric(name, 'gauge', f"{name.replace('_', ' ').capitalize()} in the last run.", samples)
+    for name, value in summary.get('gauges', {}).items():
+        metric(name, 'gauge', f"{name.replace('_', ' ').capitalize()} at the end of the last run.", [({}, value)])
+    return '\n'.join(lines) + '\n'
+
+def write_atomically(path, text):
+    # The textfile collector may read at any moment, so never expose a
+    # half-written file
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+def write_summary_files(summary, metrics_dir):
+    os.makedirs(metrics_dir, exist_ok=True)
+    base = os.path.join(metrics_dir, metric_name(summary['run']))
+    try:
+        write_atomically(f"{base}.json", json.dumps(summary, indent=2))
+        write_atomically(f"{base}.prom", prometheus_text(summary))
+    except OSError as e:
+        logging.error(f"Could not write metrics to {metrics_dir}: {str(e)}")
+        return None
+    logging.debug(f"Metrics written to {base}.json and {base}.prom")
+    return base
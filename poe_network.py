@@ -0,0 +1,267 @@
+import re
+import json
+import time
+import logging
+from selenium.common.exceptions import WebDriverException
+from poe_browser import prune_read_pairs, scroll_up_and_wait
+from poe_metrics import count, phase
+
+# Poe pages through chat history with GraphQL POSTs; the stand-in benchmark
+# site serves the same path
+DEFAULT_RESPONSE_FILTER = '/api/gql_POST'
+IMAGE_URL_PATTERN = re.compile(r'(https?://\S+?\.(?:jpg|jpeg|png|gif|webp))', re.IGNORECASE)
+NEXT_DATA_JS = "const el = document.getElementById('__NEXT_DATA__'); return el ? el.textContent : null;"
+
+# Seconds before fetching a response body a second time
+BODY_RETRY_DELAY = 0.2
+
+class NetworkResponseReader:
+    # Reads the decoded JSON bodies of matching responses from the Chrome
+    # performance log; the driver must be started with capture_network=True.
+    # A body can only be fetched once Chrome has finished loading it, so each
+    # matching request is tracked by requestId from Network.responseReceived
+    # until Network.loadingFinished. A body that cannot be read is counted in
+    # lost, and the caller must treat what it captured as incomplete.
+    def __init__(self, driver, response_filter=DEFAULT_RESPONSE_FILTER):
+        self.driver = driver
+        self.response_filter = response_filter
+        self.pending = {}  # requestId -> url
+        self.lost = 0
+
+    def drain(self):
+        # Returns the bodies of the responses that finished loading since the
+        # last call
+        payloads = []
+        for entry in self.driver.get_log('performance'):
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            method = message.get('method')
+            params = message.get('params') or {}
+            request_id = params.get('requestId')
+            if method == 'Network.responseReceived':
+                response = params.get('response', {})
+                if self.response_filter in response.get('url', '') and 'json' in response.get('mimeType', ''):
+                    self.pending[request_id] = response.get('url')
+            elif method == 'Network.loadingFinished' and request_id in self.pending:
+                payload = self._read_body(request_id, self.pending.pop(request_id))
+                if payload is not None:
+                    payloads.append(payload)
+            elif method == 'Network.loadingFailed' and request_id in self.pending:
+                self._lose(self.pending.pop(request_id), params.get('errorText'))
+        return payloads
+
+    def finish(self, timeout=5):
+        # Drains once more, waiting up to timeout for responses still loading;
+        # any that do not finish are lost
+        payloads = self.drain()
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            time.sleep(0.1)
+            payloads.extend(self.drain())
+        for url in self.pending.values():
+            self._lose(url, "did not finish loading")
+        self.pending.clear()
+        return payloads
+
+    def _read_body(self, request_id, url):
+        for attempt in (1, 2):
+            try:
+                body = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+                payload = json.loads(body['body'])
+            except (WebDriverException, KeyError, ValueError) as e:
+                error = e
+                if attempt == 1:
+                    time.sleep(BODY_RETRY_DELAY)
+                continue
+            count('api_responses')
+            count('api_response_bytes', len(body['body']))
+            return payload
+        self._lose(url, error)
+        return None
+
+    def _lose(self, url, reason):
+        self.lost += 1
+        count('api_responses_lost')
+        logging.warning(f"Could not read the response body of {url}: {reason}")
+
+def iter_message_nodes(payload):
+    # Walks a payload of any shape and yields every dict that looks like a chat
+    # message node
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if 'messageId' in node and 'author' in node and 'text' in node:
+                yield node
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+
+def iter_chat_nodes(payload):
+    # Yields every dict that looks like an entry of the chat history list
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if 'chatCode' in node and 'lastInteractionTime' in node:
+                yield node
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+
+def has_previous_page(payload):
+    # False once any page info in the payload says the start of the chat is loaded
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            page_info = node.get('pageInfo')
+            if isinstance(page_info, dict) and page_info.get('hasPreviousPage') is False:
+                return False
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return True
+
+# Pair keys built from message ids, told apart from the page's element ids
+PAIR_KEY_PREFIX = "api:"
+
+class NetworkMessageCollector:
+    # Chat messages rebuilt from captured API payloads, keyed by message id
+    def __init__(self):
+        self._messages = {}
+        self.reached_start = False
+
+    def __len__(self):
+        return len(self._messages)
+
+    def add_payload(self, payload):
+        new_messages = []
+        for node in iter_message_nodes(payload):
+            message_id = str(node['messageId'])
+            if message_id in self._messages or node.get('author') == 'chat_break':
+                continue
+            self._messages[message_id] = node
+            new_messages.append(node)
+        if not has_previous_page(payload):
+            self.reached_start = True
+        return new_messages
+
+    def add_payloads(self, payloads):
+        new_messages = []
+        for payload in payloads:
+            new_messages.extend(self.add_payload(payload))
+        return new_messages
+
+    def ordered_messages(self):
+        return sorted(self._messages.values(), key=message_sort_key)
+
+    def pairs(self):
+        # Pairs each human message with the bot reply that follows it, in the
+        # same (human, bot, key) form the DOM extractors produce. The key is
+        # the human message's id, or the bot's for a reply with no prompt.
+        pairs = []
+        human = None
+        for message in self.ordered_messages():
+            if message.get('author') == 'human':
+                if human is not None:
+                    pairs.append((human.get('text') or "", "", message_pair_key(human)))
+                human = message
+            else:
+                owner = human if human is not None else message
+                pairs.append(((human or {}).get('text') or "", message.get('text') or "", message_pair_key(owner)))
+                human = None
+        if human is not None:
+            pairs.append((human.get('text') or "", "", message_pair_key(human)))
+        return pairs
+
+def message_pair_key(message):
+    return f"{PAIR_KEY_PREFIX}{message['messageId']}"
+
+def message_sort_key(message):
+    try:
+        return (0, int(message.get('creationTime') or 0), int(message['messageId']))
+    except (TypeError, ValueError):
+        return (1, 0, str(message['messageId']))
+
+def image_urls_from_messages(messages):
+    urls = []
+    for message in messages:
+        urls.extend(IMAGE_URL_PATTERN.findall(message.get('text') or ""))
+        for attachment in message.get('attachments') or []:
+            url = attachment.get('url') if isinstance(attachment, dict) else None
+            if url and url.startswith('http'):
+                urls.append(url)
+    return urls
+
+def capture_chat_messages(driver, max_scroll_time=600, scroll_wait_timeout=5, response_filter=DEFAULT_RESPONSE_FILTER,
+                          on_new_messages=None, prune=False):
+    # Scrolls up through the chat only to make the page request older history,
+    # and rebuilds the messages from the JSON it receives instead of the DOM.
+    # on_new_messages, if given, is called with each pass's new message nodes.
+    # The rendered messages are never read, so prune can hide them freely.
+    logging.info("Scrolling and capturing chat history responses...")
+    start_time = time.time()
+    collector = NetworkMessageCollector()
+    no_new_messages_count = 0
+    max_no_new_messages = 5
+
+    # The first page is rendered server-side and embedded in the page
+    initial = driver.execute_script(NEXT_DATA_JS)
+    payloads = []
+    if initial:
+        try:
+            payloads.append(json.loads(initial))
+        except ValueError:
+            logging.debug("Could not parse the embedded page data")
+
+    reader = NetworkResponseReader(driver, response_filter)
+    at_top = False
+    while True:
+        with phase('network_drain'):
+            payloads.extend(reader.drain())
+        new_messages = collector.add_payloads(payloads)
+        payloads = []
+
+        if new_messages:
+            logging.info(f"Captured {len(new_messages)} new messages ({len(collector)} total)")
+            no_new_messages_count = 0
+            if on_new_messages is not None:
+                on_new_messages(new_messages)
+        else:
+            no_new_messages_count += 1
+            logging.info(f"No new messages captured. Count: {no_new_messages_count}")
+
+        if collector.reached_start or at_top:
+            logging.info("Reached the start of the chat history.")
+            collector.reached_start = True
+            break
+        if no_new_messages_count >= max_no_new_messages:
+            logging.info("No new history received. Stopping scroll.")
+            break
+        if time.time() - start_time >= max_scroll_time:
+            logging.warning("Stopped capturing after the time limit; older messages were not loaded")
+            break
+
+        scroll_result = scroll_up_and_wait(driver, timeout=scroll_wait_timeout)
+        if prune:
+            prune_read_pairs(driver)
+        if not scroll_result['trigger']:
+            # One more pass collects whatever the last scroll fetched
+            logging.info("Infinite scroll trigger not found. Might have reached the top.")
+            at_top = True
+
+    # Responses still loading when scrolling stopped
+    with phase('network_drain'):
+        new_messages = collector.add_payloads(reader.finish())
+    if new_messages and on_new_messages is not None:
+        on_new_messages(new_messages)
+    if reader.lost:
+        # A lost page leaves a hole in the history even if the start was seen
+        logging.warning(f"{reader.lost} history responses could not be read; the captured chat is incomplete")
+        collector.reached_start = False
+
+    logging.info(f"Capture completed in {time.time() - start_time:.2f} seconds")
+    return collector
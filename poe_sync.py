@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import logging
+import threading
+import functools
+from datetime import datetime
+from dotenv import load_dotenv
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from poe_auth import POE_BASE_URL, ensure_logged_in
+from poe_batch import export_chats
+from poe_browser import setup_driver, scroll_down_and_wait
+from poe_network import NEXT_DATA_JS, NetworkResponseReader, iter_chat_nodes
+import poe_metrics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+load_dotenv()
+
+# Account-wide sync: lists every chat on the account, compares each chat's
+# last-activity marker with the one recorded when it was last exported, and
+# exports only the chats that changed. The index lives in the output
+# directory, so text and image syncs keep separate ones.
+CHAT_LIST_URL = f"{POE_BASE_URL}/chats"
+CHAT_LIST_CONTAINER_SELECTOR = "div[class*='ChatHistoryListWrapper']"
+CHAT_LIST_ITEM_SELECTOR = "a[class*='ChatHistoryListItem_wrapper']"
+CHAT_LIST_TIME_SELECTOR = "[class*='ChatHistoryListItem_time']"
+CHAT_LIST_PREVIEW_SELECTOR = "[class*='ChatHistoryListItem_messagePreview']"
+CHAT_LIST_SEEN_ATTRIBUTE = "data-poe-export-listed"
+SYNC_INDEX_FILE = ".poe_sync_index.json"
+SYNC_KINDS = ('text', 'images')
+
+# Returns the chat links inserted since the last call with the time and
+# message preview shown for each, and marks them so they are read only once
+READ_NEW_CHATS_JS = """
+const itemSelector = arguments[0], timeSelector = arguments[1], previewSelector = arguments[2];
+const seenAttribute = arguments[3];
+const text = (item, selector) => {
+    const element = item.querySelector(selector);
+    return element ? element.textContent.trim() : '';
+};
+const chats = [];
+for (const item of document.querySelectorAll(itemSelector + ':not([' + seenAttribute + '])')) {
+    item.setAttribute(seenAttribute, '1');
+    chats.push({url: item.href, marker: text(item, timeSelector) + '\\n' + text(item, previewSelector)});
+}
+return chats;
+"""
+
+def chat_url_for_code(chat_code):
+    return f"{POE_BASE_URL}/chat/{chat_code}"
+
+def normalize_chat_url(url):
+    return (url or '').split('#', 1)[0].split('?', 1)[0].rstrip('/')
+
+def discover_chats(driver, max_scroll_time=600, scroll_wait_timeout=5):
+    # Scrolls through the chat history list and returns {chat_url: marker},
+    # most recently active first. The marker is the chat's lastInteractionTime
+    # from the list's API responses when the driver captures network traffic,
+    # and otherwise the time and preview the list shows. The shown time is
+    # relative ("Yesterday"), so without network capture a chat may be
+    # exported again when its label ages even though nothing was added.
+    logging.info(f"Listing chats from {CHAT_LIST_URL}")
+    with poe_metrics.phase('page_load'):
+        driver.get(CHAT_LIST_URL)
+        try:
+            WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.CSS_SELECTOR, CHAT_LIST_ITEM_SELECTOR)))
+        except TimeoutException:
+            logging.warning("Timeout waiting for the chat list to load. Proceeding anyway...")
+
+    start_time = time.time()
+    listed = {}
+    network_markers = {}
+    reader = NetworkResponseReader(driver)
+    payloads = []
+    initial = driver.execute_script(NEXT_DATA_JS)
+    if initial:
+        try:
+            payloads.append(json.loads(initial))
+        except ValueError:
+            logging.debug("Could not parse the embedded page data")
+    no_new_chats_count = 0
+    max_no_new_chats = 5
+    at_end = False
+
+    while True:
+        if reader is not None:
+            try:
+                with poe_metrics.phase('network_drain'):
+                    payloads.extend(reader.drain())
+            except WebDriverException:
+                logging.info("Network capture is not enabled; using the markers shown in the chat list")
+                reader = None
+        for payload in payloads:
+            for node in iter_chat_nodes(payload):
+                network_markers[chat_url_for_code(node['chatCode'])] = str(node['lastInteractionTime'])
+        payloads = []
+
+        new_chats = 0
+        for chat in driver.execute_script(
+            READ_NEW_CHATS_JS,
+            CHAT_LIST_ITEM_SELECTOR, CHAT_LIST_TIME_SELECTOR, CHAT_LIST_PREVIEW_SELECTOR, CHAT_LIST_SEEN_ATTRIBUTE,
+        ) or []:
+            url = normalize_chat_url(chat.get('url'))
+            if url and url not in listed:
+                listed[url] = chat.get('marker', '').strip()
+                new_chats += 1
+
+        if new_chats:
+            logging.info(f"Found {len(listed)} chats so far...")
+            no_new_chats_count = 0
+        else:
+            no_new_chats_count += 1
+
+        if at_end:
+            logging.info("Reached the end of the chat list.")
+            break
+        if no_new_chats_count >= max_no_new_chats:
+            logging.info("No new chats listed. Stopping scroll.")
+            break
+        if time.time() - start_time >= max_scroll_time:
+            logging.warning("Stopped listing chats after the time limit; older chats were not checked")
+            break
+
+        scroll_result = scroll_down_and_wait(driver, CHAT_LIST_CONTAINER_SELECTOR, timeout=scroll_wait_timeout)
+        if not scroll_result['trigger']:
+            # One more pass reads whatever the last scroll loaded
+            at_end = True
+
+    if reader is not None:
+        # Responses still loading when scrolling stopped
+        with poe_metrics.phase('network_drain'):
+            payloads = reader.finish()
+        for payload in payloads:
+            for node in iter_chat_nodes(payload):
+                network_markers[chat_url_for_code(node['chatCode'])] = str(node['lastInteractionTime'])
+
+    # Chats seen only in API responses are included too
+    chats = {url: network_markers.get(url, marker) for url, marker in listed.items()}
+    for url, marker in network_markers.items():
+        chats.setdefault(url, marker)
+    poe_metrics.count('chats_listed', len(chats))
+    logging.info(f"Listed {len(chats)} chats in {time.time() - start_time:.2f} seconds")
+    return chats
+
+def sync_index_path(save_dir):
+    return os.path.join(save_dir, SYNC_INDEX_FILE)
+
+def load_sync_index(save_dir):
+    index_file = sync_index_path(save_dir)
+    if not os.path.exists(index_file):
+        return {'chats': {}}
+    try:
+        with open(index_file, encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable sync index {index_file}: {str(e)}")
+        return {'chats': {}}
+    index.setdefault('chats', {})
+    return index
+
+def write_sync_index(save_dir, index):
+    os.makedirs(save_dir, exist_ok=True)
+    index_file = sync_index_path(save_dir)
+    temp_file = f"{index_file}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(temp_file, index_file)
+
+def changed_chats(chats, index, full=False):
+    # Chats never exported, or whose marker differs from the recorded one.
+    # An empty marker says nothing about the chat, so it counts as changed.
+    recorded = index['chats']
+    return [url for url, marker in chats.items()
+            if full or not marker or recorded.get(url, {}).get('marker') != marker]
+
+def chat_exporter(kind, output_format='text', engine=None):
+    # Returns (setup_driver, export_chat) for the kind of export
+    if kind == 'text':
+        import poe_text_downloader
+        poe_text_downloader.check_output_format(output_format)
+        # Changed chats only need the messages added since their last export
+        return poe_text_downloader.setup_driver, functools.partial(
+            poe_text_downloader.export_chat_text, delta=True, output_format=output_format)
+    if kind == 'images':
+        import poe_image_downloader
+        return poe_image_downloader.setup_driver, functools.partial(poe_image_downloader.export_chat_images, engine=engine)
+    raise ValueError(f"Unknown sync kind: {kind}")
+
+def sync_account(save_dir, kind='text', workers=3, output_format='text', engine=None, full=False):
+    # Exports every chat that changed since the last sync into save_dir and
+    # returns {url: result} for the chats it exported. A chat is recorded in
+    # the index as soon as its export finishes, so an interrupted sync picks
+    # up where it stopped. A chat whose export failed or was incomplete
+    # (IncompleteExportError) is not recorded and is tried again next time.
+    email = os.getenv('POE_EMAIL')
+    setup_chat_driver, export_chat = chat_exporter(kind, output_format, engine)
+
+    with poe_metrics.metrics_run(f'sync_{kind}') as run:
+        driver = setup_driver(lean=True, capture_network=True)
+        try:
+            ensure_logged_in(driver, email)
+            chats = discover_chats(driver)
+        finally:
+            driver.quit()
+
+        index = load_sync_index(save_dir)
+        pending = changed_chats(chats, index, full)
+        poe_metrics.count('chats_unchanged', len(chats) - len(pending))
+        logging.info(f"{len(pending)} of {len(chats)} chats changed since the last sync")
+        index_lock = threading.Lock()
+
+        def export_and_record(driver, url, save_dir):
+            result = export_chat(driver, url, save_dir)
+            with index_lock:
+                index['chats'][url] = {'marker': chats[url], 'exported_at': datetime.now().isoformat(timespec='seconds')}
+                write_sync_index(save_dir, index)
+            return result
+
+        results = export_chats(pending, save_dir, setup_chat_driver, export_and_record, email, workers=workers)
+        with index_lock:
+            index['synced_at'] = datetime.now().isoformat(timespec='seconds')
+            write_sync_index(save_dir, index)
+        if any(isinstance(result, Exception) for result in results.values()) or len(results) < len(pending):
+            run.mark_failed()
+    return results
+
+if __name__ == "__main__":
+    sync_kind = input(f"What to sync ({', '.join(SYNC_KINDS)}; default: text): ").strip() or 'text'
+    default_directory = "PoeChatImages" if sync_kind == 'images' else "PoeChatTranscripts"
+    save_directory = input(f"Enter the directory to sync into (default: {default_directory}): ") or default_directory
+    synced = sync_account(save_directory, sync_kind)
+    print(f"Exported {sum(1 for result in synced.values() if not isinstance(result, Exception))} changed chats")
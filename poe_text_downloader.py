@@ -1,6 +1,4 @@
 import os
-import sys
-import signal
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -11,101 +9,324 @@ from selenium.webdriver.common.action_chains import ActionChains
 from datetime import datetime
 from urllib.parse import urlparse
 import time
+import hashlib
+import json
+import functools
+import itertools
+import re
 from dotenv import load_dotenv
 import logging
+from poe_auth import ensure_logged_in
+from poe_browser import (HIDE_PAIRS_JS, MESSAGE_PAIR_SELECTOR, PRUNED_ATTRIBUTE, env_flag, scroll_up_and_wait,
+                         setup_driver as poe_setup_driver, wait_for_dom_quiet)
+from poe_batch import IncompleteExportError, export_chats, parse_chat_urls
+from poe_network import PAIR_KEY_PREFIX, capture_chat_messages
+from poe_transcript import TRANSCRIPT_FORMATS, DiskKeySet, TranscriptSpool, check_output_format, write_transcript
+from poe_archive import get_archive
+import poe_metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 load_dotenv()
 
-def setup_driver():
-    options = webdriver.ChromeOptions()
-    options.add_argument("start-maximized")
-    return webdriver.Chrome(options=options)
+# Only text is read here, so by default run a headless browser that skips
+# images, fonts and analytics. Set POE_TEXT_LEAN_BROWSER=0 for a full,
+# visible browser.
+LEAN_BROWSER = env_flag('POE_TEXT_LEAN_BROWSER', default=True)
+# 'script' and 'elements' read the rendered DOM; 'network' rebuilds the chat
+# from the API responses the page fetches while paging.
+EXTRACTION = os.getenv('POE_TEXT_EXTRACTION', 'script')
+# Low-memory mode hides message pairs in the page once they have been read
+# and keeps the pair index on disk, so memory grows slowly however long the chat.
+LOW_MEMORY = env_flag('POE_LOW_MEMORY')
+# Path of a poe_archive file to store transcripts in instead of writing a
+# transcript file per run. A chat's checkpoint and spool stay in the save
+# directory only until its export is complete; a delta run rebuilds its
+# spool from the archive.
+ARCHIVE = os.getenv('POE_ARCHIVE')
 
-def login_to_poe(driver, email):
+def setup_driver():
+    return poe_setup_driver(lean=LEAN_BROWSER, capture_network=EXTRACTION == 'network')
+
+# Pair ids come from the page's elements or, with network extraction, from
+# the API's message ids (PAIR_KEY_PREFIX). The text of a pair stored with an
+# id is indexed per kind of id, apart from that of pairs stored without one.
+PAIR_KEY_KINDS = ('dom', 'api')
+
+def pair_key_kind(dom_key):
+    return 'api' if dom_key.startswith(PAIR_KEY_PREFIX) else 'dom'
+
+class MessageCollector:
+    # Ordered, indexed store of (human, bot) pairs. Pairs are grouped into
+    # batches as they are discovered while paging upward, so each batch is older
+    # than the one before it. A batch item may carry the page's id for the pair
+    # as a third element: such pairs are told apart by that id, so two identical
+    # exchanges ("ok" / "Sure!") are both kept. Pairs without one are keyed by
+    # their text, and a pair with an id still matches one with the same text
+    # stored without an id, or with another kind of id (by another
+    # extraction mode or an older version).
+    # With a TranscriptSpool the pairs are kept on disk and only
+    # their keys stay in memory; pass a DiskKeySet as index to keep the keys on
+    # disk as well.
+    #
+    # A resumed run starts again at the bottom of the chat, below the pairs
+    # already in the spool. Pass a second spool as newer: pairs met before the
+    # first already-collected one were posted since, and are kept there until
+    # merge_newer() puts them in front of the spool. Pairs found after it are
+    # older and are appended to the spool as usual.
+    def __init__(self, spool=None, index=None, newer=None):
+        self._index = index if index is not None else set()
+        self._pairs = spool if spool is not None else []
+        self._dom_keys = []  # Parallel to _pairs when there is no spool
+        self._spool = spool
+        self._newer = newer
+        self._newer_keys = set()
+        self.complete = False  # Set once scrolling has reached the top of the chat
+        for dom_key, human_message, bot_message in self.iter_keyed():
+            self._index.update(self.index_keys(human_message, bot_message, dom_key))
+        self._reached_collected = newer is None or not len(self._pairs)
+
+    @staticmethod
+    def pair_key(human_message, bot_message):
+        return hashlib.sha1(f"{human_message}\x00{bot_message}".encode('utf-8')).hexdigest()
+
+    @classmethod
+    def index_keys(cls, human_message, bot_message, dom_key=None):
+        # The keys a stored pair is indexed by. The text of a pair with an id
+        # is indexed under the kind of id, so items with the same kind of id
+        # do not look it up.
+        content_key = cls.pair_key(human_message, bot_message)
+        return [dom_key, f"{pair_key_kind(dom_key)}-text:{content_key}"] if dom_key else [content_key]
+
+    @classmethod
+    def lookup_keys(cls, item):
+        # The index keys an extracted (human, bot[, dom_key]) item matches: a
+        # pair with its id, or with its text and no id or another kind of id;
+        # an item without an id matches any pair with its text
+        content_key = cls.pair_key(item[0], item[1])
+        dom_key = item[2] if len(item) > 2 else None
+        kinds = [kind for kind in PAIR_KEY_KINDS if not dom_key or kind != pair_key_kind(dom_key)]
+        return ([dom_key] if dom_key else []) + [content_key] + [f"{kind}-text:{content_key}" for kind in kinds]
+
+    @classmethod
+    def seen_in(cls, keys, item):
+        return any(key in keys for key in cls.lookup_keys(item))
+
+    def __len__(self):
+        return len(self._pairs) + (len(self._newer) if self._newer is not None else 0)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def add_batch(self, batch):
+        # batch is in DOM order (oldest first); store it newest first so the
+        # whole list can be reversed once at the end.
+        added = 0
+        for item in reversed(batch):
+            if self.seen_in(self._index, item):
+                if not self.seen_in(self._newer_keys, item):
+                    self._reached_collected = True
+                continue
+            human_message, bot_message = item[0], item[1]
+            dom_key = item[2] if len(item) > 2 else None
+            self._index.update(self.index_keys(human_message, bot_message, dom_key))
+            if not self._reached_collected:
+                self._newer.append((human_message, bot_message), dom_key)
+                self._newer_keys.update(self.index_keys(human_message, bot_message, dom_key))
+            elif self._spool is not None:
+                self._spool.append((human_message, bot_message), dom_key)
+            else:
+                self._pairs.append((human_message, bot_message))
+                self._dom_keys.append(dom_key)
+            added += 1
+        if self._spool is not None:
+            self._spool.flush()
+        if self._newer is not None:
+            self._newer.flush()
+        return added
+
+    def merge_newer(self):
+        # Rewrites the spool with the newer pairs in front and returns it
+        # reopened; the caller still closes the newer spool
+        if self._newer is None or not len(self._newer):
+            return self._spool
+        self._spool = self._pairs = prepend_to_spool(self._spool, self._newer.iter_keyed())
+        self._newer.close()
+        self._newer = None
+        return self._spool
+
+    def iter_keyed(self, oldest_first=False):
+        # (dom_key, human, bot), newest first unless oldest_first
+        if self._spool is not None:
+            parts = [self._spool.iter_keyed(reverse=oldest_first)]
+            if self._newer is not None:
+                parts.insert(len(parts) if oldest_first else 0, self._newer.iter_keyed(reverse=oldest_first))
+            return itertools.chain(*parts)
+        keyed = zip(self._dom_keys, (human for human, _ in self._pairs), (bot for _, bot in self._pairs))
+        return reversed(list(keyed)) if oldest_first else keyed
+
+    def iter_newest_first(self):
+        if self._newer is not None:
+            return itertools.chain(self._newer, self._pairs)
+        return iter(self._pairs)
+
+    def iter_messages(self):
+        # Oldest messages first
+        if self._newer is not None:
+            return itertools.chain(reversed(self._pairs), reversed(self._newer))
+        return reversed(self._pairs)
+
+    def messages(self):
+        return list(self.iter_messages())
+
+SEEN_ATTRIBUTE = "data-poe-export-seen"
+UNSEEN_MESSAGE_PAIR_SELECTOR = f"{MESSAGE_PAIR_SELECTOR}:not([{SEEN_ATTRIBUTE}])"
+HUMAN_MESSAGE_SELECTOR = "div.ChatMessage_rightSideMessageWrapper__r0roB div.Message_rightSideMessageBubble__ioa_i > div > p"
+BOT_MESSAGE_SELECTOR = "div.Message_leftSideMessageBubble__VPdk6 > div > p"
+
+WATERMARK_PAIRS_JS = HIDE_PAIRS_JS + """
+const pairs = Array.from(arguments[0]), seenAttribute = arguments[1], prune = arguments[2], prunedAttribute = arguments[3];
+for (const pair of pairs) pair.setAttribute(seenAttribute, '1');
+if (prune) hidePairs(pairs, prunedAttribute);
+"""
+
+def extract_new_message_pairs(driver, prune=False):
+    # Only pairs without the watermark attribute are read, so the cost of a pass
+    # depends on how much new history was loaded rather than on chat length.
+    # With prune, the pairs are hidden in the same call that watermarks them.
+    # A pair with no text yet has not finished rendering; it is left unmarked
+    # and read again on the next pass.
+    message_pairs = driver.find_elements(By.CSS_SELECTOR, UNSEEN_MESSAGE_PAIR_SELECTOR)
+    batch = []
+    harvested = []
+    for pair in message_pairs:
+        try:
+            human_message = ""
+            bot_message = ""
+
+            human_elements = pair.find_elements(By.CSS_SELECTOR, HUMAN_MESSAGE_SELECTOR)
+            bot_elements = pair.find_elements(By.CSS_SELECTOR, BOT_MESSAGE_SELECTOR)
+
+            if human_elements:
+                human_message = human_elements[0].text
+            if bot_elements:
+                bot_message = bot_elements[0].text
+
+            if human_message or bot_message:
+                harvested.append(pair)
+                batch.append((human_message, bot_message))
+        except StaleElementReferenceException:
+            continue
+        except Exception as e:
+            logging.error(f"Error extracting message pair: {str(e)}")
+
+    if harvested:
+        driver.execute_script(WATERMARK_PAIRS_JS, harvested, SEEN_ATTRIBUTE, prune, PRUNED_ATTRIBUTE)
+        if prune:
+            poe_metrics.count('pruned_pairs', len(harvested))
+    return batch
+
+# Reads every unharvested pair in a single browser round trip and watermarks
+# it (hiding it too when pruning), returning [{key, human, bot}, ...] in DOM
+# order. Pairs with no text yet are still rendering and are left for the next
+# pass. key is the id of the pair (or of the first element in it with one) if
+# that id is unique in the page, else null.
+EXTRACT_MESSAGE_PAIRS_JS = HIDE_PAIRS_JS + """
+const pairSelector = arguments[0], humanSelector = arguments[1], botSelector = arguments[2], seenAttribute = arguments[3];
+const prune = arguments[4], prunedAttribute = arguments[5];
+const results = [], harvested = [];
+for (const pair of document.querySelectorAll(pairSelector)) {
+    const human = pair.querySelector(humanSelector);
+    const bot = pair.querySelector(botSelector);
+    const humanText = human ? human.innerText : '', botText = bot ? bot.innerText : '';
+    if (!humanText && !botText) continue;
+    const idHolder = pair.id ? pair : pair.querySelector('[id]');
+    const id = idHolder ? idHolder.id : '';
+    const key = id && document.querySelectorAll('#' + CSS.escape(id)).length === 1 ? id : null;
+    pair.setAttribute(seenAttribute, key || '1');
+    results.push({key: key, human: humanText, bot: botText});
+    harvested.push(pair);
+}
+if (prune) hidePairs(harvested, prunedAttribute);
+return JSON.stringify(results);
+"""
+
+def extract_new_message_pairs_js(driver, prune=False):
+    raw = driver.execute_script(
+        EXTRACT_MESSAGE_PAIRS_JS,
+        UNSEEN_MESSAGE_PAIR_SELECTOR, HUMAN_MESSAGE_SELECTOR, BOT_MESSAGE_SELECTOR, SEEN_ATTRIBUTE,
+        prune, PRUNED_ATTRIBUTE,
+    )
+    items = json.loads(raw or "[]")
+    if prune:
+        poe_metrics.count('pruned_pairs', len(items))
+    return [(item['human'], item['bot'], item['key']) for item in items]
+
+EXTRACTION_MODES = {
+    'script': extract_new_message_pairs_js,
+    'elements': extract_new_message_pairs,
+}
+
+def find_bot_name(driver):
     try:
-        logging.info("Navigating to login page...")
-        driver.get("https://poe.com/login")
-
-        logging.info("Waiting for email input field...")
-        email_input = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='email']"))
-        )
-
-        logging.info("Entering email...")
-        email_input.send_keys(email)
-
-        logging.info("Clicking Go button...")
-        go_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[text()='Go']"))
-        )
-        go_button.click()
-
-        logging.info("Waiting for verification code input...")
-        verification_input = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input.VerificationCodeInput_verificationCodeInput__RgX85"))
-        )
-
-        verification_code = input("Enter the verification code sent to your email: ")
-        verification_input.send_keys(verification_code)
-
-        logging.info("Clicking Log In button...")
-        login_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[contains(@class, 'Button_buttonBase__Bv9Vx') and contains(@class, 'Button_primary__6UIn0') and text()='Log In']"))
-        )
-        login_button.click()
-
-        logging.info("Waiting for login to complete...")
-        time.sleep(5)
-
-        logging.info("Login process completed.")
-    except Exception as e:
-        logging.error(f"An error occurred during login: {str(e)}")
-        raise
+        bot_name_element = driver.find_element(By.CSS_SELECTOR, "div[class*='BotHeader_textContainer'] p")
+        bot_name = bot_name_element.text
+        logging.info(f"Bot name found: {bot_name}")
+    except NoSuchElementException:
+        bot_name = None
+        logging.warning("Bot name not found")
+    return bot_name
+
+def collect_messages_from_network(driver, collector, max_scroll_time=600, scroll_wait_timeout=5, prune=False):
+    captured = capture_chat_messages(driver, max_scroll_time, scroll_wait_timeout, prune=prune)
+    pairs = captured.pairs()
+    added = collector.add_batch(pairs)
+    poe_metrics.count('message_pairs', added)
+    poe_metrics.count('duplicate_pairs', len(pairs) - added)
+    logging.info(f"Rebuilt {added} new message pairs from {len(captured)} captured messages")
+    collector.complete = captured.reached_start
+    return find_bot_name(driver)
+
+def collect_messages(driver, collector, max_scroll_time=600, extraction=None, scroll_wait_timeout=5, stop_at_keys=None,
+                     prune=None):
+    # Scrolls up through the chat feeding newly loaded pairs into collector and
+    # returns the bot name. With stop_at_keys (the pairs of an earlier export),
+    # scrolling stops as soon as one of them comes into view. prune (default:
+    # LOW_MEMORY) hides pairs in the page once they have been read.
+    extraction = extraction or EXTRACTION
+    prune = LOW_MEMORY if prune is None else prune
+    if extraction == 'network':
+        # The whole history is rebuilt from the API, so a delta run simply
+        # filters out the pairs it already has
+        return collect_messages_from_network(driver, collector, max_scroll_time, scroll_wait_timeout, prune)
 
-def scroll_and_collect_messages(driver, max_scroll_time=600):
     logging.info("Scrolling and collecting messages...")
     start_time = time.time()
-    messages = []
-    last_message_count = 0
-    scroll_pause_time = 2
+    extract_pairs = EXTRACTION_MODES[extraction]
     no_new_messages_count = 0
     max_no_new_messages = 5  # After this many scrolls with no new messages, we'll stop
 
-    scroll_container_js_path = """document.querySelector("div[class*='ChatMessagesScrollWrapper']")"""
-
     while time.time() - start_time < max_scroll_time:
-        # Scroll to top
-        driver.execute_script(f"arguments[0].scrollTop = 0;", driver.execute_script(f"return {scroll_container_js_path}"))
-        time.sleep(scroll_pause_time)
-
-        # Find all message pairs
-        message_pairs = driver.find_elements(By.CSS_SELECTOR, "div[class*='ChatMessagesView_messagePair']")
+        # Scroll to the top and into the paging trigger, then wait until the
+        # newly loaded history has rendered (or the timeout passes)
+        scroll_result = scroll_up_and_wait(driver, timeout=scroll_wait_timeout)
+
+        with poe_metrics.phase('extraction'):
+            batch = extract_pairs(driver, prune)
+            added = collector.add_batch(batch)
+        poe_metrics.count('message_pairs', added)
+        poe_metrics.count('duplicate_pairs', len(batch) - added)
+        if added:
+            logging.info(f"Found {added} new message pairs ({len(collector)} total)")
+
+        if stop_at_keys and any(MessageCollector.seen_in(stop_at_keys, item) for item in batch):
+            logging.info("Reached messages saved by an earlier export. Stopping scroll.")
+            collector.complete = True
+            break
 
-        new_messages_found = False
-        for pair in message_pairs:
-            try:
-                human_message = ""
-                bot_message = ""
-
-                human_elements = pair.find_elements(By.CSS_SELECTOR, "div.ChatMessage_rightSideMessageWrapper__r0roB div.Message_rightSideMessageBubble__ioa_i > div > p")
-                bot_elements = pair.find_elements(By.CSS_SELECTOR, "div.Message_leftSideMessageBubble__VPdk6 > div > p")
-
-                if human_elements:
-                    human_message = human_elements[0].text
-                if bot_elements:
-                    bot_message = bot_elements[0].text
-
-                # If either message is non-empty, add the pair
-                if human_message or bot_message:
-                    if (human_message, bot_message) not in messages:
-                        messages.append((human_message, bot_message))
-                        new_messages_found = True
-                        logging.info(f"New message pair found. Human: {human_message[:50]}... Bot: {bot_message[:50]}...")
-            except Exception as e:
-                logging.error(f"Error extracting message pair: {str(e)}")
-
-        if new_messages_found:
+        # Progress is anything newly loaded, even if already collected: a
+        # resumed run scrolls back through the pairs it has before reaching
+        # new ones
+        if batch:
             no_new_messages_count = 0
         else:
             no_new_messages_count += 1
@@ -113,105 +334,300 @@ def scroll_and_collect_messages(driver, max_scroll_time=600):
 
         if no_new_messages_count >= max_no_new_messages:
             logging.info("Reached the top of the chat or no new messages. Stopping scroll.")
+            collector.complete = True
             break
 
-        # If no new messages, try to scroll more
-        try:
-            trigger = driver.find_element(By.CSS_SELECTOR, "div[class*='InfiniteScroll_pagingTrigger']")
-            driver.execute_script("arguments[0].scrollIntoView(true);", trigger)
-        except NoSuchElementException:
+        if not scroll_result['trigger']:
             logging.info("Infinite scroll trigger not found. Might have reached the top.")
+            collector.complete = True
             break
 
     logging.info(f"Scrolling completed in {time.time() - start_time:.2f} seconds")
-
-    # Extract bot name
-    try:
-        bot_name_element = driver.find_element(By.CSS_SELECTOR, "div[class*='BotHeader_textContainer'] p")
-        bot_name = bot_name_element.text
-        logging.info(f"Bot name found: {bot_name}")
-    except NoSuchElementException:
-        bot_name = None
-        logging.warning("Bot name not found")
-
-    return messages[::-1], bot_name  # Reverse the list to get oldest messages first
-
-def format_and_save_messages(messages, save_dir, chat_url, bot_name):
+    return find_bot_name(driver)
+
+def scroll_and_collect_messages(driver, max_scroll_time=600, collector=None, extraction=None, scroll_wait_timeout=5, stop_at_keys=None):
+    collector = collector if collector is not None else MessageCollector()
+    bot_name = collect_messages(driver, collector, max_scroll_time, extraction, scroll_wait_timeout, stop_at_keys)
+    return collector.messages(), bot_name
+
+def format_and_save_messages(messages, save_dir, chat_url, bot_name, output_format='text', complete=True):
+    # messages may be any iterable of (human, bot) pairs, oldest first; it is
+    # written out as it is consumed. With ARCHIVE the pairs are archived and
+    # output_format only applies when they are read back.
+    if ARCHIVE:
+        with poe_metrics.phase('write'):
+            transcript_id = get_archive(ARCHIVE).add_transcript(chat_url, bot_name, messages, complete)
+        return f"{ARCHIVE} (transcript {transcript_id})"
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     url_part = urlparse(chat_url).path.split('/')[-1][:20]
-    filename = f"poe_chat_{url_part}_{timestamp}.txt"
-    filepath = os.path.join(save_dir, filename)
-
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(f"Poe Chat Transcript\n")
-        f.write(f"URL: {chat_url}\n")
-        f.write(f"Bot Name: {bot_name or 'Unknown'}\n")
-        f.write(f"Downloaded on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-        f.write("=" * 80 + "\n\n")
-        for i, (human, bot) in enumerate(messages, 1):
-            f.write(f"Message Pair {i}:\n")
-            if human:
-                f.write("Human: " + human.strip() + "\n\n")
-            if bot:
-                f.write(f"{bot_name or 'Bot'}: " + bot.strip() + "\n\n")
-            if not human and not bot:
-                f.write("(Empty message pair)\n\n")
-            f.write("-" * 80 + "\n\n")
+    with poe_metrics.phase('write'):
+        filepath = write_transcript(messages, os.path.join(save_dir, f"poe_chat_{url_part}_{timestamp}"), chat_url, bot_name, output_format)
     logging.info(f"Messages saved to {filepath}")
     return filepath
 
-def save_poe_chat_text(url, save_dir):
-    email = os.getenv('POE_EMAIL')
-    if not email:
-        raise ValueError("POE_EMAIL environment variable is not set")
+def chat_state_path(save_dir, chat_url, suffix):
+    chat_id = re.sub(r'[^A-Za-z0-9_-]', '_', urlparse(chat_url).path.rstrip('/').split('/')[-1]) or 'chat'
+    return os.path.join(save_dir, f".poe_chat_{chat_id}.{suffix}")
 
-    driver = setup_driver()
-    messages = []
-    bot_name = None
+def checkpoint_path(save_dir, chat_url):
+    return chat_state_path(save_dir, chat_url, "checkpoint.json")
 
-    def signal_handler(sig, frame):
-        logging.info("Interrupt received, saving collected messages...")
-        if messages:
-            saved_file = format_and_save_messages(messages, save_dir, url, bot_name)
-            print(f"Partial chat transcript saved to: {saved_file}")
-        driver.quit()
-        sys.exit(0)
+def spool_path(save_dir, chat_url):
+    return chat_state_path(save_dir, chat_url, "pairs.jsonl")
 
-    signal.signal(signal.SIGINT, signal_handler)
+def key_set(save_dir, chat_url, name, keys=()):
+    # In low-memory mode pair keys are indexed in a scratch file next to the spool
+    if LOW_MEMORY:
+        return DiskKeySet(chat_state_path(save_dir, chat_url, f"{name}.sqlite"), keys)
+    return set(keys)
 
+def load_checkpoint(checkpoint_file):
+    if not os.path.exists(checkpoint_file):
+        return None
     try:
-        login_to_poe(driver, email)
+        with open(checkpoint_file, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable checkpoint {checkpoint_file}: {str(e)}")
+        return None
+
+def write_checkpoint(checkpoint_file, chat_url, bot_name, complete, count):
+    # The pairs themselves live in the chat's spool file, which is appended to
+    # after every scroll pass. complete marks a spool that covers the whole
+    # chat and can serve as the base of a delta export.
+    os.makedirs(os.path.dirname(checkpoint_file) or '.', exist_ok=True)
+    temp_file = f"{checkpoint_file}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'url': chat_url,
+            'bot_name': bot_name,
+            'complete': complete,
+            'count': count,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+        }, f, ensure_ascii=False)
+    os.replace(temp_file, checkpoint_file)
+
+def delta_messages(previous, collector, stop_at_keys):
+    # Pairs from the earlier export followed by the ones added since, oldest first
+    yield from reversed(previous)
+    for dom_key, human, bot in collector.iter_keyed(oldest_first=True):
+        if not MessageCollector.seen_in(stop_at_keys, (human, bot, dom_key)):
+            yield human, bot
+
+def prepend_to_spool(spool, newer):
+    # Rewrites spool with newer, (dom_key, human, bot) items newest first, in
+    # front of its pairs (spools are newest first) and returns it reopened
+    merged = TranscriptSpool(f"{spool.path}.merged", fresh=True)
+    for dom_key, human, bot in newer:
+        merged.append((human, bot), dom_key)
+    for dom_key, human, bot in spool.iter_keyed():
+        merged.append((human, bot), dom_key)
+    merged.close()
+    spool.close()
+    os.replace(merged.path, spool.path)
+    return TranscriptSpool(spool.path)
+
+def spool_from_archive(url, pairs_file):
+    # Writes the chat's latest complete archived transcript to pairs_file as
+    # a spool and returns a checkpoint for it, or None if there is none
+    archive = get_archive(ARCHIVE)
+    transcript_id = archive.latest_complete_id(url)
+    if transcript_id is None:
+        return None
+    transcript = archive.transcript(url, transcript_id)
+    spool = TranscriptSpool(pairs_file, fresh=True)
+    for pair in archive.iter_pairs(url, transcript_id, reverse=True):
+        spool.append(pair)
+    spool.close()
+    return {'complete': True, 'bot_name': transcript['bot_name'], 'count': transcript['pair_count']}
+
+def discard_chat_state(save_dir, url):
+    for path in (checkpoint_path(save_dir, url), spool_path(save_dir, url)):
+        if os.path.exists(path):
+            os.remove(path)
+
+def merge_delta_spool(previous, collector, stop_at_keys):
+    # Rewrites the chat's spool with the new pairs in front of the earlier ones
+    # and returns the reopened spool
+    return prepend_to_spool(previous, (
+        (dom_key, human, bot) for dom_key, human, bot in collector.iter_keyed()
+        if not MessageCollector.seen_in(stop_at_keys, (human, bot, dom_key))
+    ))
+
+def export_chat_text(driver, url, save_dir, delta=False, output_format='text'):
+    # Exports one chat with an already logged-in driver and returns the
+    # transcript path. Pairs are spooled to disk as soon as each scroll pass
+    # confirms them, so an interrupted run loses nothing: a partial transcript
+    # is written and the next run resumes from the spool.
+    #
+    # With delta=True and a complete spool from an earlier run, only the
+    # messages added since then are scrolled through and appended to it.
+    #
+    # If scrolling stopped before the top of the chat (or, in a delta run,
+    # before the previously exported messages), the transcript is still
+    # written but IncompleteExportError is raised afterwards.
+    checkpoint_file = checkpoint_path(save_dir, url)
+    pairs_file = spool_path(save_dir, url)
+    checkpoint = load_checkpoint(checkpoint_file)
+    have_spool = checkpoint is not None and os.path.exists(pairs_file)
+    if ARCHIVE and delta and not have_spool:
+        checkpoint = spool_from_archive(url, pairs_file)
+        have_spool = checkpoint is not None
+    previous = None
+    stop_at_keys = None
+    newer = None
+    if have_spool and checkpoint.get('complete') and delta:
+        previous = TranscriptSpool(pairs_file)
+        stop_at_keys = key_set(save_dir, url, 'previous-keys', (
+            key for dom_key, human, bot in previous.iter_keyed() for key in MessageCollector.index_keys(human, bot, dom_key)))
+        spool = TranscriptSpool(f"{pairs_file}.delta", fresh=True)
+        logging.info(f"Delta export: {len(previous)} message pairs already exported")
+    elif have_spool and not checkpoint.get('complete'):
+        spool = TranscriptSpool(pairs_file)
+        # Pairs posted since the interrupted run are gathered separately
+        newer = TranscriptSpool(f"{pairs_file}.newer", fresh=True)
+        logging.info(f"Resuming from checkpoint with {len(spool)} message pairs")
+    else:
+        spool = TranscriptSpool(pairs_file, fresh=True)
+        write_checkpoint(checkpoint_file, url, None, False, 0)
+    index = key_set(save_dir, url, 'keys')
+    collector = MessageCollector(spool, index, newer)
 
+    bot_name = None
+    merged = False
+    incomplete = None
+    try:
         logging.info(f"Navigating to chat URL: {url}")
-        driver.get(url)
-
-        try:
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "div[class*='ChatMessagesView_messagePair']"))
-            )
-            logging.info("Chat messages loaded successfully")
-        except TimeoutException:
-            logging.warning("Timeout waiting for chat messages to load. Proceeding anyway...")
-
-        # Add a longer delay to ensure all messages are loaded
-        time.sleep(10)
+        with poe_metrics.phase('page_load'):
+            driver.get(url)
 
-        messages, bot_name = scroll_and_collect_messages(driver)
-        logging.info(f"Collected {len(messages)} message pairs")
+            try:
+                WebDriverWait(driver, 30).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "div[class*='ChatMessagesView_messagePair']"))
+                )
+                logging.info("Chat messages loaded successfully")
+            except TimeoutException:
+                logging.warning("Timeout waiting for chat messages to load. Proceeding anyway...")
+
+            # Wait for the initial render to settle before collecting
+            wait_for_dom_quiet(driver)
+
+        bot_name = collect_messages(driver, collector, stop_at_keys=stop_at_keys)
+        logging.info(f"Collected {len(collector)} message pairs")
+
+        if previous is None:
+            spool = collector.merge_newer()
+            write_checkpoint(checkpoint_file, url, bot_name, collector.complete, len(collector))
+            messages = collector.iter_messages()
+            if not collector.complete:
+                incomplete = "did not reach the top of the chat"
+        elif collector.complete:
+            # A delta run must not replace the complete spool unless it reached
+            # the previously exported messages
+            bot_name = bot_name or checkpoint.get('bot_name')
+            previous = merge_delta_spool(previous, collector, stop_at_keys)
+            merged = True
+            write_checkpoint(checkpoint_file, url, bot_name, True, len(previous))
+            logging.info(f"Found {len(previous) - checkpoint.get('count', 0)} message pairs added since the last export")
+            messages = reversed(previous)
+        else:
+            bot_name = bot_name or checkpoint.get('bot_name')
+            messages = delta_messages(previous, collector, stop_at_keys)
+            incomplete = "did not reach the previously exported messages, the transcript may have a gap"
 
         os.makedirs(save_dir, exist_ok=True)
-        saved_file = format_and_save_messages(messages, save_dir, url, bot_name)
-        print(f"Chat transcript saved to: {saved_file}")
-
-    except Exception as e:
-        logging.error(f"An error occurred: {str(e)}")
-        if messages:
-            saved_file = format_and_save_messages(messages, save_dir, url, bot_name)
-            print(f"Partial chat transcript saved to: {saved_file}")
+        saved_file = format_and_save_messages(messages, save_dir, url, bot_name, output_format, complete=not incomplete)
+    except BaseException:
+        if previous is None:
+            messages = collector.iter_messages()
+        elif merged:
+            messages = reversed(previous)
+        else:
+            messages = delta_messages(previous, collector, stop_at_keys)
+        save_partial_messages(messages, save_dir, url, bot_name, output_format)
+        raise
     finally:
-        driver.quit()
+        spool.close()
+        if newer is not None:
+            newer.discard()
+        if previous is not None:
+            previous.close()
+            spool.discard()
+        for keys in (index, stop_at_keys):
+            if isinstance(keys, DiskKeySet):
+                keys.discard()
+    if ARCHIVE and (not incomplete or previous is not None):
+        # The archive holds the transcript and is the base of the next delta
+        # run, so no loose copy is kept
+        discard_chat_state(save_dir, url)
+    if incomplete:
+        raise IncompleteExportError(f"Export of {url} {incomplete}; saved what was collected to {saved_file}")
+    return saved_file
+
+def save_partial_messages(messages, save_dir, url, bot_name=None, output_format='text'):
+    messages = iter(messages)
+    first = next(messages, None)
+    if first is None:
+        return None
+    os.makedirs(save_dir, exist_ok=True)
+    saved_file = format_and_save_messages(itertools.chain([first], messages), save_dir, url, bot_name, output_format,
+                                          complete=False)
+    print(f"Partial chat transcript saved to: {saved_file}")
+    return saved_file
+
+def save_poe_chat_text(url, save_dir, delta=False, output_format='text'):
+    # Returns the transcript path, or None if the export did not finish
+    check_output_format(output_format)
+    email = os.getenv('POE_EMAIL')
+    saved_file = None
+
+    with poe_metrics.metrics_run('text') as run:
+        driver = setup_driver()
+
+        try:
+            ensure_logged_in(driver, email)
+            saved_file = export_chat_text(driver, url, save_dir, delta=delta, output_format=output_format)
+            print(f"Chat transcript saved to: {saved_file}")
+        except IncompleteExportError as e:
+            # The next run resumes from the checkpoint
+            logging.warning(str(e))
+            run.mark_failed()
+        except KeyboardInterrupt:
+            # export_chat_text has already written whatever was collected
+            logging.info("Interrupt received, collected messages were saved")
+            run.mark_failed()
+        except Exception as e:
+            logging.error(f"An error occurred: {str(e)}")
+            run.mark_failed()
+        finally:
+            driver.quit()
+    return saved_file
+
+def save_poe_chats_text(urls, save_dir, workers=3, delta=False, output_format='text'):
+    check_output_format(output_format)
+    email = os.getenv('POE_EMAIL')
+    export_chat = functools.partial(export_chat_text, delta=delta, output_format=output_format)
+    with poe_metrics.metrics_run('text') as run:
+        results = export_chats(urls, save_dir, setup_driver, export_chat, email, workers=workers)
+        for url, result in results.items():
+            if isinstance(result, Exception):
+                run.mark_failed()
+            else:
+                print(f"Chat transcript for {url} saved to: {result}")
+    return results
 
 if __name__ == "__main__":
-    poe_chat_url = input("Enter the Poe chat URL: ")
+    poe_chat_urls = parse_chat_urls(input("Enter the Poe chat URL (separate several URLs with spaces): "))
     save_directory = input("Enter the directory to save the transcript (default: PoeChatTranscripts): ") or "PoeChatTranscripts"
-    save_poe_chat_text(poe_chat_url, save_directory)
+    delta_export = input("Only fetch messages added since the last export? (y/N): ").strip().lower() == 'y'
+    while True:
+        transcript_format = input(f"Transcript format ({', '.join(TRANSCRIPT_FORMATS)}; default: text): ").strip() or 'text'
+        if transcript_format in TRANSCRIPT_FORMATS:
+            break
+        print(f"Unknown format: {transcript_format}")
+    if len(poe_chat_urls) > 1:
+        save_poe_chats_text(poe_chat_urls, save_directory, delta=delta_export, output_format=transcript_format)
+    elif poe_chat_urls:
+        save_poe_chat_text(poe_chat_urls[0], save_directory, delta=delta_export, output_format=transcript_format)
+    else:
+        print("No chat URL given")
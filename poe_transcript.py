@@ -0,0 +1,204 @@
+import os
+import json
+import logging
+import sqlite3
+from array import array
+from datetime import datetime
+
+class TranscriptSpool:
+    # Append-only JSONL file of (human, bot) pairs in the order they were
+    # confirmed, each optionally stored with the page's key for the pair.
+    # Only the byte offset of each record is kept in memory, so a chat of any
+    # length can be collected and then replayed in either order. Iterating
+    # yields pairs in append order; reversed() yields them backwards.
+    def __init__(self, path, fresh=False):
+        self.path = path
+        self._offsets = array('q')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'w+b' if fresh else 'a+b')
+        if not fresh:
+            self._index_existing()
+
+    def _index_existing(self):
+        # Rebuild the offsets of a spool left by an earlier run, dropping a
+        # final record that was cut off mid-write
+        self._file.seek(0)
+        offset = 0
+        for line in self._file:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            self._offsets.append(offset)
+            offset += len(line)
+        self._file.truncate(offset)
+        self._file.seek(0, os.SEEK_END)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, pair, key=None):
+        self._file.seek(0, os.SEEK_END)
+        self._offsets.append(self._file.tell())
+        record = [pair[0], pair[1]] + ([key] if key else [])
+        self._file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def flush(self):
+        self._file.flush()
+
+    def _read_record(self, offset):
+        self._file.seek(offset)
+        return json.loads(self._file.readline())
+
+    def _read_at(self, offset):
+        return tuple(self._read_record(offset)[:2])
+
+    def iter_keyed(self, reverse=False):
+        # (key, human, bot) in append order, or backwards with reverse; key
+        # is None for pairs stored without one
+        self.flush()
+        indexes = range(len(self._offsets) - 1, -1, -1) if reverse else range(len(self._offsets))
+        for i in indexes:
+            record = self._read_record(self._offsets[i])
+            yield (record[2] if len(record) > 2 else None), record[0], record[1]
+
+    def __iter__(self):
+        self.flush()
+        for i in range(len(self._offsets)):
+            yield self._read_at(self._offsets[i])
+
+    def __reversed__(self):
+        self.flush()
+        for i in range(len(self._offsets) - 1, -1, -1):
+            yield self._read_at(self._offsets[i])
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class DiskKeySet:
+    # Set of string keys kept in a scratch SQLite file instead of memory, for
+    # indexes that would otherwise grow with the length of the chat. The file
+    # is recreated on open; remove it with discard() when done.
+    def __init__(self, path, keys=()):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute("CREATE TABLE keys (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._count = 0
+        self.update(keys)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self._conn.execute("SELECT 1 FROM keys WHERE key = ?", (key,)).fetchone() is not None
+
+    def add(self, key):
+        self._count += self._conn.execute("INSERT OR IGNORE INTO keys (key) VALUES (?)", (key,)).rowcount
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class TextTranscriptWriter:
+    extension = '.txt'
+
+    def write_header(self, f, chat_url, bot_name, downloaded_on):
+        f.write(f"Poe Chat Transcript\n")
+        f.write(f"URL: {chat_url}\n")
+        f.write(f"Bot Name: {bot_name or 'Unknown'}\n")
+        f.write(f"Downloaded on: {downloaded_on}\n\n")
+        f.write("=" * 80 + "\n\n")
+
+    def write_pair(self, f, index, human, bot, bot_name):
+        f.write(f"Message Pair {index}:\n")
+        if human:
+            f.write("Human: " + human.strip() + "\n\n")
+        if bot:
+            f.write(f"{bot_name or 'Bot'}: " + bot.strip() + "\n\n")
+        if not human and not bot:
+            f.write("(Empty message pair)\n\n")
+        f.write("-" * 80 + "\n\n")
+
+class MarkdownTranscriptWriter:
+    extension = '.md'
+
+    def write_header(self, f, chat_url, bot_name, downloaded_on):
+        f.write("# Poe Chat Transcript\n\n")
+        f.write(f"- **URL:** {chat_url}\n")
+        f.write(f"- **Bot Name:** {bot_name or 'Unknown'}\n")
+        f.write(f"- **Downloaded on:** {downloaded_on}\n\n")
+
+    def write_pair(self, f, index, human, bot, bot_name):
+        f.write(f"## Message Pair {index}\n\n")
+        if human:
+            f.write("**Human:**\n\n" + human.strip() + "\n\n")
+        if bot:
+            f.write(f"**{bot_name or 'Bot'}:**\n\n" + bot.strip() + "\n\n")
+        if not human and not bot:
+            f.write("_(Empty message pair)_\n\n")
+        f.write("---\n\n")
+
+class JsonlTranscriptWriter:
+    # One JSON object per line: a header record followed by one record per pair
+    extension = '.jsonl'
+
+    def write_header(self, f, chat_url, bot_name, downloaded_on):
+        f.write(json.dumps({'type': 'header', 'url': chat_url, 'bot_name': bot_name, 'downloaded_on': downloaded_on}, ensure_ascii=False) + "\n")
+
+    def write_pair(self, f, index, human, bot, bot_name):
+        f.write(json.dumps({'type': 'pair', 'index': index, 'human': human, 'bot': bot}, ensure_ascii=False) + "\n")
+
+TRANSCRIPT_FORMATS = {
+    'text': TextTranscriptWriter,
+    'markdown': MarkdownTranscriptWriter,
+    'jsonl': JsonlTranscriptWriter,
+}
+
+def check_output_format(output_format):
+    # Called before a chat is scrolled, so a typo fails before any work is done
+    if output_format not in TRANSCRIPT_FORMATS:
+        raise ValueError(f"Unknown transcript format {output_format!r}; choose one of {', '.join(TRANSCRIPT_FORMATS)}")
+
+def render_transcript(f, messages, chat_url, bot_name, output_format='text', downloaded_on=None):
+    # Writes an iterable of (human, bot) pairs, oldest first, to an open text
+    # file without holding them all in memory. Returns the number of pairs.
+    writer = TRANSCRIPT_FORMATS[output_format]()
+    writer.write_header(f, chat_url, bot_name, downloaded_on or datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    count = 0
+    for count, (human, bot) in enumerate(messages, 1):
+        writer.write_pair(f, count, human, bot, bot_name)
+    return count
+
+def write_transcript(messages, filepath_base, chat_url, bot_name, output_format='text'):
+    # Renders the pairs into a file; the format's extension is added to
+    # filepath_base
+    filepath = filepath_base + TRANSCRIPT_FORMATS[output_format].extension
+    temp_path = f"{filepath}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        count = render_transcript(f, messages, chat_url, bot_name, output_format)
+    os.replace(temp_path, filepath)
+    logging.debug(f"Wrote {count} message pairs as {output_format}")
+    return filepath
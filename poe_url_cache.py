@@ -0,0 +1,100 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Persistent per-URL record of every image downloaded into a store: its
+# validators (ETag, Last-Modified), size and content digest. On a rerun a
+# known URL whose content is still in the store is either revalidated with a
+# conditional request, which costs a 304 with no body when nothing changed,
+# or in 'trust' mode not requested at all. 'off' always downloads in full.
+CACHE_MODES = ('revalidate', 'trust', 'off')
+CACHE_MODE = os.getenv('POE_IMAGE_CACHE', 'revalidate')
+# Seconds an entry is trusted after the server last confirmed it; older
+# entries are revalidated even in 'trust' mode
+MAX_AGE = float(os.getenv('POE_IMAGE_CACHE_MAX_AGE', 7 * 24 * 3600))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS url_cache (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER,
+    digest TEXT NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+CacheEntry = namedtuple('CacheEntry', ['url', 'etag', 'last_modified', 'size', 'digest', 'checked_at'])
+
+class UrlCache:
+    # Safe to share between download threads; every write is committed at once
+    # so an interrupted run keeps what it learned
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM url_cache").fetchone()[0]
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, etag, last_modified, size, digest, checked_at FROM url_cache WHERE url = ?", (url,)).fetchone()
+        return CacheEntry(*row) if row else None
+
+    def put(self, url, etag, last_modified, size, digest):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO url_cache (url, etag, last_modified, size, digest, checked_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, size, digest, time.time()),
+            )
+
+    def touch(self, url):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE url_cache SET checked_at = ? WHERE url = ?", (time.time(), url))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def cached_entry(store, url):
+    # The cache entry for url, if caching is on and the content it names is
+    # still in the store
+    if CACHE_MODE == 'off':
+        return None
+    entry = store.url_cache.get(url)
+    if entry is None or entry.digest not in store:
+        return None
+    return entry
+
+def is_trusted(entry, now=None):
+    # True if entry can be used without asking the server at all
+    if CACHE_MODE != 'trust' or entry is None:
+        return False
+    return (now if now is not None else time.time()) - entry.checked_at < MAX_AGE
+
+def conditional_headers(entry):
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+def record_download(store, url, headers, size, digest):
+    if CACHE_MODE != 'off':
+        store.url_cache.put(url, headers.get('ETag'), headers.get('Last-Modified'), size, digest)
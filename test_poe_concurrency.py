@@ -0,0 +1,80 @@
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from poe_concurrency import AimdController, backoff_delay, parse_retry_after
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after('-5') == 0.0
+
+def test_parse_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 30
+
+def test_parse_retry_after_missing_or_invalid():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('') is None
+    assert parse_retry_after('soon') is None
+
+def test_backoff_delay_is_capped():
+    for attempt in range(1, 20):
+        delay = backoff_delay(attempt, base_delay=0.5, max_delay=4.0)
+        assert 0 <= delay <= min(4.0, 0.5 * 2 ** (attempt - 1))
+
+def finish(controller, outcome, latency=0.01, retry_after=None):
+    token = controller._start(time.monotonic())
+    controller._finish(token, outcome, latency, retry_after)
+
+def test_slow_start_grows_by_one_per_success_up_to_the_maximum():
+    controller = AimdController(initial=2, maximum=5)
+    for _ in range(10):
+        finish(controller, 'ok')
+    assert controller.current_limit == 5
+    assert controller.peak == 5
+
+def test_throttling_halves_the_limit_and_ends_slow_start():
+    controller = AimdController(initial=8)
+    finish(controller, 'throttled')
+    assert controller.current_limit == 4
+    assert not controller.slow_start
+    # After slow start it takes about a limit's worth of successes to add one
+    for _ in range(4):
+        finish(controller, 'ok')
+    assert controller.current_limit == 4
+    finish(controller, 'ok')
+    assert controller.current_limit == 5
+
+def test_requests_started_before_a_decrease_do_not_decrease_again():
+    controller = AimdController(initial=8)
+    now = time.monotonic()
+    tokens = [controller._start(now) for _ in range(3)]
+    for token in tokens:
+        controller._finish(token, 'error')
+    assert controller.current_limit == 4
+
+def test_limit_never_drops_below_the_minimum():
+    controller = AimdController(initial=2, minimum=1)
+    for _ in range(5):
+        finish(controller, 'error')
+    assert controller.current_limit == 1
+
+def test_retry_after_pauses_new_downloads():
+    controller = AimdController(initial=4)
+    finish(controller, 'throttled', retry_after=30)
+    wait = controller._wait_time(time.monotonic())
+    assert 29 < wait <= 30
+
+def test_slow_responses_count_as_congestion():
+    controller = AimdController(initial=8)
+    finish(controller, 'ok', latency=0.01)
+    for _ in range(20):
+        finish(controller, 'ok', latency=1.0)
+    assert not controller.slow_start
+    assert controller.current_limit < controller.peak
+
+def test_wait_time_when_the_limit_is_full():
+    controller = AimdController(initial=1)
+    now = time.monotonic()
+    assert controller._wait_time(now) == 0
+    controller._start(now)
+    assert controller._wait_time(now) is None
@@ -0,0 +1,51 @@
+from datetime import datetime
+import pytest
+from poe_earnings_store import open_store, parse_count, parse_number, record_snapshot, run_deltas
+
+@pytest.mark.parametrize('value, expected', [
+    ("$1,234.56", 1234.56),
+    ("-$5.00", -5.0),
+    ("−$5.00", -5.0),
+    ("$-5.00", -5.0),
+    ("12.3K", 12300.0),
+    ("2m", 2e6),
+    ("95%", 95.0),
+    ("-", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_number(value, expected):
+    number = parse_number(value)
+    if expected is None:
+        assert number is None
+    else:
+        assert number == pytest.approx(expected)
+
+def test_parse_count_rounds():
+    assert parse_count("1.5K") == 1500
+    assert parse_count("n/a") is None
+
+def test_run_deltas_between_snapshots():
+    conn = open_store(':memory:')
+    record_snapshot(conn, [("Bot", "$1.00", "10", "2", "1", "50%")], datetime(2024, 1, 1))
+    record_snapshot(conn, [("Bot", "$3.50", "15", "2", "4", "60%")], datetime(2024, 1, 2))
+    delta = dict(run_deltas(conn)[0])
+    assert delta['earnings_delta'] == pytest.approx(2.5)
+    assert delta['messages_delta'] == 5
+    assert delta['followers_delta'] == 3
+
+def test_snapshot_with_duplicate_bot_names_is_refused():
+    conn = open_store(':memory:')
+    with pytest.raises(ValueError, match="Bot"):
+        record_snapshot(conn, [("Bot", "$1", "1", "1", "1", "1%"), ("Bot", "$2", "2", "2", "2", "2%")])
+    assert conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 0
+
+def test_run_deltas_compares_with_the_neighbouring_run():
+    conn = open_store(':memory:')
+    for day, earnings in ((1, "$1"), (2, "$3"), (3, "$6")):
+        record_snapshot(conn, [("Bot", earnings, "1", "1", "1", "1%")], datetime(2024, 1, day))
+    assert run_deltas(conn)[0]['earnings_delta'] == pytest.approx(3)
+    assert run_deltas(conn, run_id=2)[0]['earnings_delta'] == pytest.approx(2)
+    assert run_deltas(conn, previous_run_id=1)[0]['earnings_delta'] == pytest.approx(2)
+    assert run_deltas(conn, run_id=1) == []
+    assert run_deltas(conn, previous_run_id=3) == []
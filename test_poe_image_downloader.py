@@ -0,0 +1,78 @@
+import os
+import sys
+import pytest
+import poe_image_downloader
+import poe_url_cache
+from poe_image_downloader import DownloadPipeline
+from poe_image_store import get_image_store
+from poe_network import NetworkMessageCollector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+from fake_poe import FakePoeSite
+
+@pytest.fixture
+def site():
+    with FakePoeSite(images=30, image_bytes=2048, duplicate_rate=0.2) as site:
+        yield site
+
+def create_pipeline(engine, store):
+    if engine == 'asyncio':
+        pytest.importorskip('aiohttp')
+        from poe_async_downloader import AsyncDownloadPipeline
+        return AsyncDownloadPipeline(store, workers=8)
+    return DownloadPipeline(store, workers=8)
+
+def run_pipeline(engine, store, urls):
+    with create_pipeline(engine, store) as pipeline:
+        pipeline.submit(urls)
+    return pipeline.results
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_pipeline_downloads_each_image_once_and_revalidates_reruns(engine, site, tmp_path, monkeypatch):
+    monkeypatch.setattr(poe_url_cache, 'CACHE_MODE', 'revalidate')
+    store = get_image_store(str(tmp_path / engine))
+    urls = [site.image_url(i) for i in range(site.images)]
+
+    results = run_pipeline(engine, store, urls)
+    assert sorted(result.url for result in results) == sorted(urls)
+    assert all(result.digest for result in results)
+    assert sum(result.stored for result in results) == site.unique_image_count()
+    assert len(store) == site.unique_image_count()
+
+    site.reset_stats()
+    results = run_pipeline(engine, store, urls)
+    assert not any(result.stored for result in results)
+    assert site.stats['image_not_modified'] == site.images
+
+def test_pipeline_retries_throttled_downloads(tmp_path):
+    with FakePoeSite(images=10, image_bytes=1024, image_latency=0.05, image_max_concurrency=2) as site:
+        store = get_image_store(str(tmp_path))
+        results = run_pipeline('threads', store, [site.image_url(i) for i in range(site.images)])
+        assert all(result.digest for result in results)
+        assert site.stats['image_throttled'] > 0
+
+def test_scrolling_reports_whether_it_reached_the_top(monkeypatch):
+    passes = iter([(['http://img/1.png'], 1), ([], 1), ([], 0)])
+    monkeypatch.setattr(poe_image_downloader, 'scroll_up_and_wait', lambda driver, timeout: {'trigger': False})
+    monkeypatch.setattr(poe_image_downloader, 'discover_new_image_urls', lambda driver, prune: next(passes))
+    assert poe_image_downloader.scroll_and_collect_images(None, prune=False) == (['http://img/1.png'], True)
+    assert poe_image_downloader.scroll_and_collect_images(None, max_scroll_time=0, prune=False) == ([], False)
+
+def test_network_discovery_reports_an_incomplete_capture(monkeypatch):
+    def capture(driver, max_scroll_time, scroll_wait_timeout, on_new_messages, prune):
+        on_new_messages([{'text': "see http://img/1.png"}])
+        captured = NetworkMessageCollector()
+        captured.reached_start = False
+        return captured
+    monkeypatch.setattr(poe_image_downloader, 'capture_chat_messages', capture)
+    assert poe_image_downloader.collect_images_from_network(None, prune=False) == (['http://img/1.png'], False)
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_pipeline_reports_attempts_and_errors(engine, site, tmp_path, monkeypatch):
+    monkeypatch.setattr(poe_url_cache, 'CACHE_MODE', 'off')
+    store = get_image_store(str(tmp_path))
+    results = run_pipeline(engine, store, [site.image_url(0), site.image_url(site.images)])
+    by_url = {result.url: result for result in results}
+    assert by_url[site.image_url(0)].attempts == 1
+    assert by_url[site.image_url(0)].error is None
+    assert by_url[site.image_url(site.images)].error == "HTTP 404"
@@ -0,0 +1,23 @@
+from poe_sync import changed_chats, load_sync_index, write_sync_index
+
+def test_changed_chats_picks_new_and_changed_chats():
+    index = {'chats': {'a': {'marker': '1'}, 'b': {'marker': '2'}}}
+    chats = {'a': '1', 'b': '3', 'c': '1'}
+    assert changed_chats(chats, index) == ['b', 'c']
+
+def test_changed_chats_treats_an_empty_marker_as_changed():
+    index = {'chats': {'a': {'marker': ''}}}
+    assert changed_chats({'a': ''}, index) == ['a']
+
+def test_changed_chats_full_returns_every_chat():
+    index = {'chats': {'a': {'marker': '1'}}}
+    assert changed_chats({'a': '1', 'b': '2'}, index, full=True) == ['a', 'b']
+
+def test_sync_index_round_trip(tmp_path):
+    assert load_sync_index(tmp_path) == {'chats': {}}
+    write_sync_index(tmp_path, {'chats': {'a': {'marker': '1'}}})
+    assert load_sync_index(tmp_path)['chats'] == {'a': {'marker': '1'}}
+
+def test_unreadable_sync_index_is_ignored(tmp_path):
+    (tmp_path / '.poe_sync_index.json').write_text('{not json', encoding='utf-8')
+    assert load_sync_index(tmp_path) == {'chats': {}}
@@ -0,0 +1,157 @@
+import pytest
+import poe_text_downloader
+from poe_archive import get_archive
+from poe_network import NetworkMessageCollector
+from poe_transcript import TranscriptSpool
+from poe_text_downloader import MessageCollector, delta_messages, merge_delta_spool
+
+def pairs(*numbers):
+    return [(f"h{n}", f"b{n}") for n in numbers]
+
+def spool_of(path, newest_first):
+    spool = TranscriptSpool(str(path), fresh=True)
+    for pair in newest_first:
+        spool.append(pair)
+    spool.flush()
+    return spool
+
+def stop_keys(spool):
+    keys = set()
+    for dom_key, human, bot in spool.iter_keyed():
+        keys.update(MessageCollector.index_keys(human, bot, dom_key))
+    return keys
+
+def test_collector_keeps_identical_exchanges_with_different_ids():
+    collector = MessageCollector()
+    collector.add_batch([("ok", "Sure!", "m1"), ("ok", "Sure!", "m2"), ("ok", "Sure!", "m2")])
+    assert collector.messages() == [("ok", "Sure!"), ("ok", "Sure!")]
+
+def test_collector_orders_batches_oldest_first():
+    collector = MessageCollector()
+    collector.add_batch(pairs(3, 4))
+    collector.add_batch(pairs(1, 2, 3))
+    assert collector.messages() == pairs(1, 2, 3, 4)
+
+def test_resumed_collector_puts_pairs_posted_since_at_the_newest_end(tmp_path):
+    spool = spool_of(tmp_path / 'pairs.jsonl', pairs(4, 3))
+    newer = TranscriptSpool(str(tmp_path / 'pairs.jsonl.newer'), fresh=True)
+    collector = MessageCollector(spool=spool, newer=newer)
+    # The page opens at the bottom: two new pairs, then the ones already
+    # collected, then older history
+    collector.add_batch(pairs(3, 4, 5, 6))
+    collector.add_batch(pairs(1, 2))
+    assert collector.messages() == pairs(1, 2, 3, 4, 5, 6)
+    merged = collector.merge_newer()
+    newer.close()
+    assert list(reversed(merged)) == pairs(1, 2, 3, 4, 5, 6)
+    merged.close()
+
+def test_merge_delta_spool_adds_new_pairs_in_front(tmp_path):
+    previous = spool_of(tmp_path / 'pairs.jsonl', pairs(3, 2, 1))
+    keys = stop_keys(previous)
+    collector = MessageCollector(spool=spool_of(tmp_path / 'delta.jsonl', []))
+    collector.add_batch(pairs(3, 4, 5))
+    assert list(delta_messages(previous, collector, keys)) == pairs(1, 2, 3, 4, 5)
+    merged = merge_delta_spool(previous, collector, keys)
+    assert list(reversed(merged)) == pairs(1, 2, 3, 4, 5)
+    merged.close()
+
+def test_merge_delta_spool_keeps_page_ids(tmp_path):
+    previous = spool_of(tmp_path / 'pairs.jsonl', pairs(1))
+    collector = MessageCollector(spool=spool_of(tmp_path / 'delta.jsonl', []))
+    collector.add_batch([("h2", "b2", "m2")])
+    merged = merge_delta_spool(previous, collector, stop_keys(previous))
+    assert list(merged.iter_keyed()) == [("m2", "h2", "b2"), (None, "h1", "b1")]
+    merged.close()
+
+def test_pairs_with_ids_match_earlier_pairs_stored_without(tmp_path):
+    # A spool written by network or elements extraction, or before pairs had
+    # ids, followed by a script extraction delta run
+    previous = spool_of(tmp_path / 'pairs.jsonl', pairs(2, 1))
+    keys = stop_keys(previous)
+    batch = [("h1", "b1", "m1"), ("h2", "b2", "m2"), ("h3", "b3", "m3")]
+    assert any(MessageCollector.seen_in(keys, item) for item in batch)
+    collector = MessageCollector(spool=spool_of(tmp_path / 'delta.jsonl', []))
+    collector.add_batch(batch)
+    assert list(delta_messages(previous, collector, keys)) == pairs(1, 2, 3)
+    merged = merge_delta_spool(previous, collector, keys)
+    assert list(reversed(merged)) == pairs(1, 2, 3)
+    merged.close()
+
+def test_text_of_a_pair_with_an_id_does_not_match_another_id(tmp_path):
+    previous = spool_of(tmp_path / 'pairs.jsonl', [])
+    previous.append(("ok", "Sure!"), "m1")
+    keys = stop_keys(previous)
+    assert MessageCollector.seen_in(keys, ("ok", "Sure!", "m1"))
+    assert MessageCollector.seen_in(keys, ("ok", "Sure!"))
+    assert not MessageCollector.seen_in(keys, ("ok", "Sure!", "m2"))
+    previous.close()
+
+def test_network_pairs_keep_identical_exchanges():
+    captured = NetworkMessageCollector()
+    captured.add_payload({'messages': [
+        {'messageId': i, 'author': 'human' if i % 2 else 'bot', 'text': "ok" if i % 2 else "Sure!", 'creationTime': i}
+        for i in range(1, 5)
+    ]})
+    collector = MessageCollector()
+    assert collector.add_batch(captured.pairs()) == 2
+    assert collector.messages() == [("ok", "Sure!"), ("ok", "Sure!")]
+
+def test_page_ids_match_pairs_stored_with_message_ids(tmp_path):
+    # A chat first exported with network extraction, then synced with script
+    # extraction
+    previous = spool_of(tmp_path / 'pairs.jsonl', [])
+    previous.append(("h1", "b1"), "api:1")
+    keys = stop_keys(previous)
+    assert MessageCollector.seen_in(keys, ("h1", "b1", "message-pair-1"))
+    assert not MessageCollector.seen_in(keys, ("h1", "b1", "api:3"))
+    previous.close()
+
+class FakeDriver:
+    def get(self, url):
+        pass
+
+class FakeWait:
+    def __init__(self, driver, timeout):
+        pass
+
+    def until(self, condition):
+        return True
+
+def fake_collect(batches):
+    batches = iter(batches)
+
+    def collect_messages(driver, collector, stop_at_keys=None):
+        collector.add_batch(next(batches))
+        collector.complete = True
+        return "Bot"
+    return collect_messages
+
+def test_archived_exports_keep_no_loose_state(tmp_path, monkeypatch):
+    archive_path = str(tmp_path / 'archive.sqlite')
+    save_dir = tmp_path / 'out'
+    monkeypatch.setattr(poe_text_downloader, 'ARCHIVE', archive_path)
+    monkeypatch.setattr(poe_text_downloader, 'WebDriverWait', FakeWait)
+    monkeypatch.setattr(poe_text_downloader, 'wait_for_dom_quiet', lambda driver: None)
+    monkeypatch.setattr(poe_text_downloader, 'collect_messages', fake_collect([
+        [("h1", "b1", "m1"), ("h2", "b2", "m2")],
+        [("h2", "b2", "m2"), ("h3", "b3", "m3")],
+    ]))
+    driver = FakeDriver()
+    url = "https://poe.com/chat/abc"
+
+    poe_text_downloader.export_chat_text(driver, url, str(save_dir))
+    assert list(save_dir.iterdir()) == []
+    # The delta run finds its base in the archive
+    poe_text_downloader.export_chat_text(driver, url, str(save_dir), delta=True)
+    assert list(save_dir.iterdir()) == []
+    assert list(get_archive(archive_path).iter_pairs(url)) == pairs(1, 2, 3)
+
+def test_unknown_format_fails_before_the_browser_starts(monkeypatch):
+    def setup_driver():
+        raise AssertionError("the browser was started")
+    monkeypatch.setattr(poe_text_downloader, 'setup_driver', setup_driver)
+    with pytest.raises(ValueError, match="markdwon"):
+        poe_text_downloader.save_poe_chat_text("https://poe.com/chat/abc", "out", output_format='markdwon')
+    with pytest.raises(ValueError):
+        poe_text_downloader.save_poe_chats_text(["https://poe.com/chat/abc"], "out", output_format='markdwon')
@@ -0,0 +1,55 @@
+import time
+import poe_url_cache
+from poe_image_store import get_image_store
+from poe_url_cache import CacheEntry, UrlCache, conditional_headers
+
+def entry(etag=None, last_modified=None, checked_at=None):
+    return CacheEntry('http://img/1.png', etag, last_modified, 10, 'abc', checked_at or time.time())
+
+def test_conditional_headers():
+    assert conditional_headers(None) == {}
+    assert conditional_headers(entry()) == {}
+    assert conditional_headers(entry(etag='"x"', last_modified='Mon, 01 Jan 2024 00:00:00 GMT')) == {
+        'If-None-Match': '"x"',
+        'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT',
+    }
+
+def test_put_get_and_touch(tmp_path):
+    cache = UrlCache(str(tmp_path / 'cache.sqlite'))
+    cache.put('u', '"x"', None, 10, 'abc')
+    first = cache.get('u')
+    assert (first.etag, first.size, first.digest) == ('"x"', 10, 'abc')
+    cache.touch('u')
+    assert cache.get('u').checked_at >= first.checked_at
+    assert cache.get('missing') is None
+    cache.close()
+
+def test_trust_expires_after_the_max_age(monkeypatch):
+    monkeypatch.setattr(poe_url_cache, 'CACHE_MODE', 'trust')
+    monkeypatch.setattr(poe_url_cache, 'MAX_AGE', 60)
+    now = time.time()
+    assert poe_url_cache.is_trusted(entry(checked_at=now - 30), now)
+    assert not poe_url_cache.is_trusted(entry(checked_at=now - 90), now)
+    assert not poe_url_cache.is_trusted(None, now)
+    monkeypatch.setattr(poe_url_cache, 'CACHE_MODE', 'revalidate')
+    assert not poe_url_cache.is_trusted(entry(checked_at=now), now)
+
+def test_entries_whose_image_is_gone_are_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(poe_url_cache, 'CACHE_MODE', 'revalidate')
+    stored, missing = 'a' * 32, 'b' * 32
+    (tmp_path / f"{stored}.png").write_bytes(b'png')
+    store = get_image_store(str(tmp_path))
+    poe_url_cache.record_download(store, 'u', {'ETag': '"x"'}, 3, stored)
+    poe_url_cache.record_download(store, 'v', {'ETag': '"y"'}, 3, missing)
+    assert poe_url_cache.cached_entry(store, 'u').etag == '"x"'
+    assert poe_url_cache.cached_entry(store, 'v') is None
+    monkeypatch.setattr(poe_url_cache, 'CACHE_MODE', 'off')
+    assert poe_url_cache.cached_entry(store, 'u') is None
+
+def test_cache_is_kept_out_of_the_image_directory(tmp_path):
+    old = tmp_path / '.poe_url_cache.sqlite'
+    UrlCache(str(old)).close()
+    store = get_image_store(str(tmp_path))
+    store.url_cache.put('u', None, None, 1, 'abc')
+    assert not old.exists()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['.poe_state']